@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Benchmarks of the hot paths of the library: preparing, signing and decoding of
+the requests, making the items, throttling, and the end-to-end calls and streams
+against the local fake server (see server.py). No network access is needed.
+
+Each benchmark is timed as the best of few repeats, and is reported as the time
+per operation. The results are appended to the history file (one JSON per line),
+and are compared with the previous run from the same file: the benchmarks which
+became slower by more than the threshold are reported as regressions, and the
+exit status is non-zero then (so the suite can be used in CI).
+
+Usage:
+    python tests/benchmarks.py [--history=benchmarks.jsonl] [--threshold=0.2] [names...]
+"""
+
+import os
+import sys
+import json
+import time
+import timeit
+import optparse
+import platform
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import HTTPServer
+
+
+PORT = 8890
+STATUS = json.dumps({
+    'id': 123456789012345678, 'created_at': 'Mon Jan 01 00:00:00 +0000 2012', 'text': 'hello world #python',
+    'user': {'id': 12345, 'screen_name': 'someone', 'name': 'Some One', 'lang': 'en', 'followers_count': 100},
+    'entities': {'hashtags': [{'text': 'python', 'indices': [12, 19]}], 'urls': [], 'user_mentions': []},
+    'retweet_count': 0, 'favorited': False, 'retweeted': False, 'lang': 'en',
+})
+TOKEN = 'oauth_token=Z6eEdO8MOmk394WozF5oKyuAv855l4Mlqo7hhlSLik&oauth_token_secret=Kd75W4OQfb2oJTV0vzGzeXftVAwgMnEK9MumzYcM&oauth_callback_confirmed=true'
+STREAM_LINES = [STATUS + '\r\n', '\r\n'] * 500
+
+BENCHMARKS = []
+
+
+def benchmark(number, repeat=3):
+    """
+    Registers the benchmark. The decorated function prepares everything,
+    and returns the callable to be timed (called "number" times per repeat).
+    """
+    def decorator(fn):
+        BENCHMARKS.append((fn.__name__, fn, number, repeat))
+        return fn
+    return decorator
+
+
+def make_credentials(**kwargs):
+    from tootwi import API, TokenCredentials
+    return TokenCredentials('consumer_key', 'consumer_secret', 'token_key', 'token_secret', api=API(**kwargs))
+
+
+@benchmark(number=10000)
+def api_invoke():
+    from tootwi import API
+    api = API()
+    return lambda: api.invoke(('GET', 'statuses/show/%(id)s'), dict(id=123, include_entities=True))
+
+
+@benchmark(number=2000)
+def oauth_sign():
+    credentials = make_credentials()
+    invocation = credentials.api.invoke(('GET', 'statuses/show/%(id)s'), dict(id=123, include_entities=True))
+    return lambda: credentials.sign(invocation)
+
+
+@benchmark(number=10000)
+def json_decode():
+    from tootwi.formats import JsonFormat
+    format = JsonFormat()
+    line = STATUS + '\r\n'
+    return lambda: format.decode(line)
+
+
+@benchmark(number=10000)
+def form_decode():
+    from tootwi.formats import FormFormat
+    format = FormFormat()
+    return lambda: format.decode(TOKEN)
+
+
+@benchmark(number=10000)
+def message_factory():
+    from tootwi.streams import MessageFactory
+    factory = MessageFactory()
+    data = json.loads(STATUS)
+    return lambda: factory(None, data)
+
+
+@benchmark(number=100)
+def list_iteration():
+    from tootwi.models import PublicTimeline
+    statuses = PublicTimeline(None, [json.loads(STATUS)] * 200)
+    statuses.loaded = True # as if loaded already; only the iteration is measured.
+    return lambda: [status for status in statuses]
+
+
+@benchmark(number=10000)
+def throttler_overhead():
+    from tootwi.throttlers import TimedThrottler
+    throttler = TimedThrottler(1000000000) # never actually waits.
+    return throttler.wait
+
+
+@benchmark(number=200)
+def api_call():
+    credentials = make_credentials(use_ssl=False)
+    operation = ('GET', 'http://127.0.0.1:%d/statuses/show' % PORT)
+    return lambda: credentials.call(operation, dict(id=123))
+
+
+@benchmark(number=10)
+def api_flow():
+    credentials = make_credentials(use_ssl=False)
+    operation = ('GET', 'http://127.0.0.1:%d/statuses/sample' % PORT)
+    return lambda: [data for data in credentials.flow(operation)]
+
+
+def run(names=None):
+    """ Runs the benchmarks (all or only the named ones); returns {name: seconds per operation}. """
+    results = {}
+    for name, fn, number, repeat in BENCHMARKS:
+        if names and name not in names:
+            continue
+        if name == 'api_flow':
+            server = HTTPServer(port=PORT, content_type='application/json', content_lines=STREAM_LINES)
+        else:
+            server = HTTPServer(port=PORT, content_type='application/json', content_body=STATUS)
+        with server:
+            timer = timeit.Timer(fn())
+            results[name] = min(timer.repeat(repeat=repeat, number=number)) / number
+    return results
+
+
+def load_previous(path):
+    """ Returns the results of the last run in the history file, or None. """
+    if not os.path.exists(path):
+        return None
+    previous = None
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                previous = json.loads(line)
+    return previous
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options] [names...]')
+    parser.add_option('--history', default='benchmarks.jsonl', help='file to append the results to and to compare with.')
+    parser.add_option('--threshold', type='float', default=0.2, help='relative slowdown considered a regression.')
+    options, names = parser.parse_args()
+
+    from tootwi.api import __version__
+    previous = load_previous(options.history)
+    results = run(names)
+    record = dict(time=time.time(), version=__version__, python=platform.python_version(), results=results)
+    with open(options.history, 'ab') as f:
+        f.write(json.dumps(record, sort_keys=True) + '\n')
+
+    regressions = []
+    for name, fn, number, repeat in BENCHMARKS:
+        if name not in results:
+            continue
+        line = '%-20s %12.2f us/op' % (name, results[name] * 1000000)
+        baseline = (previous or {}).get('results', {}).get(name)
+        if baseline:
+            change = results[name] / baseline - 1
+            line += '   %+7.1f%%' % (change * 100)
+            if change > options.threshold:
+                line += '   REGRESSION'
+                regressions.append(name)
+        print line
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,9 +2,12 @@
 # coding: utf-8
 # author: Sergey Vasilyev <nolar@nolar.info>
 #
-# Fake HTTP/HTTPS server mostly for one-time requests. Designed to be used as
-# a context manager ("with" operator). Listens for connections in its own thread,
-# so it does not interfere with the main execution except for starting/stopping.
+# Fake HTTP/HTTPS server for tests and benchmarks, a local stand-in for Twitter.
+# Designed to be used as a context manager ("with" operator). The socket is bound
+# and listening once the "with" block is entered, so the clients can connect right
+# away. Listens for connections in its own thread, and serves each connection in
+# a thread of its own, so it does not interfere with the main execution except
+# for starting/stopping, and can serve concurrent and persistent connections.
 #
 # Suggested syntax for tests:
 #
@@ -14,22 +17,44 @@
 #           data = req.read()
 #           self.assertEqual(data, 'hello')
 #
+#   def test_stream_with_failures(self):
+#       with HTTPServer(port=0, content_lines=corpus, rate=1000, failures=[420, 503]) as server:
+#           url = 'http://localhost:%d/' % server.port # port 0 means any free one.
+#           ... # first two requests fail with 420 & 503, the next ones get the stream.
+#
 # Possibe parameters for constructor and their defaults:
 #
 # host          127.0.0.1   - host to listen for connections (0.0.0.0 is not recommended).
-# port          8888        - port to listen for connections (1..1024 are not recommended).
+# port          8888        - port to listen for connections (1..1024 are not recommended); 0 for any.
 # use_ssl       False       - whether it is a HTTP (False) or HTTPS (True) server.
 # status_code   200         - status code (200 for OK, 404 for NotFound, etc).
 # status_text   None        - status text or None for autodetection.
 # content_type  text/plain  - value for Content-Type header.
 # content_body  empty       - response content itself.
 # encoding      utf-8       - how to encode content body; also used in Content-Type.
+# content_lines None        - lines to stream with chunked encoding (one chunk per line) for GETs.
+# keep_alive    False       - whether to keep the connections open after the response (HTTP/1.1).
+# compress      False       - whether to gzip the responses if the client accepts gzip encoding.
+# headers       None        - extra headers for all responses (e.g., X-RateLimit-Remaining).
+# failures      None        - status codes (e.g. 420, 503) to respond to the first requests with.
+# rate          None        - lines per second to stream at; None for as fast as possible.
+# repeat        1           - how many times to stream the lines; 0 for endlessly.
+# stall_after   None        - number of lines after which the stream stalls (sends nothing).
+# stall_time    0           - for how long the stream stalls, in seconds.
+# disconnect_after None     - number of lines after which the connection is dropped abruptly.
+#
+# Served requests are counted in "requests" attribute (for checks of retries, etc).
 #
 
 import BaseHTTPServer
 import SocketServer
+import StringIO
+import gzip
 import os
 import ssl
+import time
+import socket
+import itertools
 import threading
 
 __all__ = ['HTTPServer']
@@ -38,9 +63,11 @@ class HTTPServer(object):
     def __init__(self, host='127.0.0.1', port=8888, use_ssl=False,
                 status_code=200, status_text=None,
                 content_type='text/plain', content_body='',
-                encoding='utf-8'):
+                encoding='utf-8', content_lines=None, keep_alive=False, compress=False,
+                headers=None, failures=None, rate=None, repeat=1,
+                stall_after=None, stall_time=0, disconnect_after=None):
         super(HTTPServer, self).__init__()
-        
+
         self.port = port
         self.host = host
         self.use_ssl = use_ssl
@@ -49,39 +76,104 @@ class HTTPServer(object):
         self.content_type = content_type
         self.content_body = content_body
         self.encoding = encoding
-        
+        self.content_lines = content_lines
+        self.keep_alive = keep_alive
+        self.compress = compress
+        self.headers = dict(headers or {})
+        self.failures = list(failures or [])
+        self.rate = rate
+        self.repeat = repeat
+        self.stall_after = stall_after
+        self.stall_time = stall_time
+        self.disconnect_after = disconnect_after
+        self.requests = 0
+        self.lock = threading.Lock()
+        owner = self
+
         # Do not use BaseHTTPServer.HTTPServer here, since it makes hostname lookups,
         # which is not good on frequest socket binds for each test (we don't need them).
-        class Server(SocketServer.TCPServer):
+        class Server(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
             allow_reuse_address = 1
+            daemon_threads = True # stalled or persistent connections must not block the exit.
             def run(self):
-                self.server_bind()
-                self.server_activate()
                 self.serve_forever(0.1)
                 self.server_close()
                 #NB: server_close() is VERY IMPORTANT! SocketServer does not close its
                 #NB: listening socket by default, leaving it open, which causes problems
                 #NB: (such as hangings and errors 10048 WSAEADDRINUSE or 10013 WSAEACCES).
-        
+
         class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' if keep_alive or content_lines is not None else 'HTTP/1.0'
             def log_message(self, format, *args):
                 pass # omit stderr logging
-            def send(self, response):
-                response = unicode(response).encode(encoding)
-                self.send_response(status_code, status_text)
-                self.send_header('Content-Type', '%s' % (content_type))
-                self.send_header('Content-Type', '%s; charset=%s' % (content_type, encoding))
-                self.send_header('Content-Length', len(response))
-                self.send_header('Connection', 'close')
+            def gzipped(self):
+                return compress and 'gzip' in (self.headers.getheader('accept-encoding') or '')
+            def start(self, code, **headers):
+                self.send_response(code, status_text if code == status_code else None)
+                for name, value in owner.headers.items() + headers.items():
+                    self.send_header(name.replace('_', '-'), value)
+                self.send_header('Connection', 'keep-alive' if keep_alive else 'close')
+                self.close_connection = 0 if keep_alive else 1
                 self.end_headers()
+            def status(self):
+                # The status for this request: either the next injected failure, or the normal one.
+                with owner.lock:
+                    owner.requests += 1
+                    return owner.failures.pop(0) if owner.failures else None
+            def send(self, response, code=status_code):
+                response = unicode(response).encode(encoding)
+                extra = {}
+                if self.gzipped():
+                    buf = StringIO.StringIO()
+                    with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+                        f.write(response)
+                    response = buf.getvalue()
+                    extra['Content_Encoding'] = 'gzip'
+                self.start(code, Content_Type='%s; charset=%s' % (content_type, encoding),
+                           Content_Length=len(response), **extra)
                 self.wfile.write(response)
+            def stream(self, lines):
+                # One chunk per line, so the client can read them as soon as they are sent.
+                # Gzip is not applied to streams: it would buffer the lines till the end.
+                self.start(status_code, Content_Type='%s; charset=%s' % (content_type, encoding),
+                           Transfer_Encoding='chunked')
+                if owner.repeat != 1:
+                    lines = itertools.chain.from_iterable(itertools.repeat(lines, owner.repeat) if owner.repeat else itertools.repeat(lines))
+                started = time.time()
+                for index, line in enumerate(lines):
+                    if owner.rate:
+                        delay = started + index / float(owner.rate) - time.time()
+                        if delay > 0:
+                            time.sleep(delay)
+                    if owner.stall_after is not None and index == owner.stall_after:
+                        time.sleep(owner.stall_time)
+                        started += owner.stall_time
+                    if owner.disconnect_after is not None and index == owner.disconnect_after:
+                        self.wfile.flush()
+                        self.connection.shutdown(socket.SHUT_RDWR) # no final chunk: the stream is broken.
+                        self.close_connection = 1
+                        return
+                    line = unicode(line).encode(encoding)
+                    self.wfile.write('%x\r\n%s\r\n' % (len(line), line))
+                    self.wfile.flush()
+                self.wfile.write('0\r\n\r\n')
             def do_GET(self):
-                self.send(content_body)
+                failure = self.status()
+                if failure is not None:
+                    self.send('{"errors":[{"message":"Injected failure %d"}]}' % failure, failure)
+                elif content_lines is not None:
+                    self.stream(content_lines)
+                else:
+                    self.send(content_body)
             def do_POST(self):
                 length = self.headers.getheader('content-length')
                 postdata = self.rfile.read(int(length)) if length is not None else ''
-                self.send(content_body % postdata if '%s' in content_body else content_body)
-        
+                failure = self.status()
+                if failure is not None:
+                    self.send('{"errors":[{"message":"Injected failure %d"}]}' % failure, failure)
+                else:
+                    self.send(content_body % postdata if '%s' in content_body else content_body)
+
         # Now we create socket server and controlling thread in passive mode!
         # That mean they should not open sockets or execute code here.
         self.server = Server((self.host, self.port), RequestHandler, bind_and_activate=False)
@@ -91,11 +183,15 @@ class HTTPServer(object):
             certfile = os.path.splitext(__file__)[0] + '.pem'
             self.server.socket = ssl.wrap_socket(self.server.socket, server_side=True, certfile=certfile)
         self.thread = threading.Thread(target = self.server.run)
-    
+
     def __enter__(self):
+        # Bind and listen before returning, so the clients never connect too early.
+        self.server.server_bind()
+        self.server.server_activate()
+        self.port = self.server.server_address[1]
         self.thread.start()
         return self
-    
+
     def __exit__(self, exc_type, exc_info, exc_bt):
         self.server.shutdown()
         self.thread.join()
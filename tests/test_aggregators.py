@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+try:
+    import unittest2 as unittest # python-2 external dependency
+except:
+    import unittest # python-3 native module
+
+
+def status(id, user_id=1, tags=(), lang='en'):
+    return dict(id=id, text='hello', lang=lang, user=dict(id=user_id),
+                entities=dict(hashtags=[dict(text=tag) for tag in tags], user_mentions=[]))
+
+
+class SketchTests(unittest.TestCase):
+    def test_count_min_never_underestimates(self):
+        from tootwi.aggregators import CountMinSketch
+        sketch = CountMinSketch(width=64, depth=4)
+        for i in range(1000):
+            sketch.add(i % 100)
+        self.assertEqual(sketch.total, 1000)
+        for value in range(100):
+            self.assertTrue(sketch.estimate(value) >= 10)
+        self.assertEqual(sketch.estimate(u'frequent'), 0)
+
+    def test_count_min_merge(self):
+        from tootwi.aggregators import CountMinSketch
+        first, second = CountMinSketch(), CountMinSketch()
+        first.add('a', 3)
+        second.add('a', 2)
+        self.assertEqual(first.merge(second).estimate('a'), 5)
+        self.assertRaises(ValueError, first.merge, CountMinSketch(width=10))
+
+    def test_top_k_finds_heavy_hitters(self):
+        from tootwi.aggregators import TopK
+        top = TopK(k=3, width=256)
+        for i in range(2000):
+            top.add('rare%d' % i)
+            if i % 4 == 0:
+                top.add('heavy')
+            if i % 8 == 0:
+                top.add('medium')
+        self.assertEqual([value for value, count in top.top(2)], ['heavy', 'medium'])
+        self.assertTrue(len(top.candidates) <= 3)
+
+    def test_hyperloglog_estimates_distinct_values(self):
+        from tootwi.aggregators import HyperLogLog
+        hll = HyperLogLog(precision=12)
+        for i in range(50000):
+            hll.add(i % 20000)
+        self.assertAlmostEqual(hll.count(), 20000, delta=20000 * 0.05)
+        small = HyperLogLog()
+        small.update(['a', 'b', 'c', 'a'])
+        self.assertEqual(small.count(), 3)
+
+    def test_hyperloglog_merge_is_union(self):
+        from tootwi.aggregators import HyperLogLog
+        first, second = HyperLogLog(), HyperLogLog()
+        first.update(range(0, 1000))
+        second.update(range(500, 1500))
+        self.assertAlmostEqual(first.merge(second).count(), 1500, delta=1500 * 0.05)
+
+    def test_bounded_counter_is_exact_within_capacity(self):
+        from tootwi.aggregators import BoundedCounter
+        counter = BoundedCounter(capacity=3)
+        counter.update(['a', 'b', 'a', 'c', 'a'])
+        self.assertTrue(counter.exact)
+        self.assertEqual(counter.most_common(1), [('a', 3)])
+        counter.update(['d', 'e', 'f'])
+        self.assertFalse(counter.exact)
+        self.assertEqual(len(counter), 3)
+        self.assertEqual(counter.most_common(1), [('a', 3)])
+
+
+class ExtractorTests(unittest.TestCase):
+    def test_extractors_of_statuses(self):
+        from tootwi.aggregators import hashtags, user_ids, languages
+        from tootwi.models import Status
+        data = status(1, user_id=7, tags=['Python'], lang='de')
+        for item in [data, Status(None, data), Status(None, Status.project(data, slots=True))]:
+            self.assertEqual(hashtags(item), ['python'])
+            self.assertEqual(user_ids(item), [7])
+            self.assertEqual(languages(item), ['de'])
+
+    def test_other_messages_have_no_values(self):
+        from tootwi.aggregators import hashtags, user_ids
+        from tootwi.streams import Delete
+        self.assertEqual(hashtags(dict(delete=dict(status=dict(id=1)))), [])
+        self.assertEqual(user_ids(Delete(None, dict(delete=dict(status=dict(id=1))))), [])
+
+
+class AggregationTests(unittest.TestCase):
+    def aggregation(self, items=None, **kwargs):
+        from tootwi.aggregators import Aggregation, Metric, TopK, HyperLogLog, hashtags, user_ids
+        return Aggregation(items, hashtags=Metric(hashtags, TopK(3)), users=Metric(user_ids, HyperLogLog()), **kwargs)
+
+    def test_tumbling_windows(self):
+        aggregation = self.aggregation(size=10)
+        self.assertEqual(aggregation.add(status(1, 1, ['a']), now=1), [])
+        self.assertEqual(aggregation.add(status(2, 2, ['a', 'b']), now=5), [])
+        windows = aggregation.add(status(3, 1, ['c']), now=12)
+        self.assertEqual([(w.start, w.end, w.count) for w in windows], [(0, 10, 2)])
+        self.assertEqual(windows[0]['hashtags'].top(1), [('a', 2)])
+        self.assertEqual(windows[0]['users'].count(), 2)
+        windows = aggregation.close()
+        self.assertEqual([(w.start, w.end, w.count) for w in windows], [(10, 20, 1)])
+        self.assertEqual(windows[0]['hashtags'].top(), [('c', 1)])
+
+    def test_sliding_windows_merge_panes(self):
+        aggregation = self.aggregation(size=20, slide=10)
+        aggregation.add(status(1, 1, ['a']), now=1)
+        windows = aggregation.add(status(2, 2, ['a']), now=11)
+        self.assertEqual([(w.start, w.end, w.count) for w in windows], [(-10, 10, 1)])
+        windows = aggregation.add(status(3, 3, ['b']), now=21)
+        self.assertEqual([(w.start, w.end, w.count) for w in windows], [(0, 20, 2)])
+        self.assertEqual(windows[0]['hashtags'].top(), [('a', 2)])
+        self.assertEqual(windows[0]['users'].count(), 2)
+        windows = aggregation.add(status(4, 4, ['b']), now=45)
+        self.assertEqual([(w.start, w.end, w.count) for w in windows], [(10, 30, 2), (20, 40, 1)])
+        self.assertEqual(windows[1]['hashtags'].top(), [('b', 1)])
+
+    def test_iteration_over_items(self):
+        times = iter([1, 2, 11, 12, 13])
+        items = [status(i, tags=['a']) for i in range(5)]
+        aggregation = self.aggregation(items, size=10, clock=lambda: next(times))
+        self.assertEqual([w.count for w in aggregation], [2, 3])
+
+    def test_size_must_be_multiple_of_slide(self):
+        self.assertRaises(ValueError, self.aggregation, size=10, slide=3)
+
+
+if __name__ == '__main__':
+    unittest.main()
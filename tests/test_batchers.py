@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+try:
+    import unittest2 as unittest # python-2 external dependency
+except:
+    import unittest # python-3 native module
+
+import threading
+
+
+class FakeCredentials(object):
+    """
+    Pretends to be credentials for the models, but instead of real API calls,
+    it generates users for the requested ids and screen names, and remembers
+    all the calls made, so they can be checked in tests.
+    """
+    def __init__(self, missing=()):
+        super(FakeCredentials, self).__init__()
+        self.missing = set(missing)
+        self.calls = []
+
+    def call(self, operation, parameters=None, **kwargs):
+        parameters = dict(parameters or {}, **kwargs)
+        self.calls.append((operation, parameters))
+        if operation == ('GET', 'users/show'):
+            return {'id': int(parameters['user_id']), 'screen_name': 'user%s' % parameters['user_id']}
+        user_ids = [v for v in (parameters.get('user_id') or '').split(',') if v]
+        screen_names = [v for v in (parameters.get('screen_name') or '').split(',') if v]
+        return ([{'id': int(v), 'screen_name': 'user%s' % v} for v in user_ids if v not in self.missing] +
+                [{'id': 0, 'screen_name': v.upper()} for v in screen_names if v not in self.missing])
+
+
+class UsersLookupTests(unittest.TestCase):
+    def test_lists_are_joined(self):
+        from tootwi.models import UsersLookup
+        lookup = UsersLookup(FakeCredentials(), user_id=[1, 2, 3], screen_name=['a', 'b'])
+        self.assertEqual(lookup.params['user_id'], '1,2,3')
+        self.assertEqual(lookup.params['screen_name'], 'a,b')
+
+    def test_strings_are_kept(self):
+        from tootwi.models import UsersLookup
+        lookup = UsersLookup(FakeCredentials(), user_id='1,2')
+        self.assertEqual(lookup.params['user_id'], '1,2')
+        self.assertEqual(lookup.params['screen_name'], None)
+
+
+class UsersLookupBatcherTests(unittest.TestCase):
+    def setUp(self):
+        from tootwi.batchers import UsersLookupBatcher
+        from tootwi.models import User
+        self.credentials = FakeCredentials(missing=['13'])
+        self.batcher = UsersLookupBatcher(window=0.2, size=3)
+        class BatchedUser(User):
+            LOAD_BATCHER = self.batcher
+        self.user_class = BatchedUser
+
+    def test_load_all_chunks_by_size(self):
+        users = [self.user_class(self.credentials, user_id=i) for i in range(7)]
+        self.batcher.load_all(users)
+        self.assertEqual(len(self.credentials.calls), 3)
+        self.assertTrue(all(user.loaded for user in users))
+        self.assertEqual([user['screen_name'] for user in users], ['user%s' % i for i in range(7)])
+
+    def test_load_all_by_screen_names(self):
+        users = [self.user_class(self.credentials, screen_name=s) for s in ['a', 'b']]
+        self.batcher.load_all(users)
+        self.assertEqual(len(self.credentials.calls), 1)
+        self.assertEqual([user['screen_name'] for user in users], ['A', 'B'])
+
+    def test_load_all_leaves_missing_unloaded(self):
+        users = [self.user_class(self.credentials, user_id=i) for i in [12, 13]]
+        self.batcher.load_all(users)
+        self.assertTrue(users[0].loaded)
+        self.assertFalse(users[1].loaded)
+
+    def test_declined_models_are_loaded_as_usually(self):
+        user = self.user_class(self.credentials, user_id=5, skip_status=True).load()
+        self.assertTrue(user.loaded)
+        self.assertEqual(self.credentials.calls[0][0], ('GET', 'users/show'))
+
+    def test_missing_model_fails_on_load(self):
+        from tootwi.errors import OperationNotFoundError
+        with self.assertRaises(OperationNotFoundError):
+            self.user_class(self.credentials, user_id=13).load()
+
+    def test_zero_window_does_not_wait(self):
+        import time
+        self.batcher.window = 0
+        started = time.time()
+        user = self.user_class(self.credentials, user_id=5).load()
+        self.assertLess(time.time() - started, 0.1)
+        self.assertTrue(user.loaded)
+        self.assertEqual(self.credentials.calls[0][0], ('GET', 'users/lookup'))
+
+    def test_concurrent_loads_are_coalesced(self):
+        users = [self.user_class(self.credentials, user_id=i) for i in range(3)]
+        threads = [threading.Thread(target=user.load) for user in users]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assertEqual(len(self.credentials.calls), 1)
+        self.assertEqual(self.credentials.calls[0][0], ('GET', 'users/lookup'))
+        self.assertTrue(all(user.loaded for user in users))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+try:
+    import unittest2 as unittest # python-2 external dependency
+except:
+    import unittest # python-3 native module
+
+import time
+import socket
+import StringIO
+
+
+class Request(object):
+    def __init__(self, url, template=None):
+        self.url = url
+        self.template = template
+
+
+class SwitchableTransport(object):
+    """ Fails with the error while it is set; counts the requests. """
+    def __init__(self, error=None):
+        super(SwitchableTransport, self).__init__()
+        self.error = error
+        self.requests = 0
+    def __call__(self, request):
+        self.requests += 1
+        if self.error is not None:
+            raise self.error
+        return StringIO.StringIO('{"id":1}\r\n')
+
+
+def server_error(code):
+    from tootwi.transports import TransportServerError
+    return TransportServerError('HTTP Error %d' % code, code, 'failure')
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    def test_consecutive_failures_open_the_circuit(self):
+        from tootwi.breakers import CircuitBreaker, OPEN
+        from tootwi.errors import CircuitOpenError
+        breaker = CircuitBreaker(failures=3)
+        request = Request('https://api.twitter.com/1/statuses/show.json')
+        for i in range(3):
+            breaker.failure(breaker.enter(request), socket.error('refused'))
+        self.assertEqual(breaker.states()['api.twitter.com']['state'], OPEN)
+        self.assertRaises(CircuitOpenError, breaker.enter, request)
+        breaker.enter(Request('https://stream.twitter.com/1/statuses/sample.json')) # other hosts work.
+
+    def test_successes_reset_consecutive_failures(self):
+        from tootwi.breakers import CircuitBreaker, CLOSED
+        breaker = CircuitBreaker(failures=3, min_calls=100)
+        request = Request('https://api.twitter.com/1/statuses/show.json')
+        for i in range(10):
+            breaker.failure(breaker.enter(request), socket.error('refused'))
+            breaker.success(breaker.enter(request))
+        self.assertEqual(breaker.states()['api.twitter.com']['state'], CLOSED)
+
+    def test_error_rate_opens_the_circuit(self):
+        from tootwi.breakers import CircuitBreaker, OPEN
+        breaker = CircuitBreaker(failures=100, error_rate=0.5, window=10, min_calls=10)
+        request = Request('https://api.twitter.com/1/statuses/show.json')
+        for i in range(5):
+            breaker.success(breaker.enter(request))
+            breaker.failure(breaker.enter(request), server_error(503))
+        self.assertEqual(breaker.states()['api.twitter.com']['state'], OPEN)
+
+    def test_client_errors_are_not_failures(self):
+        from tootwi.breakers import CircuitBreaker, CLOSED
+        breaker = CircuitBreaker(failures=1)
+        request = Request('https://api.twitter.com/1/statuses/show.json')
+        breaker.failure(breaker.enter(request), server_error(404))
+        self.assertEqual(breaker.states()['api.twitter.com']['state'], CLOSED)
+
+    def test_half_open_circuit_is_probed(self):
+        from tootwi.breakers import CircuitBreaker, OPEN, CLOSED
+        from tootwi.errors import CircuitOpenError
+        breaker = CircuitBreaker(failures=1, reset_timeout=0.05, probes=1)
+        request = Request('https://api.twitter.com/1/statuses/show.json')
+        breaker.failure(breaker.enter(request))
+        time.sleep(0.1)
+        probe = breaker.enter(request)
+        self.assertRaises(CircuitOpenError, breaker.enter, request) # only one probe at a time.
+        breaker.failure(probe)
+        self.assertEqual(breaker.states()['api.twitter.com']['state'], OPEN)
+        self.assertRaises(CircuitOpenError, breaker.enter, request)
+        time.sleep(0.1)
+        breaker.success(breaker.enter(request))
+        self.assertEqual(breaker.states()['api.twitter.com']['state'], CLOSED)
+        breaker.enter(request)
+
+    def test_circuits_per_operation(self):
+        from tootwi.breakers import CircuitBreaker
+        breaker = CircuitBreaker(failures=1, per_operation=True)
+        breaker.failure(breaker.enter(Request('https://api.twitter.com/1/statuses/show.json?id=1')))
+        self.assertEqual(breaker.states().keys(), ['https://api.twitter.com/1/statuses/show.json'])
+        breaker.enter(Request('https://api.twitter.com/1/users/show.json'))
+
+    def test_circuits_per_operation_template(self):
+        from tootwi.breakers import CircuitBreaker
+        from tootwi.errors import CircuitOpenError
+        breaker = CircuitBreaker(failures=1, per_operation=True)
+        template = 'https://api.twitter.com/1/statuses/show/%(id)s.json'
+        request = lambda id: Request('https://api.twitter.com/1/statuses/show/%s.json' % id, template)
+        breaker.failure(breaker.enter(request(1)))
+        self.assertRaises(CircuitOpenError, breaker.enter, request(2))
+        self.assertEqual(breaker.states().keys(), [template])
+
+
+class APIBreakerTests(unittest.TestCase):
+    def setUp(self):
+        from tootwi import API, BasicCredentials
+        from tootwi.breakers import CircuitBreaker
+        self.transport = SwitchableTransport(socket.error('refused'))
+        api = API(transport=self.transport, breaker=CircuitBreaker(failures=2, reset_timeout=0.05))
+        self.credentials = BasicCredentials('username', 'password', api=api)
+
+    def test_calls_fail_fast_when_open(self):
+        from tootwi.errors import CircuitOpenError
+        for i in range(2):
+            self.assertRaises(socket.error, self.credentials.call, ('GET', 'http://localhost/x'))
+        self.assertRaises(CircuitOpenError, self.credentials.call, ('GET', 'http://localhost/x'))
+        self.assertEqual(self.transport.requests, 2)
+        time.sleep(0.1)
+        self.transport.error = None
+        self.assertEqual(self.credentials.call(('GET', 'http://localhost/x')), {'id': 1})
+
+    def test_probe_is_released_on_other_errors(self):
+        from tootwi.errors import CircuitOpenError
+        for i in range(2):
+            self.assertRaises(socket.error, self.credentials.call, ('GET', 'http://localhost/x'))
+        time.sleep(0.1)
+        self.transport.error = ValueError('not a failure of the host')
+        self.assertRaises(ValueError, self.credentials.call, ('GET', 'http://localhost/x'))
+        self.transport.error = None
+        self.assertEqual(self.credentials.call(('GET', 'http://localhost/x')), {'id': 1}) # probed again.
+
+    def test_probe_is_released_past_deadline(self):
+        from tootwi.errors import DeadlineExceededError
+        for i in range(2):
+            self.assertRaises(socket.error, self.credentials.call, ('GET', 'http://localhost/x'))
+        time.sleep(0.1)
+        self.assertRaises(DeadlineExceededError, self.credentials.api.call,
+                          self.credentials.signed(self.credentials.api.invoke(('GET', 'http://localhost/x'))), deadline=time.time() - 1)
+        self.transport.error = None
+        self.assertEqual(self.credentials.call(('GET', 'http://localhost/x')), {'id': 1})
+
+    def test_flows_fail_fast_when_open(self):
+        from tootwi.errors import CircuitOpenError
+        for i in range(2):
+            self.assertRaises(socket.error, list, self.credentials.flow(('GET', 'http://localhost/x')))
+        self.assertRaises(CircuitOpenError, list, self.credentials.flow(('GET', 'http://localhost/x')))
+        self.assertEqual(self.transport.requests, 2)
+
+    def test_retries_stop_when_open(self):
+        from tootwi import API, BasicCredentials
+        from tootwi.breakers import CircuitBreaker
+        from tootwi.retriers import BackoffRetrier
+        from tootwi.errors import CircuitOpenError
+        api = API(transport=self.transport, breaker=CircuitBreaker(failures=2), retrier=BackoffRetrier(attempts=5, base=0.001))
+        credentials = BasicCredentials('username', 'password', api=api)
+        self.assertRaises(CircuitOpenError, credentials.call, ('GET', 'http://localhost/x'))
+        self.assertEqual(self.transport.requests, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+try:
+    import unittest2 as unittest # python-2 external dependency
+except:
+    import unittest # python-3 native module
+
+import threading
+import time
+
+
+class SingleFlightCoalescerTests(unittest.TestCase):
+    def setUp(self):
+        from tootwi.coalescers import SingleFlightCoalescer
+        self.coalescer = SingleFlightCoalescer()
+        self.calls = []
+
+    def slow_call(self):
+        self.calls.append(1)
+        time.sleep(0.2)
+        return {'result': len(self.calls)}
+
+    def run_concurrently(self, keys):
+        results = []
+        def target(key):
+            try:
+                results.append(self.coalescer(key, self.slow_call))
+            except Exception, e:
+                results.append(e)
+        threads = [threading.Thread(target=target, args=(key,)) for key in keys]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        return results
+
+    def test_identical_calls_are_performed_once(self):
+        results = self.run_concurrently(['key'] * 5)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(result == results[0] for result in results))
+
+    def test_waiters_get_their_own_copies(self):
+        results = self.run_concurrently(['key'] * 3)
+        self.assertEqual(len(self.calls), 1)
+        self.assertTrue(all(result == results[0] for result in results))
+        self.assertEqual(len(set(id(result) for result in results)), 3)
+
+    def test_different_calls_are_performed_separately(self):
+        results = self.run_concurrently(['key1', 'key2'])
+        self.assertEqual(len(self.calls), 2)
+
+    def test_sequential_calls_are_not_cached(self):
+        self.coalescer('key', self.slow_call)
+        self.coalescer('key', self.slow_call)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_unhashable_keys_are_not_coalesced(self):
+        results = self.run_concurrently([['key']] * 2)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_errors_are_shared(self):
+        def failing_call():
+            self.calls.append(1)
+            time.sleep(0.2)
+            raise ValueError('failed')
+        self.slow_call = failing_call
+        results = self.run_concurrently(['key'] * 3)
+        self.assertEqual(len(self.calls), 1)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+
+class CredentialsCoalescingTests(unittest.TestCase):
+    def setUp(self):
+        from tootwi import API, BasicCredentials
+        from tootwi.coalescers import SingleFlightCoalescer
+        self.requests = []
+        test = self
+        class FakeAPI(API):
+            def call(self, request):
+                test.requests.append(request)
+                time.sleep(0.2)
+                return {'ok': True}
+        self.api = FakeAPI(coalescer=SingleFlightCoalescer())
+        self.credentials = BasicCredentials('username', 'password', api=self.api)
+
+    def test_reads_are_coalesced(self):
+        threads = [threading.Thread(target=self.credentials.call, args=(('GET', 'statuses/show/%(id)s'), dict(id=1))) for i in range(3)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assertEqual(len(self.requests), 1)
+
+    def test_different_formats_are_not_coalesced(self):
+        from tootwi.formats import FormFormat
+        # Both formats have no extension, so the urls are the same too.
+        operations = [('GET', 'http://example.com/data', FormFormat), ('GET', 'http://example.com/data', lambda data: data)]
+        threads = [threading.Thread(target=self.credentials.call, args=(operation,)) for operation in operations]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assertEqual(len(self.requests), 2)
+
+    def test_loaded_models_do_not_share_data(self):
+        from tootwi.models import User
+        users = [User(self.credentials, user_id=1) for i in range(2)]
+        threads = [threading.Thread(target=user.load) for user in users]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assertEqual(len(self.requests), 1)
+        self.assertIsNot(users[0].data, users[1].data)
+
+    def test_writes_are_not_coalesced(self):
+        threads = [threading.Thread(target=self.credentials.call, args=(('POST', 'statuses/update'), dict(status='hi'))) for i in range(3)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assertEqual(len(self.requests), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+try:
+    import unittest2 as unittest # python-2 external dependency
+except:
+    import unittest # python-3 native module
+
+import time
+import socket
+import StringIO
+from server import HTTPServer
+
+
+class Request(object):
+    def __init__(self, url):
+        self.url = url
+        self.method = 'GET'
+        self.headers = {}
+        self.postdata = None
+
+
+class RecordingTransport(object):
+    """ Fails the first requests with the errors; records the timeouts it was given. """
+    def __init__(self, errors=()):
+        super(RecordingTransport, self).__init__()
+        self.errors = list(errors)
+        self.timeouts = []
+    def __call__(self, request, timeout=None):
+        self.timeouts.append(timeout)
+        if self.errors:
+            raise self.errors.pop(0)
+        return StringIO.StringIO('{"id":1}')
+
+
+class TransportTimeoutTests(unittest.TestCase):
+    def test_stalled_stream_times_out(self):
+        from tootwi.transports import urllibTransport
+        transport = urllibTransport(bufsize=0, connect_timeout=5, read_timeout=0.2)
+        with HTTPServer(port=0, content_lines=['a\r\n', 'b\r\n'], stall_after=1, stall_time=2) as server:
+            handle = transport(Request('http://127.0.0.1:%d/' % server.port))
+            self.assertEqual(handle.readline(), 'a\r\n')
+            started = time.time()
+            self.assertRaises(socket.timeout, handle.readline)
+            self.assertTrue(time.time() - started < 1.5)
+            handle.close()
+
+    def test_request_timeout_limits_reads(self):
+        from tootwi.transports import urllibTransport
+        transport = urllibTransport(bufsize=0)
+        with HTTPServer(port=0, content_lines=['a\r\n', 'b\r\n'], stall_after=1, stall_time=2) as server:
+            handle = transport(Request('http://127.0.0.1:%d/' % server.port), 0.2)
+            handle.readline()
+            self.assertRaises(socket.timeout, handle.readline)
+            handle.close()
+
+    def test_no_timeouts_by_default(self):
+        from tootwi.transports import urllibTransport
+        transport = urllibTransport()
+        with HTTPServer(port=0, content_body='hello') as server:
+            handle = transport(Request('http://127.0.0.1:%d/' % server.port))
+            self.assertEqual(handle.read(), 'hello')
+            handle.close()
+
+
+class ThrottlerDeadlineTests(unittest.TestCase):
+    def test_wait_past_deadline_is_refused(self):
+        from tootwi.throttlers import TimedThrottler
+        from tootwi.errors import DeadlineExceededError
+        throttler = TimedThrottler(1) # one request per second.
+        throttler.wait(time.time() + 0.1)
+        started = time.time()
+        self.assertRaises(DeadlineExceededError, throttler.wait, time.time() + 0.1)
+        self.assertTrue(time.time() - started < 0.05) # no sleeping at all.
+
+    def test_wait_within_deadline(self):
+        from tootwi.throttlers import TimedThrottler
+        throttler = TimedThrottler(20)
+        throttler.wait()
+        throttler.wait(time.time() + 1)
+
+
+class APIDeadlineTests(unittest.TestCase):
+    def make_credentials(self, transport, **kwargs):
+        from tootwi import API, BasicCredentials
+        return BasicCredentials('username', 'password', api=API(transport=transport, **kwargs))
+
+    def test_remaining_time_is_passed_to_the_transport(self):
+        transport = RecordingTransport()
+        credentials = self.make_credentials(transport, timeout=5.0)
+        self.assertEqual(credentials.call(('GET', 'http://localhost/x')), {'id': 1})
+        self.assertTrue(4.5 < transport.timeouts[0] <= 5.0)
+
+    def test_no_timeout_is_passed_with_no_deadline(self):
+        transport = RecordingTransport()
+        self.make_credentials(transport).call(('GET', 'http://localhost/x'))
+        self.assertEqual(transport.timeouts, [None])
+
+    def test_retries_do_not_sleep_past_the_deadline(self):
+        from tootwi.retriers import BackoffRetrier
+        error = socket.error('reset')
+        transport = RecordingTransport([error] * 5)
+        credentials = self.make_credentials(transport, timeout=0.3, retrier=BackoffRetrier(attempts=5, base=10.0, cap=10.0))
+        started = time.time()
+        try:
+            credentials.call(('GET', 'http://localhost/x'))
+        except socket.error:
+            pass
+        else:
+            self.fail('The call must fail.')
+        self.assertTrue(time.time() - started < 0.3)
+
+    def test_throttler_does_not_wait_past_the_deadline(self):
+        from tootwi.throttlers import TimedThrottler
+        from tootwi.errors import DeadlineExceededError
+        credentials = self.make_credentials(RecordingTransport(), timeout=0.1, throttler=TimedThrottler(1))
+        credentials.call(('GET', 'http://localhost/x'))
+        self.assertRaises(DeadlineExceededError, credentials.call, ('GET', 'http://localhost/x'))
+
+    def test_explicit_deadline(self):
+        from tootwi import API
+        from tootwi.errors import DeadlineExceededError
+        api = API(transport=RecordingTransport())
+        self.assertRaises(DeadlineExceededError, api.call, Request('http://localhost/x'), deadline=time.time() - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -67,6 +67,15 @@ class FormFormatTest(unittest.TestCase):
         result = self.format.decode(sample)
         self.assertEqual(result, {'a':output, 'b': output+output})
     
+    def test_decoding_of_buffers(self):
+        sample = 'a=123&b=%20'
+        for data in [bytearray(sample), buffer(' ' + sample + '\r\n'), memoryview(sample)]:
+            self.assertEqual(self.format.decode(data), {'a':'123', 'b': ' '})
+    
+    def test_decoding_of_malformed_sample_fails(self):
+        with self.assertRaises(ValueError):
+            self.format.decode('a=123&b')
+    
     def test_decoding_of_urlencoded_sample(self):
         output = u'\u043f\u0440\u0438\u0432\u0435\u0442' # russian 'privet' ('hello')
         sample = 'a=%25&b=%20%30&c=%D0%BF%D1%80%D0%B8%D0%B2%D0%B5%D1%82'
@@ -108,6 +117,62 @@ class JsonFormatTest(unittest.TestCase):
         sample = ''' [1,2,"hello", "world", 1,2] '''
         result = self.format.decode(sample)
         self.assertEqual(result, [1,2,'hello','world',1,2])
+    
+    def test_decoding_of_buffers(self):
+        sample = '{"a":[1,2]}\r\n'
+        for data in [bytearray(sample), buffer(sample), memoryview(sample)]:
+            self.assertEqual(self.format.decode(data), {'a':[1,2]})
+        self.assertEqual(self.format.decode(bytearray('\r\n')), None)
+    
+    def test_decoding_from_buffer_boundaries(self):
+        buffer = '{"a":1}\r\n\r\n {"b":2}\r\n'
+        self.assertEqual(self.format.decode_from(buffer, 0, 9), {'a':1})
+        self.assertEqual(self.format.decode_from(buffer, 9, 11), None)
+        self.assertEqual(self.format.decode_from(buffer, 11), {'b':2})
+        with self.assertRaises(ValueError):
+            self.format.decode_from(buffer, 0, 5) # truncated value.
+        with self.assertRaises(ValueError):
+            self.format.decode_from(buffer, 0) # extra data.
+    
+    def test_prefiltered_buffers_are_converted_once(self):
+        from tootwi.formats import PrefilteredFormat, JsonFormat
+        received = []
+        class Recording(JsonFormat):
+            def decode(self, data):
+                received.append(data)
+                return super(Recording, self).decode(data)
+        format = PrefilteredFormat(lambda line: '"a"' in line, Recording())
+        self.assertEqual(format.decode(bytearray('{"a":[1,2]}\r\n')), {'a':[1,2]})
+        self.assertEqual(format.decode(bytearray('{"b":1}\r\n')), None)
+        self.assertEqual(map(type, received), [str])
+
+
+class CompactFormatTest(unittest.TestCase):
+    SAMPLE = {u'a': [1, 2.5, None, True], u'b': {u'c': u'\u043f\u0440\u0438\u0432\u0435\u0442'}}
+    
+    def test_marshal_roundtrip(self):
+        from tootwi.formats import CompactFormat
+        format = CompactFormat(use_msgpack=False)
+        encoded = format.encode(self.SAMPLE)
+        self.assertEqual(encoded[0], CompactFormat.MARSHAL)
+        self.assertEqual(CompactFormat().decode(encoded), self.SAMPLE)
+        self.assertEqual(format.decode(bytearray(encoded)), self.SAMPLE)
+    
+    def test_msgpack_roundtrip(self):
+        try:
+            import msgpack
+        except ImportError:
+            self.skipTest("msgpack is not installed.")
+        from tootwi.formats import CompactFormat
+        format = CompactFormat(use_msgpack=True)
+        encoded = format.encode(self.SAMPLE)
+        self.assertEqual(encoded[0], CompactFormat.MSGPACK)
+        self.assertEqual(CompactFormat(use_msgpack=False).decode(encoded), self.SAMPLE)
+    
+    def test_unknown_encoding_fails(self):
+        from tootwi.formats import CompactFormat
+        with self.assertRaises(ValueError):
+            CompactFormat().decode('{}')
 
 
 if __name__ == '__main__':
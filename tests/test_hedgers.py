@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+try:
+    import unittest2 as unittest # python-2 external dependency
+except:
+    import unittest # python-3 native module
+
+import time
+import StringIO
+import threading
+
+
+class SlowFirstTransport(object):
+    """ The first request is slow (or fails); the next ones are fast. Records the requests. """
+    def __init__(self, delay=1.0, error=None, hedge_delay=0):
+        super(SlowFirstTransport, self).__init__()
+        self.delay = delay
+        self.hedge_delay = hedge_delay
+        self.error = error
+        self.requests = []
+        self.lock = threading.Lock()
+    def __call__(self, request):
+        with self.lock:
+            index = len(self.requests)
+            self.requests.append(request)
+        if index == 0:
+            time.sleep(self.delay)
+            if self.error is not None:
+                raise self.error
+        else:
+            time.sleep(self.hedge_delay)
+        return StringIO.StringIO('{"index":%d}' % index)
+
+
+class QuantileHedgerTests(unittest.TestCase):
+    def test_delay_is_default_until_enough_samples(self):
+        from tootwi.hedgers import QuantileHedger
+        hedger = QuantileHedger(min_samples=10, default_delay=0.7)
+        self.assertEqual(hedger.delay('op'), 0.7)
+        for i in range(100):
+            hedger.record('op', i / 100.0)
+        self.assertAlmostEqual(hedger.delay('op'), 0.95)
+        self.assertEqual(hedger.delay('other'), 0.7)
+
+    def test_delay_is_clipped(self):
+        from tootwi.hedgers import QuantileHedger
+        hedger = QuantileHedger(min_samples=1, min_delay=0.1, max_delay=0.2)
+        hedger.record('op', 0.001)
+        self.assertEqual(hedger.delay('op'), 0.1)
+        hedger = QuantileHedger(min_samples=1, min_delay=0.1, max_delay=0.2)
+        hedger.record('op', 10)
+        self.assertEqual(hedger.delay('op'), 0.2)
+
+
+class APIHedgingTests(unittest.TestCase):
+    def make_credentials(self, transport, **kwargs):
+        from tootwi import API, TokenCredentials
+        from tootwi.hedgers import QuantileHedger
+        from tootwi.instruments import MemoryCollector
+        self.hedger = QuantileHedger(default_delay=0.05)
+        self.collector = MemoryCollector()
+        api = API(transport=transport, hedger=self.hedger, instrument=self.collector, **kwargs)
+        return TokenCredentials('ck', 'cs', 'tk', 'ts', api=api)
+
+    def test_slow_calls_are_hedged(self):
+        transport = SlowFirstTransport(delay=1.0)
+        credentials = self.make_credentials(transport)
+        started = time.time()
+        self.assertEqual(credentials.call(('GET', 'http://localhost/x')), {'index': 1})
+        self.assertTrue(time.time() - started < 0.5)
+        self.assertEqual(len(transport.requests), 2)
+        self.assertNotEqual(transport.requests[0].url, transport.requests[1].url) # signed anew, in the query.
+        self.assertEqual((self.hedger.hedged, self.hedger.won), (1, 1))
+        self.assertEqual(self.collector.snapshot()['http://localhost/x.json']['hedges'], 1)
+
+    def test_fast_calls_are_not_hedged(self):
+        transport = SlowFirstTransport(delay=0)
+        credentials = self.make_credentials(transport)
+        self.assertEqual(credentials.call(('GET', 'http://localhost/x')), {'index': 0})
+        self.assertEqual(len(transport.requests), 1)
+        self.assertEqual(self.hedger.hedged, 0)
+
+    def test_latencies_are_kept_per_url_template(self):
+        credentials = self.make_credentials(SlowFirstTransport(delay=0))
+        for id in range(5):
+            credentials.call(('GET', 'http://localhost/x/%(id)s'), dict(id=id))
+        self.assertEqual(self.hedger.latencies.keys(), ['http://localhost/x/%(id)s.json'])
+        self.assertEqual(len(self.hedger.latencies['http://localhost/x/%(id)s.json']), 5)
+
+    def test_workers_are_reused(self):
+        credentials = self.make_credentials(SlowFirstTransport(delay=0))
+        credentials.call(('GET', 'http://localhost/x'))
+        threads = threading.active_count()
+        for i in range(10):
+            credentials.call(('GET', 'http://localhost/x'))
+        self.assertEqual(threading.active_count(), threads)
+        self.assertEqual(self.hedger.idle, 1)
+
+    def test_writes_are_not_hedged(self):
+        transport = SlowFirstTransport(delay=0.2)
+        credentials = self.make_credentials(transport)
+        self.assertEqual(credentials.call(('POST', 'http://localhost/x')), {'index': 0})
+        self.assertEqual(len(transport.requests), 1)
+
+    def test_failed_first_call_waits_for_the_hedge(self):
+        transport = SlowFirstTransport(delay=0.1, error=IOError('reset'), hedge_delay=0.2)
+        credentials = self.make_credentials(transport)
+        self.assertEqual(credentials.call(('GET', 'http://localhost/x')), {'index': 1})
+
+    def test_hedges_are_throttled(self):
+        class CountingThrottler(object):
+            waits = 0
+            def wait(self):
+                self.waits += 1
+        throttler = CountingThrottler()
+        credentials = self.make_credentials(SlowFirstTransport(delay=0.3), throttler=throttler)
+        credentials.call(('GET', 'http://localhost/x'))
+        self.assertEqual(throttler.waits, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+try:
+    import unittest2 as unittest # python-2 external dependency
+except:
+    import unittest # python-3 native module
+
+import threading
+
+
+class FakeStream(object):
+    """
+    Pretends to be a stream: yields the given items, optionally waiting for
+    a permission to proceed before each item, and optionally failing at the end.
+    Counts how many times it was iterated (connected) and closed (disconnected).
+    """
+    def __init__(self, items, error=None, gate=None):
+        super(FakeStream, self).__init__()
+        self.items = items
+        self.error = error
+        self.gate = gate
+        self.iterations = 0
+        self.closes = 0
+
+    def __iter__(self):
+        self.iterations += 1
+        try:
+            for item in self.items:
+                if self.gate is not None:
+                    self.gate.wait()
+                yield item
+            if self.error is not None:
+                raise self.error
+        finally:
+            self.closes += 1
+
+
+class StreamHubTests(unittest.TestCase):
+    def test_all_subscribers_receive_all_items(self):
+        from tootwi.hubs import StreamHub
+        stream = FakeStream(range(10))
+        hub = StreamHub(stream)
+        subscriptions = [hub.subscribe() for i in range(3)]
+        hub.start()
+        for subscription in subscriptions:
+            self.assertEqual(list(subscription), range(10))
+        self.assertEqual(stream.iterations, 1)
+
+    def test_predicates_filter_items(self):
+        from tootwi.hubs import StreamHub
+        hub = StreamHub(FakeStream(range(10)))
+        odd = hub.subscribe(lambda item: item % 2)
+        even = hub.subscribe(lambda item: not item % 2)
+        hub.start()
+        self.assertEqual(list(odd), [1, 3, 5, 7, 9])
+        self.assertEqual(list(even), [0, 2, 4, 6, 8])
+
+    def test_drop_newest_policy(self):
+        from tootwi.hubs import StreamHub, Subscription
+        hub = StreamHub(FakeStream(range(10)))
+        subscription = hub.subscribe(maxsize=3, policy=Subscription.DROP_NEWEST)
+        hub.run() # synchronously, so nothing is consumed until the end, and the end marker must fit.
+        self.assertEqual(subscription.dropped, 7)
+        self.assertEqual(list(subscription), [0, 1, 2])
+
+    def test_drop_oldest_policy(self):
+        from tootwi.hubs import StreamHub, Subscription
+        hub = StreamHub(FakeStream(range(10)))
+        subscription = hub.subscribe(maxsize=3, policy=Subscription.DROP_OLDEST)
+        hub.run() # synchronously, so nothing is consumed until the end, and the end marker must fit.
+        self.assertEqual(subscription.dropped, 7)
+        self.assertEqual(list(subscription), [7, 8, 9])
+
+    def test_upstream_errors_are_reraised(self):
+        from tootwi.hubs import StreamHub
+        hub = StreamHub(FakeStream([1, 2], error=ValueError('upstream failed')))
+        subscription = hub.subscribe()
+        hub.start()
+        items = []
+        with self.assertRaises(ValueError):
+            for item in subscription:
+                items.append(item)
+        self.assertEqual(items, [1, 2])
+
+    def test_stop_finishes_subscriptions(self):
+        from tootwi.hubs import StreamHub
+        gate = threading.Event()
+        hub = StreamHub(FakeStream(range(10), gate=gate))
+        subscription = hub.subscribe()
+        with hub:
+            pass
+        gate.set()
+        self.assertEqual(list(subscription), [])
+
+    def test_stop_closes_the_stream(self):
+        from tootwi.hubs import StreamHub
+        gate = threading.Event()
+        stream = FakeStream(range(10), gate=gate)
+        hub = StreamHub(stream)
+        hub.start()
+        hub.stop()
+        gate.set()
+        hub.thread.join()
+        self.assertEqual(stream.iterations, 1)
+        self.assertEqual(stream.closes, 1)
+
+    def test_restart_while_previous_run_is_alive_fails(self):
+        from tootwi.hubs import StreamHub
+        from tootwi.errors import StreamHubRunningError
+        gate = threading.Event()
+        stream = FakeStream(range(10), gate=gate)
+        hub = StreamHub(stream)
+        hub.start()
+        hub.stop()
+        with self.assertRaises(StreamHubRunningError):
+            hub.start()
+        gate.set()
+        hub.stop(wait=True)
+        self.assertEqual(stream.iterations, 1)
+
+    def test_restart_after_previous_run_is_over(self):
+        from tootwi.hubs import StreamHub
+        stream = FakeStream(range(3))
+        hub = StreamHub(stream)
+        hub.start()
+        hub.stop(wait=True)
+        subscription = hub.subscribe()
+        hub.start()
+        self.assertEqual(list(subscription), range(3))
+        self.assertEqual(stream.iterations, 2)
+
+    def test_unknown_policy_fails(self):
+        from tootwi.hubs import StreamHub
+        with self.assertRaises(ValueError):
+            StreamHub(FakeStream([])).subscribe(policy='whatever')
+
+
+if __name__ == '__main__':
+    unittest.main()
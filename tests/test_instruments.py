@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+try:
+    import unittest2 as unittest # python-2 external dependency
+except:
+    import unittest # python-3 native module
+
+import StringIO
+
+
+LINES = ['{"id":1}\r\n', '\r\n', '{"id":2}\r\n', '{"id":3,"skip":1}\r\n']
+STREAM_URL = 'http://localhost/stream'
+
+
+class FakeTransport(object):
+    def __call__(self, request):
+        return StringIO.StringIO(''.join(LINES))
+
+
+class HistogramTests(unittest.TestCase):
+    def test_values_are_bucketed(self):
+        from tootwi.instruments import Histogram
+        histogram = Histogram((0.1, 1.0))
+        for value in [0.05, 0.1, 0.5, 5.0]:
+            histogram.add(value)
+        self.assertEqual(histogram.buckets, [2, 1, 1])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.total, 5.65)
+
+    def test_quantiles_are_bucket_bounds(self):
+        from tootwi.instruments import Histogram
+        histogram = Histogram((0.1, 1.0))
+        self.assertIsNone(histogram.quantile(0.5))
+        for value in [0.05] * 9 + [0.5]:
+            histogram.add(value)
+        self.assertEqual(histogram.quantile(0.5), 0.1)
+        self.assertEqual(histogram.quantile(0.99), 1.0)
+
+
+class MemoryCollectorTests(unittest.TestCase):
+    def setUp(self):
+        from tootwi import API, BasicCredentials
+        from tootwi.instruments import MemoryCollector
+        self.collector = MemoryCollector()
+        self.credentials = BasicCredentials('username', 'password', api=API(transport=FakeTransport(), instrument=self.collector))
+
+    def test_flow_is_measured(self):
+        items = list(self.credentials.flow(('GET', STREAM_URL)))
+        self.assertEqual(len(items), 4)
+        stats = self.collector.snapshot()[STREAM_URL + '.json']
+        self.assertEqual(stats['flows'], 1)
+        self.assertEqual(stats['messages'], 3)
+        self.assertEqual(stats['keepalives'], 1)
+        self.assertEqual(stats['bytes'], len(''.join(LINES)))
+        self.assertEqual(set(stats['phases']), set(['sign', 'connect', 'ttfb', 'read', 'decode']))
+        self.assertEqual(stats['phases']['decode']['count'], 4)
+
+    def test_prefiltered_lines_are_counted(self):
+        from tootwi.predicates import Substring
+        from tootwi.formats import PrefilteredFormat
+        list(self.credentials.flow(('GET', STREAM_URL, PrefilteredFormat(~Substring('"skip"')))))
+        stats = self.collector.snapshot()[STREAM_URL + '.json']
+        self.assertEqual((stats['messages'], stats['keepalives'], stats['filtered']), (2, 1, 1))
+
+    def test_decode_errors_are_counted(self):
+        def decode(line):
+            raise ValueError(line)
+        self.assertRaises(ValueError, list, self.credentials.flow(('GET', STREAM_URL, decode)))
+        self.assertEqual(self.collector.snapshot()[STREAM_URL]['decode_errors'], 1)
+
+    def test_call_is_measured(self):
+        self.credentials.call(('GET', STREAM_URL, lambda data: data))
+        stats = self.collector.snapshot()[STREAM_URL]
+        self.assertEqual((stats['calls'], stats['bytes']), (1, len(''.join(LINES))))
+        self.assertEqual(stats['phases']['read']['count'], 1)
+
+    def test_calls_are_grouped_by_url_template(self):
+        for id in [1, 2, 3]:
+            self.credentials.call(('GET', STREAM_URL + '/%(id)s', lambda data: data), dict(id=id))
+        snapshot = self.collector.snapshot()
+        self.assertEqual(snapshot[STREAM_URL + '/%(id)s']['calls'], 3)
+        self.assertEqual(len([operation for operation in snapshot if operation.startswith(STREAM_URL + '/')]), 1)
+
+    def test_stream_factory_is_measured(self):
+        from tootwi.streams import SampleStream
+        stream = SampleStream(self.credentials, lambda api, data: data)
+        self.assertEqual(len(list(stream)), 3)
+        stats = self.collector.snapshot()[self.credentials.api.invoke(SampleStream.OPEN_OPERATION).url]
+        self.assertEqual(stats['phases']['factory']['count'], 4)
+        self.assertIsNotNone(stats['messages_per_second'])
+
+
+if __name__ == '__main__':
+    unittest.main()
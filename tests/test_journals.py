@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+try:
+    import unittest2 as unittest # python-2 external dependency
+except:
+    import unittest # python-3 native module
+
+import os
+import shutil
+import tempfile
+
+
+class FakeAPI(object):
+    def __init__(self, messages):
+        self.messages = messages
+        self.api = self # as credentials do.
+        self.instrument = None
+
+    def flow(self, operation, params):
+        for message in self.messages:
+            if isinstance(message, Exception):
+                raise message
+            yield message
+
+
+class FakeStream(object):
+    def __init__(self, messages, factory=None):
+        self.api = FakeAPI(messages)
+        self.params = {}
+        self.factory = factory
+
+    def get_operation(self):
+        return ('GET', 'http://localhost/stream')
+
+
+class SegmentLogTests(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_messages_are_read_across_segments(self):
+        from tootwi.journals import SegmentLog
+        log = SegmentLog(self.folder, segment_size=64)
+        for i in range(10):
+            self.assertEqual(log.append('message %02d' % i), i)
+        self.assertGreater(len(log.segments), 1)
+        self.assertEqual([payload for index, payload in log.iterate(0, timeout=0)],
+                         ['message %02d' % i for i in range(10)])
+        self.assertEqual(log.read(7), (7, 'message 07'))
+        log.close()
+
+    def test_log_is_reopened(self):
+        from tootwi.journals import SegmentLog
+        log = SegmentLog(self.folder, segment_size=64)
+        for i in range(10):
+            log.append('message %02d' % i)
+        log.save_offset(4)
+        log.close()
+
+        log = SegmentLog(self.folder, segment_size=64)
+        self.assertEqual(log.tail, 10)
+        self.assertEqual(log.load_offset(), 4)
+        self.assertEqual(log.append('message 10'), 10)
+        self.assertEqual([index for index, payload in log.iterate(log.load_offset(), timeout=0)], range(4, 11))
+        log.close()
+
+    def test_disk_usage_is_bounded(self):
+        from tootwi.journals import SegmentLog
+        log = SegmentLog(self.folder, segment_size=64, max_segments=3)
+        for i in range(100):
+            log.append('message %02d' % i)
+        self.assertEqual(len([name for name in os.listdir(self.folder) if name.endswith('.seg')]), 3)
+        self.assertEqual(log.tail, 100)
+        index, payload = log.read(0)
+        self.assertEqual(index, log.head)
+        self.assertEqual(log.dropped, log.head)
+        log.close()
+
+    def test_oversized_messages_are_refused(self):
+        from tootwi.journals import SegmentLog
+        log = SegmentLog(self.folder, segment_size=64)
+        self.assertRaises(ValueError, log.append, 'x' * 61)
+        log.close()
+
+
+class DurableStreamTests(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_consumption_is_resumed(self):
+        from tootwi.journals import DurableStream
+        messages = [{'id': i} for i in range(10)]
+        stream = DurableStream(FakeStream(messages + [None]), self.folder, segment_size=128)
+        items = iter(stream)
+        self.assertEqual([items.next() for i in range(4)], messages[:4])
+        items.close() # the 4th item was not asked to be followed by the next one: not processed.
+        stream.close()
+
+        stream = DurableStream(FakeStream([{'id': 10}]), self.folder, segment_size=128)
+        items = iter(stream)
+        self.assertEqual([items.next() for i in range(8)], messages[3:] + [{'id': 10}])
+        items.close()
+        stream.close()
+
+    def test_factory_is_applied_on_consumption(self):
+        from tootwi.journals import DurableStream
+        factory = lambda api, data: data['id'] if data['id'] % 2 else None
+        stream = DurableStream(FakeStream([{'id': i} for i in range(6)], factory), self.folder)
+        items = iter(stream)
+        self.assertEqual([items.next() for i in range(3)], [1, 3, 5])
+        items.close()
+        stream.close()
+
+    def test_iteration_ends_with_the_connection(self):
+        from tootwi.journals import DurableStream
+        messages = [{'id': i} for i in range(5)]
+        stream = DurableStream(FakeStream(messages), self.folder)
+        self.assertEqual(list(stream), messages)
+        stream.close()
+
+    def test_connection_errors_are_raised_to_the_consumer(self):
+        from tootwi.journals import DurableStream
+        messages = [{'id': i} for i in range(3)]
+        stream = DurableStream(FakeStream(messages + [IOError('reset')]), self.folder)
+        items = iter(stream)
+        self.assertEqual([items.next() for i in range(3)], messages)
+        self.assertRaises(IOError, items.next)
+        stream.close()
+
+        stream = DurableStream(FakeStream([{'id': 3}]), self.folder) # resumed after a reconnect.
+        self.assertEqual(list(stream), [{'id': 3}])
+        stream.close()
+
+    def test_oversized_messages_are_raised_to_the_consumer(self):
+        from tootwi.journals import DurableStream
+        stream = DurableStream(FakeStream([{'id': 1}, {'text': 'x' * 200}]), self.folder, segment_size=128)
+        items = iter(stream)
+        self.assertEqual(items.next(), {'id': 1})
+        self.assertRaises(ValueError, items.next)
+        stream.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
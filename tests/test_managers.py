@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+try:
+    import unittest2 as unittest # python-2 external dependency
+except:
+    import unittest # python-3 native module
+
+import threading
+try:
+    import queue # python-3
+except ImportError:
+    import Queue as queue # python-2
+
+
+class FakeFeed(object):
+    """
+    Pretends to be an API with a stream endpoint: all connections made to it
+    are remembered, and each of them yields the same messages pushed to the feed.
+    """
+    def __init__(self):
+        super(FakeFeed, self).__init__()
+        self.connections = []
+        self.done = threading.Event()
+
+    def push(self, *items):
+        for connection in list(self.connections):
+            for item in items:
+                connection.queue.put(item)
+
+
+class FakeFilterStream(object):
+    def __init__(self, api, factory=None, follow=None, track=None, prefilter=None):
+        super(FakeFilterStream, self).__init__()
+        self.api = api
+        self.follow = follow
+        self.track = track
+        self.queue = queue.Queue()
+        self.closed = threading.Event()
+        api.connections.append(self)
+
+    def __iter__(self):
+        try:
+            while not self.api.done.is_set():
+                try:
+                    yield self.queue.get(timeout=0.05)
+                except queue.Empty:
+                    pass
+        finally:
+            self.closed.set()
+
+
+class ManagedFilterStreamTests(unittest.TestCase):
+    def setUp(self):
+        from tootwi.managers import ManagedFilterStream
+        class FakeManagedFilterStream(ManagedFilterStream):
+            STREAM_CLASS = FakeFilterStream
+            TICK = 0.05
+        self.feed = FakeFeed()
+        self.stream_class = FakeManagedFilterStream
+
+    def tearDown(self):
+        self.feed.done.set()
+        for connection in self.feed.connections:
+            connection.closed.wait(1.0)
+
+    def wait_for_connections(self, count):
+        for i in range(100):
+            if len(self.feed.connections) >= count:
+                return
+            threading.Event().wait(0.01)
+
+    def test_initial_connection(self):
+        stream = self.stream_class(self.feed, follow=[2, 1], track=['hello'])
+        iterator = iter(stream)
+        items = []
+        thread = threading.Thread(target=lambda: items.append(next(iterator)))
+        thread.start()
+        self.wait_for_connections(1)
+        self.feed.push({'id': 1})
+        thread.join()
+        self.assertEqual(items, [{'id': 1}])
+        self.assertEqual(len(self.feed.connections), 1)
+        self.assertEqual(self.feed.connections[0].follow, ['1', '2'])
+        self.assertEqual(self.feed.connections[0].track, ['hello'])
+
+    def test_duplicates_are_skipped(self):
+        stream = self.stream_class(self.feed, follow=[1])
+        iterator = iter(stream)
+        items = []
+        thread = threading.Thread(target=lambda: items.extend([next(iterator), next(iterator)]))
+        thread.start()
+        self.wait_for_connections(1)
+        self.feed.push({'id': 1}, {'id': 1}, {'id': 2})
+        thread.join()
+        self.assertEqual(items, [{'id': 1}, {'id': 2}])
+
+    def test_changes_cause_reconnect_with_overlap(self):
+        stream = self.stream_class(self.feed, follow=[1], interval=0, overlap=60)
+        iterator = iter(stream)
+        items = []
+        thread = threading.Thread(target=lambda: items.extend([next(iterator), next(iterator)]))
+        thread.start()
+        self.wait_for_connections(1)
+        stream.add_follow(2, 3)
+        stream.remove_follow(1)
+        self.wait_for_connections(2)
+        self.feed.push({'id': 10}, {'id': 11}) # both connections receive both messages.
+        thread.join()
+        self.assertEqual(items, [{'id': 10}, {'id': 11}])
+        self.assertEqual(self.feed.connections[1].follow, ['2', '3'])
+        self.assertFalse(self.feed.connections[0].closed.is_set()) # still overlapping.
+
+    def test_reconnects_are_rate_limited(self):
+        stream = self.stream_class(self.feed, follow=[1], interval=60)
+        iterator = iter(stream)
+        thread = threading.Thread(target=lambda: next(iterator))
+        thread.start()
+        self.wait_for_connections(1)
+        stream.add_follow(2)
+        threading.Event().wait(0.2)
+        self.feed.push({'id': 1})
+        thread.join()
+        self.assertEqual(len(self.feed.connections), 1)
+
+    def test_no_connection_without_filters(self):
+        stream = self.stream_class(self.feed, interval=0)
+        iterator = iter(stream)
+        thread = threading.Thread(target=lambda: next(iterator))
+        thread.start()
+        threading.Event().wait(0.2)
+        self.assertEqual(len(self.feed.connections), 0)
+        stream.add_track('hello')
+        self.wait_for_connections(1)
+        self.feed.push({'id': 1})
+        thread.join()
+        self.assertEqual(self.feed.connections[0].track, ['hello'])
+
+    def test_first_connection_is_not_rate_limited(self):
+        stream = self.stream_class(self.feed, interval=60)
+        iterator = iter(stream)
+        thread = threading.Thread(target=lambda: next(iterator))
+        thread.start()
+        threading.Event().wait(0.1)
+        stream.add_follow(1)
+        self.wait_for_connections(1)
+        self.assertEqual(len(self.feed.connections), 1)
+        self.feed.push({'id': 1})
+        thread.join()
+        self.assertEqual(self.feed.connections[0].follow, ['1'])
+
+
+
+class ShardedFilterStreamTests(unittest.TestCase):
+    def setUp(self):
+        from tootwi.managers import ManagedFilterStream, ShardedFilterStream
+        class FakeManagedFilterStream(ManagedFilterStream):
+            STREAM_CLASS = FakeFilterStream
+            TICK = 0.05
+        class FakeShardedFilterStream(ShardedFilterStream):
+            SHARD_CLASS = FakeManagedFilterStream
+            TICK = 0.05
+        self.feeds = [FakeFeed() for i in range(3)]
+        self.stream_class = FakeShardedFilterStream
+
+    def tearDown(self):
+        for feed in self.feeds:
+            feed.done.set()
+            for connection in feed.connections:
+                connection.closed.wait(1.0)
+
+    def wait_for_connections(self, feed, count):
+        for i in range(100):
+            if len(feed.connections) >= count:
+                return
+            threading.Event().wait(0.01)
+
+    def test_follows_are_partitioned(self):
+        stream = self.stream_class(self.feeds, follow=range(5), shard_size=2)
+        self.assertEqual(len(stream.shards), 3)
+        self.assertEqual(sorted([len(shard.follow) for shard in stream.shards]), [1, 2, 2])
+        self.assertEqual(set.union(*[shard.follow for shard in stream.shards]), set([unicode(i) for i in range(5)]))
+
+    def test_new_follows_go_to_least_loaded_shards(self):
+        stream = self.stream_class(self.feeds, follow=range(3), shard_size=2)
+        stream.remove_follow(0, 1)
+        stream.add_follow(10)
+        self.assertEqual(len(stream.shards), 2)
+        self.assertEqual([len(shard.follow) for shard in stream.shards], [1, 1])
+
+    def test_duplicate_follows_are_ignored(self):
+        stream = self.stream_class(self.feeds, follow=range(2), shard_size=2)
+        stream.add_follow(0, 1)
+        self.assertEqual(len(stream.shards), 1)
+
+    def test_exhausted_credentials_fail(self):
+        from tootwi.errors import StreamShardsExhaustedError
+        stream = self.stream_class(self.feeds, follow=range(6), shard_size=2)
+        with self.assertRaises(StreamShardsExhaustedError):
+            stream.add_follow(6)
+        self.assertEqual(sum([len(shard.follow) for shard in stream.shards]), 6)
+
+    def test_shards_are_merged_and_deduplicated(self):
+        stream = self.stream_class(self.feeds, follow=range(4), shard_size=2)
+        iterator = iter(stream)
+        items = []
+        thread = threading.Thread(target=lambda: items.extend([next(iterator), next(iterator)]))
+        thread.start()
+        self.wait_for_connections(self.feeds[0], 1)
+        self.wait_for_connections(self.feeds[1], 1)
+        self.feeds[0].push({'id': 1})
+        self.feeds[1].push({'id': 1})
+        self.feeds[1].push({'id': 2})
+        thread.join()
+        self.assertEqual(sorted(items), [{'id': 1}, {'id': 2}])
+
+    def test_new_shards_connect_with_their_follows(self):
+        stream = self.stream_class(self.feeds, follow=[0], shard_size=1, interval=60)
+        iterator = iter(stream)
+        items = []
+        thread = threading.Thread(target=lambda: items.append(next(iterator)))
+        thread.start()
+        self.wait_for_connections(self.feeds[0], 1)
+        stream.add_follow(1)
+        self.wait_for_connections(self.feeds[1], 1)
+        self.feeds[1].push({'id': 1})
+        thread.join()
+        self.assertEqual(items, [{'id': 1}])
+        self.assertEqual([connection.follow for connection in self.feeds[1].connections], [['1']])
+
+    def test_idle_shards_are_stopped_on_exit(self):
+        stream = self.stream_class(self.feeds, follow=range(4), shard_size=2)
+        iterator = iter(stream)
+        thread = threading.Thread(target=lambda: next(iterator))
+        thread.start()
+        self.wait_for_connections(self.feeds[0], 1)
+        self.wait_for_connections(self.feeds[1], 1)
+        self.feeds[0].push({'id': 1})
+        thread.join()
+        readers = list(stream.readers.values())
+        iterator.close()
+        for reader in readers:
+            reader.thread.join(1.0)
+            self.assertFalse(reader.thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
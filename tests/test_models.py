@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+try:
+    import unittest2 as unittest # python-2 external dependency
+except:
+    import unittest # python-3 native module
+
+
+STATUS = {'id': 1, 'text': u'hello', 'lang': 'en', 'user': {'id': 10, 'screen_name': 'someone', 'lang': 'ru'}}
+
+
+class ProjectionTests(unittest.TestCase):
+    def test_top_level_fields(self):
+        from tootwi.models import project
+        self.assertEqual(project(STATUS, ['id', 'text', 'missing']), {'id': 1, 'text': u'hello'})
+
+    def test_embedded_fields(self):
+        from tootwi.models import project
+        self.assertEqual(project(STATUS, ['id', 'user.id']), {'id': 1, 'user': {'id': 10}})
+        self.assertEqual(project(STATUS, ['user.id', 'user']), {'user': STATUS['user']})
+
+    def test_lists_are_projected_by_items(self):
+        from tootwi.models import project
+        self.assertEqual(project([STATUS, STATUS], ['id']), [{'id': 1}, {'id': 1}])
+
+
+class SerializationTests(unittest.TestCase):
+    def test_item_roundtrip(self):
+        from tootwi.models import Status, Item
+        status = Status(None, STATUS)
+        api = object()
+        restored = Item.deserialize(api, status.serialize())
+        self.assertIs(restored.__class__, Status)
+        self.assertIs(restored.api, api)
+        self.assertEqual(restored.data, STATUS)
+
+    def test_projected_item(self):
+        from tootwi.models import Status
+        restored = Status.deserialize(None, Status(None, STATUS).serialize(fields=['text', 'user.screen_name']))
+        self.assertEqual(restored.data, {'text': u'hello', 'user': {'screen_name': 'someone'}})
+
+    def test_list_roundtrip_keeps_params(self):
+        from tootwi.models import UsersLookup, Model
+        lookup = UsersLookup(None, [STATUS['user']], user_id=[10, 20])
+        restored = Model.deserialize(None, lookup.serialize(fields=['id']))
+        self.assertIs(restored.__class__, UsersLookup)
+        self.assertEqual(restored.params, lookup.params)
+        self.assertEqual(restored.data, [{'id': 10}])
+
+    def test_wrong_class_is_refused(self):
+        from tootwi.models import Status, User
+        from tootwi.errors import ModelClassError
+        with self.assertRaises(ModelClassError):
+            User.deserialize(None, Status(None, STATUS).serialize())
+
+    def test_modules_are_not_imported(self):
+        import sys
+        from tootwi.models import Model
+        from tootwi.errors import ModelClassError
+        encoded = Model.CODEC().encode(['antigravity.Model', {}, None, False])
+        with self.assertRaises(ModelClassError):
+            Model.deserialize(None, encoded)
+        self.assertNotIn('antigravity', sys.modules)
+
+
+class ItemProjectionTests(unittest.TestCase):
+    RETWEET = dict(STATUS, id=2, junk=[1, 2, 3], retweeted_status=dict(STATUS, junk=True))
+
+    def test_fields_are_kept_recursively(self):
+        from tootwi.models import Status
+        data = Status.project(self.RETWEET)
+        self.assertNotIn('junk', data)
+        self.assertNotIn('junk', data['retweeted_status'])
+        self.assertEqual(data['user'], {'id': 10, 'screen_name': 'someone', 'lang': 'ru'})
+        self.assertEqual(data['retweeted_status']['text'], u'hello')
+
+    def test_items_without_fields_are_kept_whole(self):
+        from tootwi.models import Item
+        self.assertIs(Item.project(self.RETWEET), self.RETWEET)
+
+    def test_slots(self):
+        from tootwi.models import Status, SlottedData
+        status = Status(None, Status.project(self.RETWEET, slots=True))
+        self.assertIsInstance(status.data, SlottedData)
+        self.assertIsInstance(status['user'], SlottedData)
+        self.assertEqual(status['text'], u'hello')
+        self.assertEqual(status['user']['screen_name'], 'someone')
+        self.assertEqual(status.data.get('coordinates', 'none'), 'none')
+        self.assertNotIn('junk', status.data)
+        with self.assertRaises(KeyError):
+            status.data['junk'] = 1
+        self.assertEqual(status.get_user()['id'], 10)
+        self.assertEqual(Status.deserialize(None, status.serialize()).data['user'], STATUS['user'])
+
+    def test_list_items_are_projected(self):
+        from tootwi.models import PublicTimeline
+        timeline = PublicTimeline(None, [self.RETWEET])
+        timeline.loaded = True
+        self.assertIn('junk', timeline[0].data)
+        timeline.PROJECT = timeline.SLOTS = True
+        self.assertNotIn('junk', timeline[0].data)
+        self.assertEqual(timeline[0]['id'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+try:
+    import unittest2 as unittest # python-2 external dependency
+except:
+    import unittest # python-3 native module
+
+import time
+import threading
+
+
+class FakeSource(object):
+    def __init__(self, name, per_sync=1):
+        self.name = name
+        self.per_sync = per_sync
+
+    def sync(self):
+        return [self.name] * self.per_sync
+
+
+class FakeListAPI(object):
+    def __init__(self, ids):
+        self.ids = ids
+
+    def call(self, operation, params):
+        return [dict(id=i) for i in self.ids]
+
+
+class PollJobTests(unittest.TestCase):
+    def test_interval_adapts_to_rate(self):
+        from tootwi.pollers import PollJob
+        job = PollJob(None, interval=60, min_interval=1, max_interval=1000, target=10, smoothing=1.0)
+        job.adapt(5, 1000.0) # first poll: 5 items in the initial interval.
+        job.adapt(20, 1010.0) # 2 items per second.
+        self.assertEqual(job.rate, 2.0)
+        self.assertEqual(job.interval, 5.0)
+        job.adapt(0, 1015.0) # no new items: backoff.
+        self.assertEqual(job.interval, 7.5)
+
+    def test_first_poll_seeds_the_interval(self):
+        from tootwi.pollers import PollJob
+        job = PollJob(None, interval=60, min_interval=1, max_interval=1000, target=10)
+        job.adapt(60, 1000.0) # 1 item per second.
+        self.assertEqual(job.rate, 1.0)
+        self.assertEqual(job.interval, 10.0)
+
+    def test_interval_is_clamped(self):
+        from tootwi.pollers import PollJob
+        job = PollJob(None, interval=60, min_interval=30, max_interval=100, target=10, smoothing=1.0)
+        job.adapt(1, 0.0)
+        job.adapt(1000, 10.0)
+        self.assertEqual(job.interval, 30)
+        for i in range(10):
+            job.adapt(0, 20.0 + i)
+        self.assertEqual(job.interval, 100)
+
+    def test_list_models_are_compared_by_ids(self):
+        from tootwi.pollers import PollJob
+        from tootwi.models import PublicTimeline
+        api = FakeListAPI([3, 2, 1])
+        job = PollJob(PublicTimeline(api))
+        self.assertEqual(len(job.poll()), 3)
+        api.ids = [5, 4, 3, 2]
+        self.assertEqual([item['id'] for item in job.poll()], [5, 4])
+
+    def test_productive_jobs_go_first(self):
+        from tootwi.pollers import PollJob
+        now = time.time()
+        hot, cold, new = PollJob(None), PollJob(None), PollJob(None)
+        hot.rate, hot.polled_at = 10.0, now - 10
+        cold.rate, cold.polled_at = 0.1, now - 100
+        self.assertEqual(sorted([cold, hot, new], key=lambda job: -job.expected(now)), [new, hot, cold])
+
+
+class PollSchedulerTests(unittest.TestCase):
+    def test_jobs_are_polled_and_rescheduled(self):
+        from tootwi.pollers import PollJob, PollScheduler
+        received = []
+        done = threading.Event()
+        def callback(job, items):
+            received.extend(items)
+            if len(received) >= 4:
+                done.set()
+        scheduler = PollScheduler(workers=2)
+        for name in 'ab':
+            scheduler.add(PollJob(FakeSource(name), callback, interval=0.01, min_interval=0.01, max_interval=0.01))
+        scheduler.start()
+        try:
+            self.assertTrue(done.wait(5))
+        finally:
+            scheduler.stop()
+        self.assertEqual(set(received), set('ab'))
+        metrics = scheduler.metrics()
+        self.assertGreaterEqual(metrics['polls'], 4)
+        self.assertEqual(metrics['scheduled'] + metrics['ready'], 2)
+        self.assertEqual(metrics['items_per_poll'], 1.0)
+
+    def test_failed_polls_are_counted_and_backed_off(self):
+        from tootwi.pollers import PollJob, PollScheduler
+        class Failing(object):
+            def sync(self):
+                raise IOError("failed")
+        scheduler = PollScheduler(workers=1)
+        job = PollJob(Failing(), interval=10, max_interval=100)
+        scheduler.run(job)
+        self.assertEqual((job.errors, scheduler.errors), (1, 1))
+        self.assertEqual(job.interval, 15)
+        self.assertEqual(scheduler.metrics()['scheduled'], 1)
+
+    def test_readded_jobs_are_scheduled_once(self):
+        from tootwi.pollers import PollJob, PollScheduler
+        scheduler = PollScheduler(workers=1)
+        job = PollJob(FakeSource('a'))
+        scheduler.add(job, due=time.time() - 5)
+        scheduler.remove(job)
+        scheduler.add(job, due=time.time() - 5)
+        scheduler.promote(time.time())
+        self.assertEqual([entry[-1] for entry in scheduler.ready], [job])
+        self.assertEqual(scheduler.metrics()['ready'], 1)
+
+    def test_jobs_readded_while_polled_are_not_rescheduled_twice(self):
+        from tootwi.pollers import PollJob, PollScheduler
+        scheduler = PollScheduler(workers=1)
+        job = PollJob(FakeSource('a'))
+        scheduler.add(job)
+        generation = job.generation
+        scheduler.remove(job) # during the poll.
+        scheduler.add(job)
+        scheduler.run(job, generation)
+        metrics = scheduler.metrics()
+        self.assertEqual(metrics['scheduled'] + metrics['ready'], 1)
+
+    def test_removed_jobs_are_not_rescheduled(self):
+        from tootwi.pollers import PollJob, PollScheduler
+        scheduler = PollScheduler(workers=1)
+        job = PollJob(FakeSource('a'))
+        scheduler.add(job)
+        generation = job.generation
+        scheduler.remove(job)
+        scheduler.run(job, generation)
+        metrics = scheduler.metrics()
+        self.assertEqual(metrics['scheduled'] + metrics['ready'], 0)
+
+    def test_lag_is_reported(self):
+        from tootwi.pollers import PollJob, PollScheduler
+        scheduler = PollScheduler(workers=1)
+        scheduler.add(PollJob(FakeSource('a')), due=time.time() - 5)
+        metrics = scheduler.metrics()
+        self.assertEqual(metrics['ready'], 1)
+        self.assertGreaterEqual(metrics['lag'], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
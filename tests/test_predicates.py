@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+try:
+    import unittest2 as unittest # python-2 external dependency
+except:
+    import unittest # python-3 native module
+
+import json
+
+
+ENGLISH = '{"id":1,"text":"I like #python","lang":"en","user":{"id":10,"lang":"ru"}}'
+RUSSIAN = '{"id":2,"text":"I like #django","lang":"ru","user":{"id":20,"lang":"en"}}'
+NUMBERS = '{"id":123,"text":"hello","in_reply_to_user_id":1234}'
+
+
+class PredicatesTests(unittest.TestCase):
+    def accepts(self, predicate, line):
+        """ The same two-stage logic as in PrefilteredFormat. """
+        if not predicate(line):
+            return False
+        return predicate.exact or predicate.verify(line, json.loads(line))
+
+    def test_substring(self):
+        from tootwi.predicates import Substring
+        self.assertTrue(self.accepts(Substring('#python'), ENGLISH))
+        self.assertFalse(self.accepts(Substring('#python'), RUSSIAN))
+
+    def test_regex(self):
+        from tootwi.predicates import Regex
+        self.assertTrue(self.accepts(Regex(r'#(python|django)\b'), ENGLISH))
+        self.assertTrue(self.accepts(Regex(r'#(python|django)\b'), RUSSIAN))
+        self.assertFalse(self.accepts(Regex(r'#ruby\b'), RUSSIAN))
+
+    def test_field_equals_is_verified(self):
+        from tootwi.predicates import FieldEquals
+        predicate = FieldEquals('lang', 'en')
+        self.assertTrue(predicate(RUSSIAN)) # raw stage matches "lang":"en" of the user.
+        self.assertTrue(self.accepts(predicate, ENGLISH))
+        self.assertFalse(self.accepts(predicate, RUSSIAN))
+
+    def test_field_equals_with_path(self):
+        from tootwi.predicates import FieldEquals
+        self.assertTrue(self.accepts(FieldEquals('user.lang', 'en'), RUSSIAN))
+        self.assertFalse(self.accepts(FieldEquals('user.lang', 'en'), ENGLISH))
+
+    def test_field_equals_with_numbers(self):
+        from tootwi.predicates import FieldEquals
+        self.assertTrue(FieldEquals('id', 123)(NUMBERS))
+        self.assertFalse(FieldEquals('id', 12)(NUMBERS))
+        self.assertFalse(FieldEquals('in_reply_to_user_id', 123)(NUMBERS))
+
+    def test_field_equals_with_differently_encoded_values(self):
+        from tootwi.predicates import FieldEquals
+        predicate = FieldEquals('lang', u'\u043f')
+        self.assertTrue(self.accepts(predicate, u'{"lang":"\u043f"}'.encode('utf-8'))) # raw UTF-8.
+        self.assertTrue(self.accepts(predicate, '{"lang":"\\u043f"}')) # escaped.
+        self.assertFalse(self.accepts(predicate, '{"lang":"en"}'))
+        predicate = FieldEquals('url', 'http://t.co/x')
+        self.assertTrue(self.accepts(predicate, '{"url":"http:\\/\\/t.co\\/x"}'))
+        self.assertTrue(self.accepts(predicate, '{"url":"http://t.co/x"}'))
+
+    def test_combinations(self):
+        from tootwi.predicates import Substring, FieldEquals, All, Any, Not
+        both = Substring('#python') & FieldEquals('lang', 'en')
+        either = Substring('#django') | FieldEquals('lang', 'en')
+        neither = ~FieldEquals('lang', 'en')
+        self.assertIsInstance(both, All)
+        self.assertIsInstance(either, Any)
+        self.assertIsInstance(neither, Not)
+        self.assertEqual([self.accepts(both, line) for line in [ENGLISH, RUSSIAN]], [True, False])
+        self.assertEqual([self.accepts(either, line) for line in [ENGLISH, RUSSIAN]], [True, True])
+        self.assertEqual([self.accepts(neither, line) for line in [ENGLISH, RUSSIAN]], [False, True])
+
+    def test_exact_negation_is_raw(self):
+        from tootwi.predicates import Substring
+        predicate = ~Substring('#python')
+        self.assertTrue(predicate.exact)
+        self.assertFalse(predicate(ENGLISH))
+        self.assertTrue(predicate(RUSSIAN))
+
+
+class PrefilteredFormatTests(unittest.TestCase):
+    def test_lines_are_skipped_before_decoding(self):
+        from tootwi.formats import PrefilteredFormat
+        from tootwi.predicates import FieldEquals
+        decoded = []
+        def decode(data):
+            decoded.append(data)
+            return json.loads(data)
+        format = PrefilteredFormat(FieldEquals('lang', 'en'), decode)
+        self.assertEqual(format.decode(ENGLISH)['id'], 1)
+        self.assertIsNone(format.decode(RUSSIAN)) # decoded, but not verified.
+        self.assertIsNone(format.decode(NUMBERS)) # not even decoded.
+        self.assertEqual(len(decoded), 2)
+
+    def test_stream_combines_factory_and_prefilter(self):
+        from tootwi.streams import SampleStream, TypedMessageFactory
+        from tootwi.predicates import Substring
+        from tootwi.models import Status
+        stream = SampleStream(None, TypedMessageFactory(accept=[Status]), prefilter=Substring('#python'))
+        format = stream.get_operation()[2]
+        self.assertIsNotNone(format.decode(ENGLISH))
+        self.assertIsNone(format.decode(RUSSIAN))
+        self.assertIsNone(format.decode('{"delete":{"status":{"id":1}},"#python":1}'))
+
+
+if __name__ == '__main__':
+    unittest.main()
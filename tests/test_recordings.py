@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+try:
+    import unittest2 as unittest # python-2 external dependency
+except:
+    import unittest # python-3 native module
+
+import os
+import time
+import shutil
+import tempfile
+import StringIO
+
+
+LINES = ['{"id":1,"text":"hello"}\r\n', '\r\n', '{"id":2,"text":"world"}\r\n']
+
+
+class FakeTransport(object):
+    def __init__(self):
+        self.timeouts = []
+    def __call__(self, request, timeout=None):
+        self.timeouts.append(timeout)
+        return StringIO.StringIO(''.join(LINES))
+
+
+class RecordingTests(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def record(self, filename):
+        from tootwi import API, BasicCredentials
+        from tootwi.recordings import RecordingTransport
+        path = os.path.join(self.folder, filename)
+        transport = RecordingTransport(FakeTransport(), path)
+        credentials = BasicCredentials('username', 'password', api=API(transport=transport))
+        items = list(credentials.flow(('GET', 'http://localhost/stream')))
+        transport.close()
+        return path, items
+
+    def replay(self, path, speed=None):
+        from tootwi import API, BasicCredentials
+        from tootwi.recordings import ReplayTransport
+        credentials = BasicCredentials('username', 'password', api=API(transport=ReplayTransport(path, speed=speed)))
+        return list(credentials.flow(('GET', 'http://localhost/stream')))
+
+    def test_records_are_written(self):
+        from tootwi.recordings import RecordingReader
+        path, items = self.record('plain.rec')
+        reader = RecordingReader(path)
+        self.assertEqual([line for timestamp, line in reader], LINES)
+        reader.close()
+
+    def test_replay_at_max_speed(self):
+        path, items = self.record('plain.rec')
+        self.assertEqual(self.replay(path), items)
+        self.assertEqual(items, [{'id': 1, 'text': 'hello'}, None, {'id': 2, 'text': 'world'}])
+
+    def test_replay_compressed(self):
+        path, items = self.record('compressed.rec.gz')
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(2), '\x1f\x8b') # gzip magic
+        self.assertEqual(self.replay(path), items)
+
+    def test_replay_with_timing(self):
+        from tootwi.recordings import RecordingWriter
+        path = os.path.join(self.folder, 'timed.rec')
+        writer = RecordingWriter(path)
+        writer.write(LINES[0], timestamp=1000.0)
+        writer.write(LINES[2], timestamp=1001.0)
+        writer.close()
+        started = time.time()
+        self.assertEqual(len(self.replay(path, speed=5)), 2)
+        self.assertGreaterEqual(time.time() - started, 0.19)
+
+    def test_calls_with_timeouts_are_recorded_and_replayed(self):
+        from tootwi import API, BasicCredentials
+        from tootwi.recordings import RecordingTransport, ReplayTransport
+        path = os.path.join(self.folder, 'call.rec')
+        fake = FakeTransport()
+        transport = RecordingTransport(fake, path)
+        credentials = BasicCredentials('username', 'password', api=API(transport=transport, timeout=5.0))
+        self.assertEqual(credentials.call(('GET', 'http://localhost/call', lambda body: body)).rstrip(), ''.join(LINES).rstrip())
+        transport.close()
+        self.assertTrue(0 < fake.timeouts[0] <= 5.0)
+        credentials = BasicCredentials('username', 'password', api=API(transport=ReplayTransport(path), timeout=5.0))
+        self.assertEqual(credentials.call(('GET', 'http://localhost/call', lambda body: body)).rstrip(), ''.join(LINES).rstrip())
+
+    def test_appended_recordings_are_replayed_as_one(self):
+        path, items = self.record('appended.rec.gz')
+        path, items = self.record('appended.rec.gz')
+        self.assertEqual(self.replay(path), items + items)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+try:
+    import unittest2 as unittest # python-2 external dependency
+except:
+    import unittest # python-3 native module
+
+import time
+import socket
+import StringIO
+import email.utils
+from server import HTTPServer
+
+
+class FailingTransport(object):
+    """ Fails the first requests with the given errors; records the requests. """
+    def __init__(self, errors, body='{"id":1}'):
+        super(FailingTransport, self).__init__()
+        self.errors = list(errors)
+        self.body = body
+        self.requests = []
+    def __call__(self, request):
+        self.requests.append(request)
+        if self.errors:
+            raise self.errors.pop(0)
+        return StringIO.StringIO(self.body)
+
+
+def server_error(code, headers=None):
+    from tootwi.transports import TransportServerError
+    return TransportServerError('HTTP Error %d' % code, code, 'failure', headers)
+
+
+class BackoffRetrierTests(unittest.TestCase):
+    def test_server_errors_are_retried_with_jitter(self):
+        from tootwi.retriers import BackoffRetrier
+        retrier = BackoffRetrier(attempts=4, base=1.0, cap=3.0)
+        for i in range(100):
+            self.assertTrue(0 <= retrier.delay(1, 'GET', server_error(503)) <= 1.0)
+            self.assertTrue(0 <= retrier.delay(3, 'GET', server_error(503)) <= 3.0)
+        self.assertIsNone(retrier.delay(4, 'GET', server_error(503)))
+
+    def test_client_errors_are_not_retried(self):
+        from tootwi.retriers import BackoffRetrier
+        retrier = BackoffRetrier()
+        self.assertIsNone(retrier.delay(1, 'GET', server_error(404)))
+        self.assertIsNone(retrier.delay(1, 'GET', server_error(401)))
+
+    def test_only_idempotent_methods_are_retried_on_failures(self):
+        from tootwi.retriers import BackoffRetrier
+        retrier = BackoffRetrier()
+        self.assertIsNone(retrier.delay(1, 'POST', server_error(503)))
+        self.assertIsNone(retrier.delay(1, 'POST', socket.error('reset')))
+        self.assertIsNotNone(retrier.delay(1, 'POST', server_error(429)))
+        self.assertIsNotNone(retrier.delay(1, 'GET', socket.error('reset')))
+
+    def test_retry_after_is_honored(self):
+        from tootwi.retriers import BackoffRetrier
+        retrier = BackoffRetrier(max_wait=60)
+        self.assertEqual(retrier.delay(1, 'GET', server_error(503, {'Retry-After': '7'})), 7.0)
+        date = email.utils.formatdate(time.time() + 30, usegmt=True)
+        self.assertTrue(25 <= retrier.delay(1, 'GET', server_error(429, {'Retry-After': date})) <= 30)
+        reset = str(int(time.time()) + 10)
+        self.assertTrue(5 <= retrier.delay(1, 'GET', server_error(429, {'X-RateLimit-Reset': reset})) <= 10)
+
+    def test_rate_limit_reset_is_ignored_for_server_errors(self):
+        from tootwi.retriers import BackoffRetrier
+        retrier = BackoffRetrier(base=1.0, max_wait=60)
+        reset = str(int(time.time()) + 3600)
+        for i in range(100):
+            self.assertTrue(0 <= retrier.delay(1, 'GET', server_error(503, {'X-RateLimit-Reset': reset})) <= 1.0)
+
+    def test_too_long_waits_are_not_retried(self):
+        from tootwi.retriers import BackoffRetrier
+        retrier = BackoffRetrier(max_wait=60)
+        self.assertIsNone(retrier.delay(1, 'GET', server_error(503, {'Retry-After': '3600'})))
+
+
+class APIRetryTests(unittest.TestCase):
+    def make_credentials(self, transport, **kwargs):
+        from tootwi import API, TokenCredentials
+        from tootwi.retriers import BackoffRetrier
+        retrier = BackoffRetrier(base=0.001, **kwargs)
+        return TokenCredentials('ck', 'cs', 'tk', 'ts', api=API(transport=transport, retrier=retrier))
+
+    def test_failed_calls_are_retried_and_resigned(self):
+        transport = FailingTransport([server_error(503), socket.error('reset')])
+        credentials = self.make_credentials(transport)
+        self.assertEqual(credentials.call(('GET', 'http://localhost/x')), {'id': 1})
+        self.assertEqual(len(transport.requests), 3)
+        signatures = set([request.headers.get('Authorization') or request.url for request in transport.requests])
+        self.assertEqual(len(signatures), 3) # fresh nonce for every attempt.
+
+    def test_exhausted_retries_raise_the_last_error(self):
+        from tootwi.transports import TransportServerError
+        transport = FailingTransport([server_error(503)] * 5)
+        credentials = self.make_credentials(transport, attempts=3)
+        self.assertRaises(TransportServerError, credentials.call, ('GET', 'http://localhost/x'))
+        self.assertEqual(len(transport.requests), 3)
+
+    def test_broken_responses_are_retried(self):
+        import httplib
+        transport = FailingTransport([httplib.BadStatusLine(''), httplib.IncompleteRead('')])
+        credentials = self.make_credentials(transport)
+        self.assertEqual(credentials.call(('GET', 'http://localhost/x')), {'id': 1})
+        self.assertEqual(len(transport.requests), 3)
+
+    def test_not_retried_errors_are_handled_as_usual(self):
+        from tootwi.errors import OperationNotFoundError
+        transport = FailingTransport([server_error(404)])
+        credentials = self.make_credentials(transport)
+        self.assertRaises(OperationNotFoundError, credentials.call, ('GET', 'http://localhost/x'))
+        self.assertEqual(len(transport.requests), 1)
+
+    def test_retries_are_throttled_and_counted(self):
+        from tootwi import API, BasicCredentials
+        from tootwi.retriers import BackoffRetrier
+        from tootwi.instruments import MemoryCollector
+        class CountingThrottler(object):
+            waits = 0
+            def wait(self):
+                self.waits += 1
+        throttler, collector = CountingThrottler(), MemoryCollector()
+        api = API(transport=FailingTransport([server_error(502)]), throttler=throttler, instrument=collector,
+                  retrier=BackoffRetrier(base=0.001))
+        BasicCredentials('username', 'password', api=api).call(('GET', 'http://localhost/x'))
+        self.assertEqual(throttler.waits, 2)
+        stats = collector.snapshot()['http://localhost/x.json']
+        self.assertEqual((stats['calls'], stats['retries'], stats['transport_errors']), (1, 1, 1))
+
+    def test_retry_after_from_the_server(self):
+        from tootwi import API, BasicCredentials
+        from tootwi.retriers import BackoffRetrier
+        with HTTPServer(port=0, content_type='application/json', content_body='{"id":1}',
+                        failures=[503, 503], headers={'Retry-After': '0'}) as server:
+            api = API(use_ssl=False, retrier=BackoffRetrier(base=10.0)) # would wait long if not for Retry-After.
+            credentials = BasicCredentials('username', 'password', api=api)
+            started = time.time()
+            self.assertEqual(credentials.call(('GET', 'http://127.0.0.1:%d/x' % server.port)), {'id': 1})
+            self.assertTrue(time.time() - started < 5)
+            self.assertEqual(server.requests, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
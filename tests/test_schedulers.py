@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+try:
+    import unittest2 as unittest # python-2 external dependency
+except:
+    import unittest # python-3 native module
+
+import time
+import StringIO
+import threading
+
+
+class Credentials(object):
+    def __init__(self, identity):
+        self.identity = identity
+
+
+class ThreadSchedulerTests(unittest.TestCase):
+    def run_queued(self, scheduler, calls, throttler=None):
+        """ Queues all the calls while the scheduler is busy, then lets them go; returns the grant order. """
+        order = []
+        class Recorder(object):
+            # Records the order inside the granted slot, before the next call is let go.
+            def wait(self, deadline=None):
+                order.append(threading.current_thread().name)
+                if throttler is not None:
+                    throttler.wait()
+        def run(ticket):
+            scheduler.wait(ticket, Recorder())
+        with scheduler.lock:
+            scheduler.busy = True # as if some call waits for the throttler.
+        threads = [threading.Thread(target=run, name=name, args=(scheduler.classify(credentials),)) for credentials, name in calls]
+        for thread in threads:
+            thread.start()
+            while sum([m['waiting'] for m in scheduler.metrics().values()]) < threads.index(thread) + 1:
+                time.sleep(0.001) # keep the arrival order.
+        with scheduler.lock:
+            scheduler.busy = False
+            scheduler.advance()
+        for thread in threads:
+            thread.join()
+        return order
+
+    def test_higher_priorities_go_first(self):
+        from tootwi.schedulers import ThreadScheduler, INTERACTIVE, BACKGROUND
+        crawler, user, other = Credentials('crawler'), Credentials('user'), Credentials('other')
+        scheduler = ThreadScheduler(priorities={'crawler': BACKGROUND, 'user': INTERACTIVE})
+        calls = [(crawler, 'c1'), (crawler, 'c2'), (other, 'o1'), (user, 'u1'), (crawler, 'c3'), (user, 'u2')]
+        self.assertEqual(self.run_queued(scheduler, calls), ['u1', 'u2', 'o1', 'c1', 'c2', 'c3'])
+
+    def test_tenants_share_by_weights(self):
+        from tootwi.schedulers import ThreadScheduler
+        a, b = Credentials('a'), Credentials('b')
+        scheduler = ThreadScheduler(weights={'a': 2})
+        calls = [(a, 'a')] * 6 + [(b, 'b')] * 6
+        order = self.run_queued(scheduler, calls)
+        self.assertEqual(order[:6].count('a'), 4)
+        self.assertEqual(order[:6].count('b'), 2)
+
+    def test_slots_are_granted_by_the_throttler(self):
+        from tootwi.schedulers import ThreadScheduler
+        from tootwi.throttlers import TimedThrottler
+        scheduler = ThreadScheduler()
+        started = time.time()
+        self.run_queued(scheduler, [(Credentials('a'), 'a')] * 4, TimedThrottler(20))
+        self.assertTrue(time.time() - started >= 0.15)
+
+    def test_queue_times_are_collected(self):
+        from tootwi.schedulers import ThreadScheduler
+        scheduler = ThreadScheduler()
+        self.run_queued(scheduler, [(Credentials('a'), 'a')] * 3)
+        metrics = scheduler.metrics()
+        self.assertEqual(metrics['normal']['granted'], 3)
+        self.assertEqual(metrics['normal']['waiting'], 0)
+        self.assertEqual(metrics['normal']['queue_time']['count'], 3)
+
+    def test_deadline_while_queued(self):
+        from tootwi.schedulers import ThreadScheduler
+        from tootwi.errors import DeadlineExceededError
+        scheduler = ThreadScheduler()
+        scheduler.busy = True
+        ticket = scheduler.classify(Credentials('a'))
+        self.assertRaises(DeadlineExceededError, scheduler.wait, ticket, None, time.time() + 0.05)
+        scheduler.busy = False
+        scheduler.advance() # the expired waiter is skipped.
+        self.assertFalse(scheduler.busy)
+
+
+class APISchedulerTests(unittest.TestCase):
+    def test_calls_are_scheduled(self):
+        from tootwi import API, BasicCredentials
+        from tootwi.schedulers import ThreadScheduler
+        from tootwi.throttlers import TimedThrottler
+        class Transport(object):
+            def __call__(self, request):
+                return StringIO.StringIO('{"id":1}')
+        scheduler = ThreadScheduler()
+        api = API(transport=Transport(), throttler=TimedThrottler(1000), scheduler=scheduler)
+        credentials = BasicCredentials('username', 'password', api=api)
+        self.assertEqual(credentials.call(('GET', 'http://localhost/x')), {'id': 1})
+        self.assertEqual(scheduler.metrics()['normal']['granted'], 1)
+
+
+class AsyncSchedulerTests(unittest.TestCase):
+    def setUp(self):
+        try:
+            import asyncio
+        except ImportError:
+            try:
+                import trollius as asyncio
+            except ImportError:
+                self.skipTest('Neither asyncio nor trollius is installed.')
+        self.asyncio = asyncio
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_higher_priorities_go_first(self):
+        from tootwi.schedulers import AsyncScheduler, INTERACTIVE, BACKGROUND
+        from tootwi.throttlers import TimedThrottler
+        scheduler = AsyncScheduler(priorities={'crawler': BACKGROUND, 'user': INTERACTIVE}, loop=self.loop)
+        throttler = TimedThrottler(100)
+        order = []
+        futures = []
+        for name in ['crawler', 'crawler', 'user', 'other', 'user']:
+            future = scheduler.wait(scheduler.classify(Credentials(name)), throttler)
+            future.add_done_callback(lambda f, name=name: order.append(name))
+            futures.append(future)
+        self.loop.run_until_complete(self.asyncio.wait(futures, loop=self.loop))
+        self.assertEqual(order, ['crawler', 'user', 'user', 'other', 'crawler']) # the first one was granted at once.
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+try:
+    import unittest2 as unittest # python-2 external dependency
+except:
+    import unittest # python-3 native module
+
+import os
+import time
+import shutil
+import tempfile
+
+
+class FakeAPI(object):
+    """ Returns the user or the status by its id or screen name; counts the calls. """
+    def __init__(self):
+        self.calls = 0
+    def call(self, operation, parameters):
+        self.calls += 1
+        id = parameters.get('id') or parameters.get('user_id') or 100
+        return dict(id=int(id), screen_name=parameters.get('screen_name') or 'user%s' % id, text='hello')
+
+
+class StoreTests(object):
+    """ The same tests for all the backends; mixed into the test cases below. """
+
+    def setUp(self):
+        from tootwi.models import User, Status
+        self.directory = tempfile.mkdtemp()
+        self.api = FakeAPI()
+        self.stores = []
+        self.originals = (User.LOAD_STORE, Status.LOAD_STORE)
+
+    def tearDown(self):
+        from tootwi.models import User, Status
+        User.LOAD_STORE, Status.LOAD_STORE = self.originals
+        for store in self.stores:
+            store.close()
+        shutil.rmtree(self.directory)
+
+    def store(self, **kwargs):
+        store = self.make_store(os.path.join(self.directory, 'models'), **kwargs)
+        self.stores.append(store)
+        return store
+
+    def test_loaded_models_are_stored(self):
+        from tootwi.models import User
+        User.LOAD_STORE = self.store()
+        user = User(self.api, user_id=1).load()
+        self.assertEqual(user['id'], 1)
+        again = User(self.api, user_id=1).load()
+        self.assertEqual(again['screen_name'], 'user1')
+        self.assertTrue(again.loaded)
+        self.assertEqual(self.api.calls, 1)
+
+    def test_models_are_found_by_any_identity(self):
+        from tootwi.models import User
+        User.LOAD_STORE = self.store()
+        User(self.api, screen_name='Twitter').load()
+        User(self.api, user_id=100).load()
+        User(self.api, screen_name='twitter').load()
+        self.assertEqual(self.api.calls, 1)
+
+    def test_classes_are_stored_separately(self):
+        from tootwi.models import User, Status
+        User.LOAD_STORE = Status.LOAD_STORE = self.store()
+        User(self.api, user_id=1).load()
+        Status(self.api, id=1).load()
+        self.assertEqual(self.api.calls, 2)
+
+    def test_stale_models_are_reloaded(self):
+        from tootwi.models import User
+        User.LOAD_STORE = self.store(ttl=0.05)
+        User(self.api, user_id=1).load()
+        time.sleep(0.1)
+        User(self.api, user_id=1).load()
+        self.assertEqual(self.api.calls, 2)
+
+    def test_per_class_ttls(self):
+        from tootwi.models import User, Status
+        User.LOAD_STORE = Status.LOAD_STORE = self.store(ttl=0.05, ttls={'Status': None})
+        Status(self.api, id=1).load()
+        time.sleep(0.1)
+        Status(self.api, id=1).load()
+        self.assertEqual(self.api.calls, 1)
+
+    def test_stored_models_survive_restarts(self):
+        from tootwi.models import User
+        store = self.store(batch_size=1000, flush_interval=1000)
+        User.LOAD_STORE = store
+        User(self.api, user_id=1).load()
+        store.close()
+        self.stores.remove(store)
+        User.LOAD_STORE = self.store()
+        User(self.api, user_id=1).load()
+        self.assertEqual(self.api.calls, 1)
+
+    def test_bulk_load_and_save(self):
+        from tootwi.models import User, Users
+        store = self.store()
+        users = Users(self.api, [dict(id=i, screen_name='user%d' % i) for i in range(5)])
+        users.loaded = True
+        store.save_all([users])
+        missing = store.load_all([User(self.api, user_id=i) for i in range(3, 8)])
+        self.assertEqual(sorted([model['user_id'] for model in missing]), [5, 6, 7])
+        self.assertEqual(store.hits, 2)
+        self.assertEqual(self.api.calls, 0)
+
+
+class SqliteStoreTests(StoreTests, unittest.TestCase):
+    def make_store(self, path, **kwargs):
+        from tootwi.stores import SqliteStore
+        return SqliteStore(path + '.sqlite', **kwargs)
+
+
+class DbmStoreTests(StoreTests, unittest.TestCase):
+    def make_store(self, path, **kwargs):
+        from tootwi.stores import DbmStore
+        return DbmStore(path + '.dbm', **kwargs)
+
+
+if __name__ == '__main__':
+    unittest.main()
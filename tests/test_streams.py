@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+try:
+    import unittest2 as unittest # python-2 external dependency
+except:
+    import unittest # python-3 native module
+
+
+SAMPLES = [
+    ('{"delete":{"status":{"id":1,"user_id":2}}}', 'Delete'),
+    ('{"scrub_geo":{"user_id":2,"up_to_status_id":1}}', 'ScrubGeo'),
+    ('{"limit":{"track":123}}', 'Limit'),
+    ('{"friends":[1,2,3]}', 'Friends'),
+    ('{"target":{"id":1},"source":{"id":2},"event":"favorite"}', 'Event'),
+    ('{"direct_message":{"id":1,"text":"hello"}}', 'DirectMessage'),
+    ('{"warning":{"code":"FALLING_BEHIND","percent_full":60}}', 'StallWarning'),
+    ('{"created_at":"now","id":1,"text":"hello \\"event\\": world"}', 'Status'),
+    ('{"something":"else"}', 'Unknown'),
+]
+
+
+class TypedMessageFactoryTests(unittest.TestCase):
+    def setUp(self):
+        from tootwi.streams import TypedMessageFactory
+        self.factory = TypedMessageFactory()
+
+    def test_dispatch_by_keys(self):
+        import json
+        import tootwi.streams
+        for line, name in SAMPLES:
+            item = self.factory(None, json.loads(line))
+            self.assertIs(item.__class__, getattr(tootwi.streams, name), line)
+
+    def test_keep_alives_are_ignored(self):
+        self.assertIsNone(self.factory(None, None))
+
+    def test_classify_by_raw_lines(self):
+        import tootwi.streams
+        for line, name in SAMPLES:
+            cls = self.factory.classify(line)
+            if name in ('Status', 'Unknown'):
+                self.assertIsNone(cls, line)
+            else:
+                self.assertIs(cls, getattr(tootwi.streams, name), line)
+
+    def test_accepted_classes_only(self):
+        import json
+        from tootwi.streams import TypedMessageFactory, Delete
+        from tootwi.models import Status
+        factory = TypedMessageFactory(accept=[Status, Delete])
+        accepted = [line for line, name in SAMPLES if factory.prefilter(line)]
+        self.assertEqual([name for line, name in SAMPLES if line in accepted], ['Delete', 'Status', 'Unknown'])
+        items = [factory(None, json.loads(line)) for line in accepted]
+        self.assertEqual([item.__class__.__name__ for item in items if item is not None], ['Delete', 'Status'])
+
+    def test_projection(self):
+        import json
+        from tootwi.streams import TypedMessageFactory
+        factory = TypedMessageFactory(project=True)
+        status = factory(None, json.loads('{"id":1,"text":"hello","junk":1,"user":{"id":2,"junk":2}}'))
+        self.assertEqual(status.data, {'id': 1, 'text': 'hello', 'user': {'id': 2}})
+        delete = factory(None, json.loads(SAMPLES[0][0]))
+        self.assertEqual(delete.data, json.loads(SAMPLES[0][0]))
+
+
+class StreamOperationTests(unittest.TestCase):
+    def test_operation_is_kept_without_prefilter(self):
+        from tootwi.streams import SampleStream, MessageFactory
+        stream = SampleStream(None, MessageFactory())
+        self.assertEqual(stream.get_operation(), SampleStream.OPEN_OPERATION)
+
+    def test_operation_is_prefiltered(self):
+        from tootwi.streams import SampleStream, TypedMessageFactory, Delete
+        from tootwi.formats import PrefilteredFormat
+        stream = SampleStream(None, TypedMessageFactory(accept=[Delete]))
+        operation = stream.get_operation()
+        self.assertEqual(operation[:2], SampleStream.OPEN_OPERATION)
+        self.assertIsInstance(operation[2], PrefilteredFormat)
+        self.assertEqual(operation[2].extension, 'json')
+        self.assertIsNone(operation[2].decode('{"limit":{"track":1}}'))
+        self.assertEqual(operation[2].decode('{"delete":{}}'), {'delete': {}})
+        self.assertIsNone(operation[2].decode(' \r\n'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+try:
+    import unittest2 as unittest # python-2 external dependency
+except:
+    import unittest # python-3 native module
+
+import os
+import shutil
+import tempfile
+
+
+class FakeTimelineAPI(object):
+    """ Serves statuses with since_id < id <= max_id, newest first, by pages. """
+
+    def __init__(self, ids):
+        self.ids = sorted(ids, reverse=True)
+        self.calls = []
+
+    def call(self, operation, params):
+        self.calls.append(dict(params))
+        since_id, max_id = params.get('since_id'), params.get('max_id')
+        ids = [i for i in self.ids if (since_id is None or i > since_id) and (max_id is None or i <= max_id)]
+        return [dict(id=i, text='status %d' % i) for i in ids[:params['count']]]
+
+
+class TimelineSyncTests(unittest.TestCase):
+    def make_sync(self, api, watermarks=None, **kwargs):
+        from tootwi.models import UserTimeline
+        from tootwi.syncers import TimelineSync
+        return TimelineSync(UserTimeline(api, screen_name='someone'), watermarks, **kwargs)
+
+    def test_first_sync_fetches_one_page(self):
+        api = FakeTimelineAPI(range(1, 51))
+        sync = self.make_sync(api, count=10)
+        self.assertEqual([status['id'] for status in sync.sync()], range(50, 40, -1))
+        self.assertEqual(len(api.calls), 1)
+        self.assertEqual(sync.since_id, 50)
+        self.assertEqual(sync.gaps, [])
+
+    def test_only_new_statuses_are_fetched(self):
+        api = FakeTimelineAPI(range(1, 11))
+        sync = self.make_sync(api, count=10)
+        sync.sync()
+        api.ids = range(15, 0, -1)
+        self.assertEqual([status['id'] for status in sync.sync()], [15, 14, 13, 12, 11])
+        self.assertEqual(api.calls[-1]['since_id'], 10)
+        self.assertEqual(sync.sync(), [])
+
+    def test_gaps_are_filled_by_next_syncs(self):
+        api = FakeTimelineAPI(range(1, 11))
+        sync = self.make_sync(api, count=10, pages=2)
+        sync.sync()
+        api.ids = range(45, 0, -1) # 35 new ones: more than 2 pages.
+        self.assertEqual(len(sync.sync()), 20)
+        self.assertEqual(sync.gaps, [(10, 25)])
+        self.assertEqual(sync.since_id, 45)
+        self.assertEqual([status['id'] for status in sync.sync()], range(25, 15, -1)) # 1 page for new ones.
+        self.assertEqual(sync.gaps, [(10, 15)])
+        self.assertEqual([status['id'] for status in sync.sync()], range(15, 10, -1))
+        self.assertEqual(sync.gaps, [])
+        self.assertEqual([status['id'] for status in sync.buffer], range(45, 0, -1))
+
+    def test_buffer_is_bounded(self):
+        api = FakeTimelineAPI(range(1, 51))
+        sync = self.make_sync(api, count=10, size=5)
+        sync.sync()
+        self.assertEqual([status['id'] for status in sync.buffer], range(50, 45, -1))
+
+    def test_watermarks_are_persisted(self):
+        from tootwi.syncers import FileWatermarks
+        folder = tempfile.mkdtemp()
+        try:
+            path = os.path.join(folder, 'watermarks.json')
+            api = FakeTimelineAPI(range(1, 31))
+            watermarks = FileWatermarks(path, save_interval=0)
+            self.make_sync(api, watermarks, count=10).sync()
+
+            api.ids = range(35, 0, -1)
+            sync = self.make_sync(api, FileWatermarks(path), count=10)
+            self.assertEqual(sync.since_id, 30)
+            self.assertEqual([status['id'] for status in sync.sync()], range(35, 30, -1))
+        finally:
+            shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -65,6 +65,34 @@ class urllibTransportTests(unittest.TestCase):
                 self.assertIsInstance(content, basestring)
                 self.assertEqual(content, expected)
     
+    def test_readline_on_stream(self):
+        pattern = ['{"id":1}\r\n', '\r\n', '{"id":2}\r\n']
+        with HTTPServer(port=8888, content_lines=pattern, repeat=2, rate=100):
+            with contextlib.closing(self.transport(self.makeRequest('http://localhost:8888/'))) as stream:
+                content = list(iter(stream.readline, ''))
+                self.assertListEqual(content, pattern * 2)
+    
+    def test_stream_disconnect(self):
+        import httplib
+        pattern = ['{"id":1}\r\n', '{"id":2}\r\n']
+        with HTTPServer(port=8888, content_lines=pattern, disconnect_after=1):
+            with contextlib.closing(self.transport(self.makeRequest('http://localhost:8888/'))) as stream:
+                with self.assertRaises(httplib.IncompleteRead):
+                    list(iter(stream.readline, ''))
+    
+    def test_injected_failures_and_headers(self):
+        from tootwi.transports import TransportServerError
+        with HTTPServer(port=0, content_body='ok', failures=[420, 503], headers={'X-RateLimit-Remaining': '0'}) as server:
+            url = 'http://localhost:%d/' % server.port
+            for code in [420, 503]:
+                with self.assertRaises(TransportServerError) as context:
+                    self.transport(self.makeRequest(url))
+                self.assertEqual(context.exception.code, code)
+            with contextlib.closing(self.transport(self.makeRequest(url))) as stream:
+                self.assertEqual(stream.info().getheader('X-RateLimit-Remaining'), '0')
+                self.assertEqual(stream.read(), 'ok')
+            self.assertEqual(server.requests, 3)
+    
     def test_transport_error_with_nonurl(self):
         with self.assertRaises(ValueError):
             self.transport(self.makeRequest('not a url at all'))
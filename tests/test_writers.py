@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+try:
+    import unittest2 as unittest # python-2 external dependency
+except:
+    import unittest # python-3 native module
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+
+
+class FakeCredentials(object):
+    """ Fails the first calls with the errors; records the calls. """
+    def __init__(self, errors=(), blocker=None):
+        super(FakeCredentials, self).__init__()
+        self.errors = list(errors)
+        self.blocker = blocker
+        self.calls = []
+    def call(self, operation, parameters=None):
+        if self.blocker is not None:
+            self.blocker.wait()
+        self.calls.append((operation, parameters))
+        if self.errors:
+            raise self.errors.pop(0)
+        return dict(parameters, id=len(self.calls))
+
+
+def server_error(code, text='failure'):
+    from tootwi.transports import TransportServerError
+    return TransportServerError('HTTP Error %d' % code, code, text)
+
+
+class WriteBehindQueueTests(unittest.TestCase):
+    def setUp(self):
+        from tootwi.models import Status
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'writes.jsonl')
+        self.writer = None
+        self.original_writer = Status.WRITER
+
+    def tearDown(self):
+        from tootwi.models import Status
+        Status.WRITER = self.original_writer
+        if self.writer is not None and self.writer.running:
+            self.writer.stop(wait=False)
+        shutil.rmtree(self.directory)
+
+    def make_writer(self, **kwargs):
+        from tootwi.writers import WriteBehindQueue
+        kwargs.setdefault('base', 0.001)
+        self.writer = WriteBehindQueue(**kwargs)
+        return self.writer
+
+    def test_status_writes_return_futures(self):
+        from tootwi.models import Status
+        credentials = FakeCredentials()
+        Status.WRITER = self.make_writer()
+        self.writer.start()
+        status = Status(credentials, text='hello')
+        updated = status.update().result(timeout=5)
+        self.assertIs(updated, status)
+        self.assertEqual(status['id'], 1)
+        retweet = status.retweet().result(timeout=5)
+        self.assertIsInstance(retweet, Status)
+        self.assertEqual(retweet['id'], 2)
+        status.destroy().result(timeout=5)
+        self.assertEqual([op for op, params in credentials.calls],
+                         [Status.UPDATE_OPERATION, Status.RETWEET_OPERATION, Status.DESTROY_OPERATION])
+
+    def test_callers_do_not_wait_for_the_writes(self):
+        from tootwi.models import Status
+        blocker = threading.Event()
+        credentials = FakeCredentials(blocker=blocker)
+        Status.WRITER = self.make_writer()
+        self.writer.start()
+        future = Status(credentials, text='hello').update()
+        self.assertFalse(future.done())
+        blocker.set()
+        future.result(timeout=5)
+        self.assertTrue(future.done())
+
+    def test_failed_writes_are_retried(self):
+        from tootwi.writers import UPDATE
+        credentials = FakeCredentials([server_error(503), socket.error('reset')])
+        writer = self.make_writer()
+        writer.start()
+        future = writer.submit(credentials, UPDATE, ('POST', 'statuses/update'), dict(status='hello'))
+        self.assertEqual(future.result(timeout=5)['id'], 3)
+        self.assertEqual(len(credentials.calls), 3)
+
+    def test_duplicate_after_retry_is_success(self):
+        from tootwi.writers import UPDATE
+        credentials = FakeCredentials([socket.error('reset'), server_error(403, 'Status is a duplicate.')])
+        writer = self.make_writer()
+        writer.start()
+        future = writer.submit(credentials, UPDATE, ('POST', 'statuses/update'), dict(status='hello'))
+        self.assertIsNone(future.result(timeout=5)) # performed by the first attempt; no response for it.
+        self.assertEqual(len(credentials.calls), 2)
+
+    def test_duplicate_at_first_attempt_is_failure(self):
+        from tootwi.writers import UPDATE
+        from tootwi.transports import TransportServerError
+        credentials = FakeCredentials([server_error(403, 'Status is a duplicate.')])
+        writer = self.make_writer()
+        writer.start()
+        future = writer.submit(credentials, UPDATE, ('POST', 'statuses/update'), dict(status='hello'))
+        self.assertRaises(TransportServerError, future.result, 5)
+        self.assertEqual(len(credentials.calls), 1)
+
+    def test_same_keys_are_written_once(self):
+        from tootwi.writers import UPDATE
+        credentials = FakeCredentials()
+        writer = self.make_writer()
+        first = writer.submit(credentials, UPDATE, ('POST', 'statuses/update'), dict(status='hello'), key='k1')
+        second = writer.submit(credentials, UPDATE, ('POST', 'statuses/update'), dict(status='hello'), key='k1')
+        self.assertIs(first, second)
+        writer.start()
+        first.result(timeout=5)
+        third = writer.submit(credentials, UPDATE, ('POST', 'statuses/update'), dict(status='hello'), key='k1')
+        self.assertTrue(third.done())
+        self.assertEqual(len(credentials.calls), 1)
+
+    def test_unapplied_intents_are_replayed_after_restart(self):
+        from tootwi.writers import WriteBehindQueue, UPDATE
+        credentials = FakeCredentials()
+        writer = self.make_writer(path=self.path)
+        writer.start()
+        writer.submit(credentials, UPDATE, ('POST', 'statuses/update'), dict(status='applied'), key='k1').result(timeout=5)
+        writer.stop()
+        writer = self.make_writer(path=self.path) # not started: the intents stay in the journal.
+        future = writer.submit(credentials, UPDATE, ('POST', 'statuses/update'), dict(status='pending'), key='k2')
+        writer.journal.close()
+
+        writer = self.make_writer(path=self.path)
+        self.assertEqual([intent.key for intent in writer.recovered], ['k2'])
+        writer.start()
+        futures = writer.replay(credentials)
+        self.assertEqual([f.result(timeout=5)['status'] for f in futures], ['pending'])
+        self.assertTrue(writer.submit(credentials, UPDATE, ('POST', 'statuses/update'), dict(status='applied'), key='k1').done())
+        self.assertEqual([params['status'] for op, params in credentials.calls], ['applied', 'pending'])
+
+    def test_status_writes_accept_keys(self):
+        from tootwi.models import Status
+        credentials = FakeCredentials()
+        Status.WRITER = self.make_writer()
+        self.writer.start()
+        Status(credentials, text='hello').update(key='k1').result(timeout=5)
+        self.assertTrue(Status(credentials, text='hello').update(key='k1').done())
+        self.assertEqual(len(credentials.calls), 1)
+
+    def test_applied_keys_are_bounded(self):
+        from tootwi.writers import UPDATE
+        credentials = FakeCredentials()
+        writer = self.make_writer(path=self.path, dedup_size=2)
+        writer.start()
+        for key in ['k1', 'k2', 'k3', 'k4', 'k5']:
+            writer.submit(credentials, UPDATE, ('POST', 'statuses/update'), dict(status=key), key=key).result(timeout=5)
+        self.assertEqual(list(writer.applied.keys()), ['k4', 'k5'])
+        with open(self.path, 'rb') as f:
+            self.assertLessEqual(len(f.readlines()), 5) # compacted on the run.
+
+    def test_expired_keys_are_compacted_on_recovery(self):
+        import json
+        with open(self.path, 'wb') as f:
+            f.write(json.dumps(dict(key='old', done=True, at=0)) + '\n')
+            f.write(json.dumps(dict(key='new', done=True)) + '\n')
+        writer = self.make_writer(path=self.path, dedup_ttl=3600)
+        self.assertEqual(list(writer.applied.keys()), ['new'])
+        writer.journal.close()
+        with open(self.path, 'rb') as f:
+            self.assertEqual([json.loads(line)['key'] for line in f], ['new'])
+
+    def test_stop_fails_the_unapplied_writes(self):
+        from tootwi.writers import UPDATE
+        from tootwi.errors import WriteQueueStoppedError
+        writer = self.make_writer()
+        future = writer.submit(FakeCredentials(), UPDATE, ('POST', 'statuses/update'), dict(status='hello'))
+        writer.stop(wait=False)
+        self.assertRaises(WriteQueueStoppedError, future.result, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
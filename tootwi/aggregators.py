@@ -0,0 +1,463 @@
+# coding: utf-8
+"""
+Aggregators compute the statistics of the streams (trending hashtags, top users,
+the number of distinct users, etc) over time windows, in bounded memory. They are
+fed with the items of the streams (Status items, or the decoded data as is), and
+do not keep the items themselves.
+
+Each metric of an aggregation is a pair of an extractor and a sketch. The extractor
+returns the values of an item to be counted (e.g., hashtags() returns the hashtags
+of a status; non-status messages have no values). The sketch counts them:
+* CountMinSketch estimates the count of any value, with fixed width x depth counters;
+  the estimates are never less than the true counts, and exceed them by at most
+  e/width of the total count with the probability of 1 - exp(-depth).
+* TopK keeps k most frequent values, estimated with a CountMinSketch.
+* HyperLogLog estimates the number of distinct values, with 2**precision one-byte
+  registers; the standard error is 1.04/sqrt(2**precision) (1.6% by default).
+* BoundedCounter counts the values exactly while there are at most capacity of them,
+  and keeps the most frequent ones (approximately) when there are more (Space-Saving).
+
+The windows are tumbling (consecutive, of "size" seconds), or sliding (of "size"
+seconds, every "slide" seconds), by the time the items arrive at (or by the time
+returned by the "clock" callable). Sliding windows are made of panes of "slide"
+seconds; each pane has its own sketches, and the window is their merge, so the memory
+is bounded by the number of panes per window, not by the rate of the stream.
+
+A window is emitted when the first item after its end arrives, so the windows with
+no items after them are emitted only by close(). Empty windows are not emitted.
+
+Usage example:
+    aggregation = Aggregation(SampleStream(credentials, factory=MessageFactory()), size=300, slide=60,
+                              hashtags=Metric(hashtags, TopK(20)),
+                              users=Metric(user_ids, HyperLogLog()))
+    for window in aggregation:
+        print window.start, window.count, window['hashtags'].top(), window['users'].count()
+
+Usage example for feeding the items from an existing loop:
+    aggregation = Aggregation(None, size=60, languages=Metric(languages, BoundedCounter(100)))
+    for status in stream:
+        ...
+        for window in aggregation.add(status):
+            print window['languages'].most_common(10)
+"""
+
+import math
+import time
+import struct
+import hashlib
+import collections
+from array import array
+from .models import Status
+
+
+#
+# Hashing of the values for the sketches.
+#
+
+_HASH = struct.Struct('<QQ')
+
+def hash_value(value):
+    """
+    Returns two independent 64-bit hashes of the value. Unlike hash(), they are
+    the same in all processes, so the sketches can be merged across processes.
+    """
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    elif not isinstance(value, str):
+        value = repr(value)
+    return _HASH.unpack(hashlib.md5(value).digest())
+
+
+#
+# Sketches.
+#
+
+class Sketch(object):
+    """
+    Base class for the sketches. Descendants implement add(value, count=1),
+    merge(other) of a sketch with the same parameters, and empty().
+    """
+
+    def add(self, value, count=1):
+        raise NotImplemented()
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+
+    def merge(self, other):
+        """ Adds the counts of the other sketch to this one; returns self. """
+        raise NotImplemented()
+
+    def empty(self):
+        """ Returns a new empty sketch with the same parameters. """
+        raise NotImplemented()
+
+
+class CountMinSketch(Sketch):
+    """
+    Estimates the counts of the values with depth rows of width counters.
+    """
+
+    def __init__(self, width=2048, depth=4):
+        super(CountMinSketch, self).__init__()
+        self.width = width
+        self.depth = depth
+        self.rows = [array('L', [0]) * width for i in range(depth)]
+        self.total = 0
+
+    def indexes(self, value):
+        # Double hashing: the rows are indexed by h1 + i * h2.
+        h1, h2 = hash_value(value)
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, value, count=1):
+        """ Counts the value; returns its estimated count after that. """
+        estimate = None
+        for row, index in zip(self.rows, self.indexes(value)):
+            row[index] += count
+            estimate = row[index] if estimate is None else min(estimate, row[index])
+        self.total += count
+        return estimate
+
+    def estimate(self, value):
+        return min([row[index] for row, index in zip(self.rows, self.indexes(value))])
+
+    def merge(self, other):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Count-Min sketches of different sizes can not be merged.")
+        for row, other_row in zip(self.rows, other.rows):
+            for index, value in enumerate(other_row):
+                if value:
+                    row[index] += value
+        self.total += other.total
+        return self
+
+    def empty(self):
+        return self.__class__(self.width, self.depth)
+
+
+class TopK(Sketch):
+    """
+    Keeps k most frequent values (the heavy hitters) with their estimated counts.
+    The values are counted by a Count-Min sketch; only k candidates are kept.
+    """
+
+    def __init__(self, k=10, width=2048, depth=4):
+        super(TopK, self).__init__()
+        self.k = k
+        self.sketch = CountMinSketch(width, depth)
+        self.candidates = {} # {value: estimated count}
+        self.floor = None # the candidate with the least count, to be evicted first.
+
+    def add(self, value, count=1):
+        estimate = self.sketch.add(value, count)
+        candidates = self.candidates
+        if value in candidates:
+            candidates[value] = estimate
+            if value == self.floor:
+                self.find_floor()
+        elif len(candidates) < self.k:
+            candidates[value] = estimate
+            if self.floor is None or estimate < candidates[self.floor]:
+                self.floor = value
+        elif estimate > candidates[self.floor]:
+            del candidates[self.floor]
+            candidates[value] = estimate
+            self.find_floor()
+        return estimate
+
+    def find_floor(self):
+        self.floor = min(self.candidates, key=self.candidates.get) if self.candidates else None
+
+    def estimate(self, value):
+        return self.sketch.estimate(value)
+
+    def top(self, n=None):
+        """ Returns [(value, estimated count)] of the most frequent values, most frequent first. """
+        result = sorted(self.candidates.items(), key=lambda pair: pair[1], reverse=True)
+        return result[:n] if n is not None else result
+
+    @property
+    def total(self):
+        return self.sketch.total
+
+    def merge(self, other):
+        self.sketch.merge(other.sketch)
+        values = set(self.candidates) | set(other.candidates)
+        estimates = sorted([(self.sketch.estimate(value), value) for value in values], reverse=True)
+        self.candidates = dict([(value, estimate) for estimate, value in estimates[:self.k]])
+        self.find_floor()
+        return self
+
+    def empty(self):
+        return self.__class__(self.k, self.sketch.width, self.sketch.depth)
+
+
+class HyperLogLog(Sketch):
+    """
+    Estimates the number of distinct values with 2**precision registers.
+    The counts of add() are ignored: a value is either seen or not.
+    """
+
+    def __init__(self, precision=12):
+        super(HyperLogLog, self).__init__()
+        if not 4 <= precision <= 16:
+            raise ValueError("HyperLogLog precision must be from 4 to 16.")
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+        self.alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(self.size, 0.7213 / (1 + 1.079 / self.size))
+
+    def add(self, value, count=1):
+        hashed = hash_value(value)[0]
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1 # position of the leftmost 1 bit.
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        """ Returns the estimated number of the distinct values. """
+        estimate = self.alpha * self.size * self.size / sum([2.0 ** -register for register in self.registers])
+        zeros = self.registers.count('\0')
+        if estimate <= 2.5 * self.size and zeros:
+            return int(round(self.size * math.log(float(self.size) / zeros))) # linear counting for small sets.
+        return int(round(estimate))
+
+    def __len__(self):
+        return self.count()
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("HyperLogLogs of different precisions can not be merged.")
+        self.registers = bytearray([max(a, b) for a, b in zip(self.registers, other.registers)])
+        return self
+
+    def empty(self):
+        return self.__class__(self.precision)
+
+
+class BoundedCounter(Sketch):
+    """
+    Counts the values exactly while there are at most capacity distinct values.
+    When a new value comes and the counter is full, the value with the least count
+    is replaced by it, and the new value inherits that count as its possible error
+    (the Space-Saving algorithm): the frequent values are kept, and their counts
+    are overestimated by at most total/capacity. exact tells if nothing was replaced.
+    """
+
+    def __init__(self, capacity=1000):
+        super(BoundedCounter, self).__init__()
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {} # {value: max overestimation}, only for the replaced values.
+        self.total = 0
+        self.exact = True
+
+    def add(self, value, count=1):
+        self.total += count
+        counts = self.counts
+        if value in counts:
+            counts[value] += count
+        elif len(counts) < self.capacity:
+            counts[value] = count
+        else:
+            victim = min(counts, key=counts.get)
+            error = counts.pop(victim)
+            self.errors.pop(victim, None)
+            counts[value] = error + count
+            self.errors[value] = error
+            self.exact = False
+        return counts[value]
+
+    def __getitem__(self, value):
+        return self.counts.get(value, 0)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def most_common(self, n=None):
+        """ Returns [(value, count)] of the most frequent values, most frequent first. """
+        result = sorted(self.counts.items(), key=lambda pair: pair[1], reverse=True)
+        return result[:n] if n is not None else result
+
+    def merge(self, other):
+        for value, count in other.counts.items():
+            self.counts[value] = self.counts.get(value, 0) + count
+        for value, error in other.errors.items():
+            self.errors[value] = self.errors.get(value, 0) + error
+        self.total += other.total
+        self.exact = self.exact and other.exact
+        if len(self.counts) > self.capacity:
+            kept = self.most_common(self.capacity)
+            self.counts = dict(kept)
+            self.errors = dict([(value, error) for value, error in self.errors.items() if value in self.counts])
+            self.exact = False
+        return self
+
+    def empty(self):
+        return self.__class__(self.capacity)
+
+
+#
+# Extractors of the values from the stream items.
+#
+
+def _data(item):
+    """ Returns the data of the status item (or of the decoded status), or None for other messages. """
+    if isinstance(item, Status):
+        return item.data
+    if isinstance(item, dict) and 'text' in item:
+        return item
+    return None
+
+def hashtags(item):
+    """ Hashtags of the status, lowercased, with no "#". """
+    data = _data(item)
+    entities = data.get('entities') if data is not None else None
+    return [tag['text'].lower() for tag in (entities or {}).get('hashtags') or []]
+
+def mentions(item):
+    """ Screen names of the users mentioned in the status, lowercased. """
+    data = _data(item)
+    entities = data.get('entities') if data is not None else None
+    return [mention['screen_name'].lower() for mention in (entities or {}).get('user_mentions') or []]
+
+def user_ids(item):
+    """ Id of the author of the status. """
+    data = _data(item)
+    user = data.get('user') if data is not None else None
+    return [user.get('id')] if user is not None and user.get('id') is not None else []
+
+def languages(item):
+    """ Language of the status, as detected by Twitter. """
+    data = _data(item)
+    return [data['lang']] if data is not None and data.get('lang') is not None else []
+
+def statuses(item):
+    """ The status itself, as one value; e.g., for BoundedCounter() to count the statuses. """
+    return ['status'] if _data(item) is not None else []
+
+
+#
+# Windows.
+#
+
+class Metric(object):
+    """
+    An extractor of the values and the prototype sketch to count them with.
+    The sketches of the windows are made by prototype.empty().
+    """
+
+    def __init__(self, extract, sketch):
+        super(Metric, self).__init__()
+        self.extract = extract
+        self.sketch = sketch
+
+
+class Window(object):
+    """
+    The result of the aggregation over one window: its start and end times,
+    the number of the items in it, and the sketches of the metrics by their names.
+    """
+
+    def __init__(self, start, end, count, sketches):
+        super(Window, self).__init__()
+        self.start = start
+        self.end = end
+        self.count = count
+        self.sketches = sketches
+
+    def __getitem__(self, name):
+        return self.sketches[name]
+
+    def __repr__(self):
+        return '%s(%r, %r, %r)' % (self.__class__.__name__, self.start, self.end, self.count)
+
+
+class Aggregation(object):
+    """
+    Aggregation of the metrics (given as keyword arguments) over the windows of
+    the items, as described above. Iterating over it iterates over the items (e.g.,
+    of a stream), and yields the windows when they are closed. Alternatively, the
+    items can be fed with add(), which returns the windows closed by the item.
+    """
+
+    Pane = collections.namedtuple('Pane', 'start count sketches')
+
+    def __init__(self, items, size=60.0, slide=None, clock=time.time, **metrics):
+        super(Aggregation, self).__init__()
+        slide = size if slide is None else slide
+        panes = size / float(slide)
+        if slide <= 0 or panes != int(panes):
+            raise ValueError("Window size must be a positive multiple of its slide.")
+        self.items = items
+        self.size = size
+        self.slide = slide
+        self.clock = clock
+        self.metrics = metrics
+        self.panes = collections.deque(maxlen=int(panes)) # the closed panes of the current window.
+        self.current = None # the pane being filled.
+
+    def __iter__(self):
+        for item in self.items:
+            for window in self.add(item):
+                yield window
+        for window in self.close():
+            yield window
+
+    def add(self, item, now=None):
+        """ Counts the item at the current time (or at "now"); returns the windows it closes. """
+        now = self.clock() if now is None else now
+        windows = self.advance(now)
+        pane = self.current
+        for name, metric in self.metrics.items():
+            sketch = pane.sketches[name]
+            for value in metric.extract(item):
+                sketch.add(value)
+        self.current = pane._replace(count=pane.count + 1)
+        return windows
+
+    def advance(self, now):
+        """ Closes the panes which end before now; returns the windows closed with them. """
+        start = now - now % self.slide
+        windows = []
+        if self.current is not None and self.current.start != start:
+            windows.extend(self.close_pane())
+            # The empty panes between: they close the windows with the older panes.
+            gap = int(round((start - self.panes[-1].start) / self.slide)) - 1
+            for i in range(min(gap, self.panes.maxlen)):
+                self.panes.append(self.Pane(self.panes[-1].start + self.slide, 0, None))
+                windows.extend(self.window())
+        if self.current is None or self.current.start != start:
+            self.current = self.Pane(start, 0, dict([(name, metric.sketch.empty()) for name, metric in self.metrics.items()]))
+        return windows
+
+    def close_pane(self):
+        self.panes.append(self.current)
+        self.current = None
+        return self.window()
+
+    def window(self):
+        """ Returns the window ending with the last closed pane, if it has any items. """
+        panes = [pane for pane in self.panes if pane.count]
+        if not panes:
+            return []
+        end = self.panes[-1].start + self.slide
+        if len(panes) == 1:
+            sketches = panes[0].sketches
+            if self.panes.maxlen > 1: # the pane is still used by the next windows.
+                sketches = dict([(name, sketch.empty().merge(sketch)) for name, sketch in sketches.items()])
+        else:
+            sketches = dict([(name, metric.sketch.empty()) for name, metric in self.metrics.items()])
+            for pane in panes:
+                for name, sketch in pane.sketches.items():
+                    sketches[name].merge(sketch)
+        return [Window(end - self.size, end, sum([pane.count for pane in panes]), sketches)]
+
+    def close(self):
+        """ Closes the current pane (e.g., when the stream ends); returns the windows closed with it. """
+        if self.current is None:
+            return []
+        return self.close_pane()
@@ -4,10 +4,16 @@ Utilitary classes to contain extended and/or prepared information when performin
 API calls in credentials classes.
 """
 
+import time
 import contextlib
+try:
+    from http.client import HTTPException # python-3
+except ImportError:
+    from httplib import HTTPException # python-2
+from .instruments import operation_of, CALLS, FLOWS, MESSAGES, KEEPALIVES, FILTERED, DECODE_ERRORS, TRANSPORT_ERRORS, BYTES, RETRIES, HEDGES, THROTTLE, CONNECT, TTFB, READ, DECODE
 from .transports import DEFAULT_TRANSPORT, TransportError
 from .formats import Format, ExternalFormat, JsonFormat
-from .errors import CredentialsWrongError, CredentialsValueError, OperationNotPermittedError, OperationNotFoundError, OperationValueError, ParametersCallbackError
+from .errors import DeadlineExceededError, CredentialsWrongError, CredentialsValueError, OperationNotPermittedError, OperationNotFoundError, OperationValueError, ParametersCallbackError
 
 # Retrieve version information if available, to use in User-Agent header in API class.
 try:
@@ -17,18 +23,24 @@ except ImportError:
 
 
 class Invocation(object):
-    def __init__(self, url, method, parameters, headers, format):
+    def __init__(self, url, method, parameters, headers, format, template=None):
         super(Invocation, self).__init__()
         self._url = url
         self._method = method
         self._headers = headers
         self._parameters = parameters
         self._format = format
+        self._template = template
     
     @property
     def url(self):
         return self._url
     
+    @property
+    def template(self):
+        """ The URL before the parameters are resolved in it (e.g., with "%(id)s" in it). """
+        return self._template
+    
     @property
     def method(self):
         return self._method
@@ -55,18 +67,24 @@ class WebRequest(object):
     These is no need to derive this class, since this one is usually enough.
     """
     
-    def __init__(self, url, method, headers, postdata, format):
+    def __init__(self, url, method, headers, postdata, format, template=None):
         super(WebRequest, self).__init__()
         self._url = url
         self._method = method
         self._headers = headers
         self._postdata = postdata
         self._format = format
+        self._template = template
     
     @property
     def url(self):
         return self._url
     
+    @property
+    def template(self):
+        """ The URL template of the invocation, for grouping the requests by operation. """
+        return self._template
+    
     @property
     def method(self):
         return self._method
@@ -101,10 +119,17 @@ class API(object):
     # developer's one. Otherwise, library's User-Agent is used alone.
     USER_AGENT = 'tootwi/%s' % __version__
     
-    def __init__(self, transport=None, throttler=None, headers=None, default_format=None, use_ssl=True, api_host='api.twitter.com', api_version='1'):
+    def __init__(self, transport=None, throttler=None, headers=None, default_format=None, use_ssl=True, api_host='api.twitter.com', api_version='1', coalescer=None, instrument=None, retrier=None, hedger=None, breaker=None, timeout=None, scheduler=None):
         super(API, self).__init__()
         self.transport = transport if transport is not None else DEFAULT_TRANSPORT
         self.throttler = throttler # ??? default throttler?
+        self.coalescer = coalescer # see tootwi.coalescers; None means no deduplication.
+        self.instrument = instrument # see tootwi.instruments; None means no measurements.
+        self.retrier = retrier # see tootwi.retriers; None means no retries.
+        self.hedger = hedger # see tootwi.hedgers; None means no hedged calls.
+        self.breaker = breaker # see tootwi.breakers; None means no circuit breaking.
+        self.timeout = timeout # seconds for the whole call, including retries; None means no deadline.
+        self.scheduler = scheduler # see tootwi.schedulers; None means the calls compete for the throttler.
         self.use_ssl = use_ssl
         self.api_host = api_host if api_host is not None else self.DEFAULT_API_HOST
         self.api_version = api_version if api_version is not None else self.DEFAULT_API_VERSION
@@ -162,13 +187,13 @@ class API(object):
         # Make method uppercased verb word.
         # Make url absolute; add format extension if it is not there yet; resolve parameters.
         method = self.normalize_method(method)
-        url = self.normalize_url(url, format.extension)
-        url = url % parameters #NB: extra keys will be ignored; missed ones will cause exception.
+        template = self.normalize_url(url, format.extension)
+        url = template % parameters #NB: extra keys will be ignored; missed ones will cause exception.
         
         # The result MUST be in the same order as accepted by Credentials.sign().
-        return Invocation(url, method, parameters, headers, format)
+        return Invocation(url, method, parameters, headers, format, template)
     
-    def call(self, request):
+    def call(self, request, resign=None, deadline=None, ticket=None):
         """
         Single request scenario (connect, send, recv, close).
         
@@ -176,21 +201,145 @@ class API(object):
         is received, parsed and filtered through callback, the connection
         is closed and the result is returned.
         
+        If there is a retrier, failed calls are retried as it decides. Resign is
+        a callable which returns the same request signed anew; without it, the
+        same request is re-sent (which is fine for unsigned requests only).
+        If there is a hedger, slow GET calls are duplicated as it decides (only
+        when they can be signed anew).
+        If there is a circuit breaker, the calls to the failing hosts fail fast.
+        
+        Deadline is the absolute time (as in time.time()) by which the call must be
+        completed, including the throttling, the retries and their delays; if not
+        specified, it is the API's timeout from now. The transport is given only the
+        remaining time; the throttler and the retrier never wait past the deadline.
+        If there is no time left, DeadlineExceededError is raised (or the error of
+        the last attempt, if the next one cannot be made in time).
+        
+        Ticket is the classification of the call by the scheduler, if there is one;
+        the call then waits for its turn before waiting for the throttler.
+        
         Intended usage:
             item = api.call((method, url), parameters)
             do_something(item)
         """
-        if self.throttler is not None:
-            self.throttler.wait() # blocking wait
+        instrument = self.instrument
+        operation = None
+        if instrument is not None:
+            operation = operation_of(request)
+            instrument.count(CALLS, operation)
+        hedged = self.hedger is not None and resign is not None and request.method == 'GET'
+        if deadline is None and self.timeout is not None:
+            deadline = time.time() + self.timeout
         
-        # Error might raise at any stage: connect, send, recv, parse, close -- all is the same for us.
-        try:
-            with contextlib.closing(self.transport(request)) as handle:
-                line = handle.read()
+        attempt = 0
+        while True:
+            attempt += 1
+            # The circuit entered must be resolved whatever happens: a success, a failure,
+            # or a release (if the call is not performed, or fails not because of the host);
+            # otherwise, a half-open circuit would count the probe as in flight forever.
+            circuit = self.breaker.enter(request) if self.breaker is not None else None
+            
+            # Error might raise at any stage: connect, send, recv, parse, close -- all is the same for us.
+            try:
+                self.throttle(operation, deadline, ticket) # retries are throttled too.
+                self.remaining(deadline)
+                started = time.time()
+                if hedged:
+                    opened, line = self.hedger(lambda request, cancelled: self.fetch(request, cancelled, self.remaining(deadline)),
+                                               request, lambda: self.duplicate(resign, operation, deadline, ticket))
+                else:
+                    opened, line = self.fetch(request, None, self.remaining(deadline))
+            except (TransportError, EnvironmentError, HTTPException), e: # the latter are broken responses.
+                if instrument is not None:
+                    instrument.count(TRANSPORT_ERRORS, operation)
+                if circuit is not None:
+                    self.breaker.failure(circuit, e)
+                delay = self.retrier.delay(attempt, request.method, e) if self.retrier is not None else None
+                if delay is not None and deadline is not None and time.time() + delay >= deadline:
+                    delay = None # the retry would be too late anyway.
+                if delay is None:
+                    if isinstance(e, TransportError):
+                        self.handle_transport_error(e)
+                    raise
+            except:
+                if circuit is not None:
+                    self.breaker.release(circuit)
+                raise
+            else:
+                received = time.time()
+                if circuit is not None:
+                    self.breaker.success(circuit)
                 data = request.format.decode(line)
+                if instrument is not None:
+                    decoded = time.time()
+                    instrument.observe(CONNECT, operation, opened - started)
+                    instrument.observe(TTFB, operation, received - opened) #NB: the body is read at once.
+                    instrument.observe(READ, operation, received - opened)
+                    instrument.observe(DECODE, operation, decoded - received)
+                    instrument.count(BYTES, operation, len(line))
                 return data
-        except TransportError, e:
-            self.handle_transport_error(e)
+            
+            if instrument is not None:
+                instrument.count(RETRIES, operation)
+            time.sleep(delay)
+            if resign is not None:
+                request = resign()
+    
+    def fetch(self, request, cancelled=None, timeout=None):
+        """
+        Performs the request and reads the whole response. Returns the time when
+        the transport was opened, and the response body. If cancelled (an event)
+        is set by then, the body is not read, and None is returned instead of it.
+        Timeout is passed to the transport only if specified, so the transports
+        with no timeouts support still work for the calls with no deadlines.
+        """
+        handle = self.transport(request, timeout) if timeout is not None else self.transport(request)
+        with contextlib.closing(handle) as handle:
+            opened = time.time()
+            if cancelled is not None and cancelled.is_set():
+                return opened, None
+            return opened, handle.read()
+    
+    def remaining(self, deadline):
+        """
+        Returns the seconds left till the deadline (None if there is no deadline).
+        Raises DeadlineExceededError if there is no time left.
+        """
+        if deadline is None:
+            return None
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise DeadlineExceededError('The call is past its deadline.')
+        return remaining
+    
+    def throttle(self, operation=None, deadline=None, ticket=None):
+        """
+        Waits for the throttler, if any, but not past the deadline, if any.
+        If the call has a ticket of the scheduler, waits for its turn first.
+        The operation is for the instrument only.
+        """
+        if self.scheduler is not None and ticket is not None:
+            started = time.time()
+            self.scheduler.wait(ticket, self.throttler, deadline)
+            if self.instrument is not None:
+                self.instrument.observe(THROTTLE, operation, time.time() - started)
+        elif self.throttler is not None:
+            started = time.time()
+            if deadline is not None:
+                self.throttler.wait(deadline) # blocking wait
+            else:
+                self.throttler.wait() # blocking wait
+            if self.instrument is not None:
+                self.instrument.observe(THROTTLE, operation, time.time() - started)
+    
+    def duplicate(self, resign, operation=None, deadline=None, ticket=None):
+        """
+        Makes a duplicate of the request for hedging: throttled, and signed anew.
+        """
+        if self.instrument is not None:
+            self.instrument.count(HEDGES, operation)
+        self.throttle(operation, deadline, ticket)
+        return resign()
     
     def flow(self, request):
         """
@@ -205,18 +354,72 @@ class API(object):
                 do_something(item)
         
         """
-        if self.throttler:
-            self.throttler.wait() # blocking wait
+        instrument = self.instrument
+        if instrument is not None:
+            operation = operation_of(request)
+            instrument.count(FLOWS, operation)
+        
+        circuit = self.breaker.enter(request) if self.breaker is not None else None
         
         # Error might raise at any stage: connect, send, recv, parse, close -- all is the same for us.
         try:
+            if self.throttler:
+                started = time.time()
+                self.throttler.wait() # blocking wait
+                if instrument is not None:
+                    instrument.observe(THROTTLE, operation, time.time() - started)
+            
+            started = time.time()
             with contextlib.closing(self.transport(request)) as handle:
-                while True:
-                    line = handle.readline()
-                    data = request.format.decode(line)
-                    yield data
+                if circuit is not None:
+                    # Only connecting is judged; broken streams are the business of the reconnects.
+                    self.breaker.success(circuit)
+                    circuit = None
+                if instrument is None:
+                    while True:
+                        line = handle.readline()
+                        if not line:
+                            break # end of stream (connection closed); keep-alives are never empty.
+                        data = request.format.decode(line)
+                        yield data
+                else:
+                    # The same loop as above, but measured. Kept separate to cost nothing when not measured.
+                    opened = time.time()
+                    instrument.observe(CONNECT, operation, opened - started)
+                    first = True
+                    while True:
+                        started = time.time()
+                        line = handle.readline()
+                        received = time.time()
+                        if first:
+                            instrument.observe(TTFB, operation, received - opened)
+                            first = False
+                        if not line:
+                            break
+                        instrument.observe(READ, operation, received - started)
+                        instrument.count(BYTES, operation, len(line))
+                        try:
+                            data = request.format.decode(line)
+                        except ValueError:
+                            instrument.count(DECODE_ERRORS, operation)
+                            raise
+                        instrument.observe(DECODE, operation, time.time() - received)
+                        instrument.count(MESSAGES if data is not None else KEEPALIVES if line.isspace() else FILTERED, operation)
+                        yield data
         except TransportError, e:
+            if instrument is not None:
+                instrument.count(TRANSPORT_ERRORS, operation)
+            if circuit is not None:
+                self.breaker.failure(circuit, e)
             self.handle_transport_error(e)
+        except (EnvironmentError, HTTPException), e:
+            if circuit is not None:
+                self.breaker.failure(circuit, e)
+            raise
+        except:
+            if circuit is not None:
+                self.breaker.release(circuit) # not connected, and not because of the host.
+            raise
     
     def normalize_method(self, method):
         """
@@ -0,0 +1,174 @@
+# coding: utf-8
+"""
+Batchers coalesce loads of many single-item models into few bulk requests.
+A batcher is assigned to a model class via its LOAD_BATCHER class field, and
+is offered each model of that class when its load() method is called.
+
+Since load() is a blocking call, pending models are coalesced across threads:
+the first thread to load a model becomes a leader of a new batch, waits for
+a short window while other threads add their models to the same batch, and
+then performs one bulk request for all of them. Results are spread back to
+each model, and all the waiting threads are released at once. A batch is
+flushed immediately once it reaches its maximum size.
+
+Note that this adds latency to every load: even a single-threaded load() of
+one model waits for the full window before its request is performed (50ms by
+default), since the batcher cannot know whether other loads will come. Use
+window=0 to flush immediately (then almost nothing is coalesced: the batch is
+closed before its request is performed, so the loads which come during the
+request start a new batch), or load_all() for bulk hydration.
+
+Batchers can decline a model (for example, if it has parameters that cannot
+be expressed in a bulk request); then the model is loaded as usually.
+
+Usage example:
+    User.LOAD_BATCHER = UsersLookupBatcher(window=0.05)
+    user = User(credentials, user_id=123).load() # waits for 50ms for the others.
+
+For single-threaded bulk hydration, there is no need for windows and threads:
+    UsersLookupBatcher().load_all([User(credentials, user_id=i) for i in ids])
+"""
+
+import threading
+from .models import UsersLookup
+from .errors import OperationNotFoundError
+
+
+class Batcher(object):
+    """
+    Base batcher. Should never be instantiated directly.
+    Descendants must implement identify() and flush() methods.
+    """
+
+    class Batch(object):
+        def __init__(self):
+            super(Batcher.Batch, self).__init__()
+            self.models = []
+            self.error = None
+            self.full = threading.Event()
+            self.done = threading.Event()
+
+    def __init__(self, window=0.05, size=100):
+        super(Batcher, self).__init__()
+        self.window = window
+        self.size = size
+        self.lock = threading.Lock()
+        self.pending = {}
+
+    def identify(self, model):
+        """
+        Returns the key of the batch where the model can be added to,
+        or None if the model cannot be loaded in bulk at all.
+        """
+        raise NotImplemented()
+
+    def flush(self, models):
+        """
+        Loads all the models of one batch (no more than the batch size)
+        in one request, and stores the data into each of them.
+        """
+        raise NotImplemented()
+
+    def load(self, model):
+        """
+        Adds the model to a pending batch and blocks until the batch is flushed.
+        Returns True if the model has been loaded, or False if it is declined.
+        """
+        key = self.identify(model)
+        if key is None:
+            return False
+
+        with self.lock:
+            batch = self.pending.get(key)
+            leader = batch is None
+            if leader:
+                batch = self.pending[key] = self.Batch()
+            batch.models.append(model)
+            if len(batch.models) >= self.size:
+                del self.pending[key] # no more models for this batch
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self.lock:
+                if self.pending.get(key) is batch:
+                    del self.pending[key]
+            try:
+                self.flush(batch.models)
+            except Exception, e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        if not model.loaded:
+            raise OperationNotFoundError('Requested model is not found in the bulk response.')
+        return True
+
+    def load_all(self, models):
+        """
+        Loads all the models in as few bulk requests as possible, with no waiting.
+        Models which are declined by the batcher are loaded one by one as usually.
+        Models which are not found in the bulk responses remain not loaded.
+        Returns the list of the models for chained expressions.
+        """
+        models = list(models)
+        groups = {}
+        for model in models:
+            if model.loaded:
+                continue
+            key = self.identify(model)
+            if key is None:
+                model.load()
+            else:
+                groups.setdefault(key, []).append(model)
+        for group in groups.values():
+            for i in range(0, len(group), self.size):
+                self.flush(group[i:i+self.size])
+        return models
+
+
+class UsersLookupBatcher(Batcher):
+    """
+    Batcher for User models, which loads them via users/lookup operation by
+    their ids or screen names (up to 100 users per request). Models with
+    parameters not supported by users/lookup (skip_status) are declined.
+    """
+
+    LOOKUP_CLASS = UsersLookup
+
+    def identify(self, model):
+        if model.params.get('user_id') is None and model.params.get('screen_name') is None:
+            return None
+        if model.params.get('skip_status') is not None:
+            return None
+        return (model.api, model.params.get('include_entities'))
+
+    def flush(self, models):
+        if not models:
+            return
+        user_ids = [model.params['user_id'] for model in models if model.params.get('user_id') is not None]
+        screen_names = [model.params['screen_name'] for model in models if model.params.get('user_id') is None]
+        lookup = self.LOOKUP_CLASS(models[0].api,
+            user_id=user_ids or None,
+            screen_name=screen_names or None,
+            include_entities=models[0].params.get('include_entities'),
+            ).load()
+
+        by_id = {}
+        by_screen_name = {}
+        for data in lookup.data or []:
+            by_id[unicode(data.get('id'))] = data
+            by_screen_name[unicode(data.get('screen_name', '')).lower()] = data
+
+        for model in models:
+            if model.params.get('user_id') is not None:
+                data = by_id.get(unicode(model.params['user_id']))
+            else:
+                data = by_screen_name.get(unicode(model.params['screen_name']).lower())
+            if data is not None:
+                model.data = dict(data)
+                model.loaded = True
@@ -0,0 +1,149 @@
+# coding: utf-8
+"""
+Circuit breakers protect the application from a failing remote side. They are
+optionally passed to the constructor of the API instances.
+
+When a host degrades (it refuses connections, times out, or responds with server
+errors), all the calls to it block or fail slowly, and the workers pile up waiting
+for it. The breaker watches the outcomes of the calls and streams of every host
+(or of every operation of the host, if per_operation is set), and when there are
+too many consecutive failures, or the rate of failures in the recent calls is too
+high, it "opens the circuit": all calls to that host fail immediately with
+CircuitOpenError, with no network activity at all.
+
+After reset_timeout seconds, the circuit is "half-open": a few probe calls are let
+through (the others still fail fast). If a probe succeeds, the circuit is closed,
+and everything works as usual; if it fails, the circuit is opened again.
+
+Only the failures of the remote side are counted: network errors, and server
+errors and rate limiting (5xx, 420, 429). Other responses (e.g., 401 or 404) mean
+that the host works, and are counted as successes.
+
+Usage example:
+    api = API(breaker=CircuitBreaker(failures=5, reset_timeout=30))
+    try:
+        status = Status(credentials, id=123).load()
+    except CircuitOpenError:
+        ... # the host is down; do not wait for it.
+"""
+
+import time
+import urlparse
+import threading
+import collections
+from .instruments import operation_of
+from .errors import CircuitOpenError
+
+
+# States of the circuits.
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+
+class Circuit(object):
+    """
+    State and recent outcomes of one host (or operation).
+    """
+
+    def __init__(self, window):
+        super(Circuit, self).__init__()
+        self.state = CLOSED
+        self.failures = 0 # consecutive ones.
+        self.outcomes = collections.deque(maxlen=window) # True for successes.
+        self.opened_at = None
+        self.probes = 0 # in flight, when half-open.
+        self.trips = 0
+
+
+class CircuitBreaker(object):
+    """
+    Per-host circuit breaker, as described above. The circuit is opened after
+    "failures" consecutive failures, or when at least error_rate of the last
+    "window" outcomes are failures (but only if there are at least min_calls of them).
+    """
+
+    FAILURE_STATUSES = (420, 429, 500, 502, 503, 504)
+
+    def __init__(self, failures=5, error_rate=0.5, window=20, min_calls=10, reset_timeout=30.0, probes=1, per_operation=False):
+        super(CircuitBreaker, self).__init__()
+        self.failures = failures
+        self.error_rate = error_rate
+        self.window = window
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.probes = probes
+        self.per_operation = per_operation
+        self.lock = threading.Lock()
+        self.circuits = {}
+
+    def key(self, request):
+        """ Returns the key of the circuit for the request: its host, or its operation. """
+        if self.per_operation:
+            return operation_of(request)
+        return urlparse.urlsplit(request.url).netloc
+
+    def enter(self, request):
+        """
+        Checks that the request can be performed. Returns the key of its circuit
+        to be passed to success() or failure() later. Raises if the circuit is open.
+        """
+        key = self.key(request)
+        with self.lock:
+            circuit = self.circuits.get(key)
+            if circuit is None:
+                circuit = self.circuits[key] = Circuit(self.window)
+            if circuit.state == OPEN:
+                if time.time() - circuit.opened_at < self.reset_timeout:
+                    raise CircuitOpenError('Circuit of %s is open after its failures.' % key)
+                circuit.state = HALF_OPEN
+                circuit.probes = 0
+            if circuit.state == HALF_OPEN:
+                if circuit.probes >= self.probes:
+                    raise CircuitOpenError('Circuit of %s is half-open, and is being probed.' % key)
+                circuit.probes += 1
+        return key
+
+    def success(self, key):
+        with self.lock:
+            circuit = self.circuits[key]
+            if circuit.state != CLOSED:
+                circuit.state = CLOSED
+                circuit.outcomes.clear()
+            circuit.failures = 0
+            circuit.outcomes.append(True)
+
+    def release(self, key):
+        """ Forgets the call which was not performed at all (e.g., it ran out of time before it). """
+        with self.lock:
+            circuit = self.circuits[key]
+            if circuit.state == HALF_OPEN:
+                circuit.probes = max(0, circuit.probes - 1)
+
+    def failure(self, key, error=None):
+        """ Records the failure of the call; errors which are not the host's failures are successes. """
+        if error is not None and not self.is_failure(error):
+            return self.success(key)
+        with self.lock:
+            circuit = self.circuits[key]
+            circuit.failures += 1
+            circuit.outcomes.append(False)
+            if circuit.state == HALF_OPEN or self.tripped(circuit):
+                circuit.state = OPEN
+                circuit.opened_at = time.time()
+                circuit.trips += 1
+
+    def is_failure(self, error):
+        code = getattr(error, 'code', None)
+        return code is None or code in self.FAILURE_STATUSES
+
+    def tripped(self, circuit):
+        if circuit.failures >= self.failures:
+            return True
+        if len(circuit.outcomes) >= self.min_calls:
+            return circuit.outcomes.count(False) >= self.error_rate * len(circuit.outcomes)
+        return False
+
+    def states(self):
+        """ Returns the states of all the known circuits, for monitoring. """
+        with self.lock:
+            return dict([(key, dict(state=circuit.state, failures=circuit.failures, trips=circuit.trips))
+                         for key, circuit in self.circuits.items()])
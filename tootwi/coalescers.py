@@ -0,0 +1,81 @@
+# coding: utf-8
+"""
+Coalescers deduplicate identical API calls which are in flight at the same time.
+They are optionally passed to the constructor of the API instances.
+
+When many threads ask for the same data at the same instant (for example, for
+the same status or for credentials verification), only the first of them
+performs the actual request, and all the others wait for its completion and
+receive equal decoded results (or the same exception). Once the request is
+completed, the next identical call will perform a new request; i.e., this is
+not a cache, but only a protection against a thundering herd.
+
+The decoded result is received only once, so each of the waiters gets its own
+deep copy of it, and can modify it in place without affecting the others
+(for example, models store the result of their load() as their data).
+
+Only read operations (GET) are coalesced; see Credentials.call() for the key.
+"""
+
+import copy
+import threading
+
+
+class Coalescer(object):
+    """
+    Base coalescer. Should never be instantiated directly.
+    Descendants must implement __call__(key, fn) method, which performs
+    the call via fn() or waits for another identical call with the same key.
+    """
+
+    def __call__(self, key, fn):
+        raise NotImplemented()
+
+
+class SingleFlightCoalescer(Coalescer):
+    """
+    Coalescer, which allows only one in-flight call per key. All concurrent
+    calls with the same key wait for the first one and share its outcome:
+    the first caller gets the original result, the others get its copies.
+    """
+
+    class Flight(object):
+        def __init__(self):
+            super(SingleFlightCoalescer.Flight, self).__init__()
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        super(SingleFlightCoalescer, self).__init__()
+        self.lock = threading.Lock()
+        self.flights = {}
+
+    def __call__(self, key, fn):
+        try:
+            hash(key)
+        except TypeError: # unhashable parameters, e.g. lists, cannot be coalesced.
+            return fn()
+
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = self.Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return copy.deepcopy(flight.result)
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except Exception, e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
@@ -27,7 +27,9 @@ or its method is called. There should be no dependency imports in this module it
 since not all of them might be installed (and not all of them are really required).
 """
 
+import time
 from .api import WebRequest, API
+from .instruments import operation_of, SIGN
 from .models import Account
 from .formats import FormFormat
 
@@ -56,19 +58,62 @@ class Credentials(object):
         """
         raise NotImplemented()
     
+    @property
+    def identity(self):
+        """
+        Hashable value which identifies on whose behalf the calls are made.
+        Calls with the same identity can share their results (see coalescers).
+        By default, each credentials instance is an identity of its own.
+        """
+        return self
+    
     def call(self, operation, parameters=None, **kwargs):
         """
         Delegates the single-data call to API instance.
         Returns decoded object.
+        
+        If API instance has a coalescer, identical read calls (same url, parameters,
+        headers and format) made at the same time with the same identity are
+        performed only once, and the result is copied to all of the callers.
+        
+        If API instance has a retrier or a hedger, each retry or hedge is signed anew
+        (fresh nonce and timestamp). If it has a scheduler, the call is classified
+        by it (see tootwi.schedulers) to get its turn for the throttler.
         """
-        return self.api.call(self.sign(self.api.invoke(operation, parameters, **kwargs)))
+        invocation = self.api.invoke(operation, parameters, **kwargs)
+        options = {} # passed only when needed, so the API classes with no such options still work.
+        if self.api.retrier is not None or self.api.hedger is not None:
+            options['resign'] = lambda: self.signed(invocation)
+        if self.api.scheduler is not None:
+            options['ticket'] = self.api.scheduler.classify(self, invocation)
+        perform = lambda: self.api.call(self.signed(invocation), **options)
+        if self.api.coalescer is not None and invocation.method == 'GET':
+            key = (invocation.method, invocation.url,
+                   tuple(sorted(invocation.parameters.items())),
+                   tuple(sorted(invocation.headers.items())),
+                   invocation.format.identity,
+                   self.identity)
+            return self.api.coalescer(key, perform)
+        return perform()
     
     def flow(self, operation, parameters=None, **kwargs):
         """
         Delegates the multi-data flow to API instance.
         Returns generator, which yields decoded objects.
         """
-        return self.api.flow(self.sign(self.api.invoke(operation, parameters, **kwargs)))
+        return self.api.flow(self.signed(self.api.invoke(operation, parameters, **kwargs)))
+    
+    def signed(self, invocation):
+        """
+        Signs the invocation, and measures the time of it if the API is instrumented.
+        """
+        instrument = self.api.instrument
+        if instrument is None:
+            return self.sign(invocation)
+        started = time.time()
+        request = self.sign(invocation)
+        instrument.observe(SIGN, operation_of(invocation), time.time() - started)
+        return request
 
 
 class OAuthCredentials(Credentials):
@@ -92,6 +137,10 @@ class OAuthCredentials(Credentials):
         self.token_key = token_key
         self.token_secret = token_secret
     
+    @property
+    def identity(self):
+        return (self.__class__.__name__, self.consumer_key, self.token_key)
+    
     def sign(self, invocation):
         """
         Creates and signs the request with OAuth credentials. Also add extra
@@ -136,7 +185,7 @@ class OAuthCredentials(Credentials):
 #           headers.update(request.to_header())
         
         # Return signed read-only request object as required by credentials protocol.
-        return WebRequest(url=url, method=method, headers=headers, postdata=postdata, format=invocation.format)
+        return WebRequest(url=url, method=method, headers=headers, postdata=postdata, format=invocation.format, template=invocation.template)
 
 
 class ApplicationCredentials(OAuthCredentials):
@@ -266,6 +315,10 @@ class BasicCredentials(Credentials):
         self.username = username
         self.password = password
     
+    @property
+    def identity(self):
+        return (self.__class__.__name__, self.username)
+    
     def sign(self, invocation):
         """
         Creates and signs the request with HTTP Basic authorization header.
@@ -282,4 +335,4 @@ class BasicCredentials(Credentials):
             'Authorization': 'Basic ' + base64.b64encode('%s:%s' % (self.username, self.password)),
         })
         
-        return WebRequest(url=invocation.url, method=invocation.method, headers=headers, postdata=None, format=invocation.format)
+        return WebRequest(url=invocation.url, method=invocation.method, headers=headers, postdata=None, format=invocation.format, template=invocation.template)
@@ -18,3 +18,20 @@ class FormatError(Error): pass
 class FormatValueError(Error): pass
 class FormatValueIsNotStringError(FormatValueError): pass
 class ExternalFormatCallableError(FormatError): pass
+
+class CircuitError(Error): pass
+class CircuitOpenError(CircuitError): pass # the host has failed recently; the calls fail fast
+
+class DeadlineError(Error): pass
+class DeadlineExceededError(DeadlineError): pass # the call cannot be completed before its deadline
+
+class WriteError(Error): pass
+class WriteTimeoutError(WriteError): pass # the write is not applied yet when its result is requested
+class WriteQueueStoppedError(WriteError): pass # the writer is stopped before the write is applied
+
+class ModelError(Error): pass
+class ModelClassError(ModelError): pass # deserialized data are not of the expected model class
+
+class StreamError(Error): pass
+class StreamHubRunningError(StreamError): pass # restarting a hub while its previous thread is alive
+class StreamShardsExhaustedError(StreamError): pass # no more credentials for new shards
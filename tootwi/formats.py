@@ -9,14 +9,60 @@ making a request. Extension must be an attribute of the format, even if the
 format is a regular function (function can have attributes in Python). If no
 extension is specified, then no extension is added to the URL (same as if it
 was None or an empty string).
+
+Formats decode str and unicode lines, and also bytearray, buffer and memoryview
+objects. The decoders need strings, so such buffers are converted to str once per
+line (wrapping formats pass the converted line on). The lines are not stripped
+before decoding, since stripping copies them: the surrounding whitespace is either
+skipped by the decoders themselves, or the blank lines are detected in place.
+
+JsonFormat can also decode a value in place from a (buffer, start, end) slice of
+a larger string with decode_from(). API.flow() does not use it: the transports
+return the lines from readline(), which are decoded with decode() as they are.
 """
 
 from .errors import ExternalFormatCallableError, FormatValueIsNotStringError
 
 
+# Types accepted as undecoded data, in addition to strings.
+BUFFER_TYPES = (basestring, bytearray, buffer, memoryview)
+
+
+def is_blank(data):
+    """ Checks if the data are empty or whitespace only (copying only memoryviews). """
+    if isinstance(data, memoryview):
+        data = data.tobytes() #NB: memoryview has no string methods; it is a rare case anyway.
+    return not data or data.isspace()
+
+
+def as_string(data):
+    """ Converts the buffers to str (once, if needed at all), leaves strings as is. """
+    if isinstance(data, basestring):
+        return data
+    elif isinstance(data, memoryview):
+        return data.tobytes()
+    else:
+        return str(data)
+
+
 class Format(object):
     def decode(self, data):
         raise NotImplemented()
+    
+    def decode_from(self, buffer, start=0, end=None):
+        """
+        Decodes the data located between start and end in the buffer. By default,
+        the data are sliced; descendants can decode them in place if they can.
+        """
+        return self.decode(buffer[start:end])
+    
+    @property
+    def identity(self):
+        """
+        Hashable value which tells whether two formats decode data the same way.
+        Calls with different format identities never share their results.
+        """
+        return self.__class__
 
 
 class ExternalFormat(Format):
@@ -28,14 +74,18 @@ class ExternalFormat(Format):
         self._extension = extension
     
     def decode(self, data):
-        if not isinstance(data, basestring):
+        if not isinstance(data, BUFFER_TYPES):
             raise FormatValueIsNotStringError("Cannot decode value which is not string.")
-        data = data.strip()
+        data = as_string(data).strip() #NB: external callbacks expect the stripped strings.
         return None if not data else self._cb(data)
     
     @property
     def extension(self):
         return self._extension
+    
+    @property
+    def identity(self):
+        return (self.__class__, self._cb, self._extension)
 
 
 class FormFormat(Format):
@@ -45,12 +95,26 @@ class FormFormat(Format):
     """
     extension = None
     def decode(self, data):
-        import urlparse
-        if not isinstance(data, basestring):
+        """
+        Same as urlparse.parse_qsl() with keep_blank_values and strict_parsing,
+        but the result is built in one pass over the pairs. Only "&" separates
+        the pairs (";" is obsolete, and is never used by OAuth providers).
+        """
+        from urllib import unquote_plus
+        if not isinstance(data, BUFFER_TYPES):
             raise FormatValueIsNotStringError("Cannot decode value which is not string.")
-        data = data.strip()
-        vals = dict(urlparse.parse_qsl(data, keep_blank_values=True, strict_parsing=True)) if data else {}
-        return dict([(self.force_unicode(k), self.force_unicode(v)) for k,v in vals.items()])
+        data = as_string(data)
+        result = {}
+        if is_blank(data):
+            return result
+        pairs = data.split('&')
+        pairs[0], pairs[-1] = pairs[0].lstrip(), pairs[-1].rstrip() # only the ends can have whitespace.
+        for pair in pairs:
+            name, equals, value = pair.partition('=')
+            if not equals:
+                raise ValueError("bad query field: %r" % (pair,))
+            result[self.force_unicode(unquote_plus(name))] = self.force_unicode(unquote_plus(value))
+        return result
     
     def force_unicode(self, s, encoding='utf8'):
         if isinstance(s, unicode):
@@ -71,8 +135,127 @@ class JsonFormat(Format):
     """
     extension = 'json'
     def decode(self, data):
-        import json
-        if not isinstance(data, basestring):
+        if not isinstance(data, BUFFER_TYPES):
+            raise FormatValueIsNotStringError("Cannot decode value which is not string.")
+        data = as_string(data)
+        return self.decoder.decode(data) if not is_blank(data) else None #NB: whitespace is skipped by json.
+    
+    def decode_from(self, buffer, start=0, end=None):
+        """
+        Decodes the JSON value which starts in the buffer at the start position
+        (whitespace allowed), without slicing the buffer. Only whitespace is allowed
+        after the value up to the end. The buffer must be a string (str or unicode).
+        """
+        from json.decoder import WHITESPACE
+        if not isinstance(buffer, basestring):
+            return super(JsonFormat, self).decode_from(buffer, start, end)
+        end = len(buffer) if end is None else end
+        start = WHITESPACE.match(buffer, start, end).end()
+        if start >= end:
+            return None
+        data, stop = self.decoder.raw_decode(buffer, start)
+        if stop > end or WHITESPACE.match(buffer, stop, end).end() != end:
+            raise ValueError("Extra data or truncated value at %d..%d." % (start, end))
+        return data
+    
+    _decoder = None
+    @property
+    def decoder(self):
+        # Decoders are stateless, so one shared instance is enough.
+        if JsonFormat._decoder is None:
+            import json
+            JsonFormat._decoder = json.JSONDecoder('utf8')
+        return JsonFormat._decoder
+
+
+class CompactFormat(Format):
+    """
+    Compact binary encoding of the decoded data, for passing them between the
+    processes and for storing them (see Model.serialize()). Not used by Twitter.
+    
+    MessagePack is used if it is installed; otherwise, the built-in marshal module
+    is used (it is fast and compact too, but its format depends on Python version,
+    so all the processes must run the same one). The first byte of the encoded data
+    tells which encoding was used, so the data are decoded properly either way.
+    """
+    extension = None
+    MSGPACK = 'M'
+    MARSHAL = 'm'
+    
+    _msgpack_available = None
+    
+    def __init__(self, use_msgpack=None):
+        super(CompactFormat, self).__init__()
+        if use_msgpack is None:
+            if CompactFormat._msgpack_available is None: # failed imports are not cached by Python.
+                try:
+                    import msgpack
+                    CompactFormat._msgpack_available = True
+                except ImportError:
+                    CompactFormat._msgpack_available = False
+            use_msgpack = CompactFormat._msgpack_available
+        self.use_msgpack = use_msgpack
+    
+    def encode(self, data):
+        if self.use_msgpack:
+            import msgpack
+            return self.MSGPACK + msgpack.packb(data, use_bin_type=True)
+        else:
+            import marshal
+            return self.MARSHAL + marshal.dumps(data)
+    
+    def decode(self, data):
+        if not isinstance(data, BUFFER_TYPES):
+            raise FormatValueIsNotStringError("Cannot decode value which is not string.")
+        data = as_string(data)
+        if not data:
+            return None
+        elif data[0] == self.MSGPACK:
+            import msgpack
+            return msgpack.unpackb(data[1:], raw=False)
+        elif data[0] == self.MARSHAL:
+            import marshal
+            return marshal.loads(data[1:])
+        else:
+            raise ValueError("Unknown compact encoding: %r." % data[0])
+
+
+class PrefilteredFormat(Format):
+    """
+    Wraps another format (JSON by default) and skips the lines not accepted
+    by the predicate before they are decoded, as if they were keep-alives
+    (i.e., returns None). The predicate is called with the raw line.
+    
+    If the predicate is not exact (see tootwi.predicates), the decoded data
+    of the accepted lines are verified with it too, and skipped if wrong.
+    """
+    def __init__(self, predicate, format=None):
+        super(PrefilteredFormat, self).__init__()
+        if format is None:
+            format = JsonFormat
+        if isinstance(format, type):
+            format = format()
+        if not isinstance(format, Format):
+            format = ExternalFormat(format)
+        self.predicate = predicate
+        self.format = format
+    
+    @property
+    def extension(self):
+        return self.format.extension
+    
+    @property
+    def identity(self):
+        return (self.__class__, self.predicate, self.format.identity)
+    
+    def decode(self, data):
+        if not isinstance(data, BUFFER_TYPES):
             raise FormatValueIsNotStringError("Cannot decode value which is not string.")
-        data = data.strip()
-        return json.loads(data, 'utf8') if data else None
+        data = as_string(data) # once for the predicate and the wrapped format.
+        if not is_blank(data) and not self.predicate(data):
+            return None
+        decoded = self.format.decode(data)
+        if decoded is not None and not getattr(self.predicate, 'exact', True):
+            if not self.predicate.verify(data, decoded):
+                return None
+        return decoded
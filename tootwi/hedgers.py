@@ -0,0 +1,152 @@
+# coding: utf-8
+"""
+Hedgers cut the tail latency of the read calls. They are optionally passed
+to the constructor of the API instances.
+
+When a call does not respond for too long (longer than most of the calls of the
+same operation do), it is most likely stuck on a slow connection or a slow server,
+and will finish late. Instead of waiting for it, the hedger sends a duplicate of
+the request, and returns whichever of the two responds first; the other one is
+cancelled (its response is not read, its connection is closed once it opens).
+
+The delay before the duplicate is a quantile (e.g., p95) of the recent latencies
+of the same operation (the URL template, as in tootwi.instruments), so only the
+slowest few percents of the calls are duplicated, and the extra load is small.
+Until there are enough latencies observed, the default delay is used.
+
+The attempts are performed in the worker threads of the hedger, while the calling
+thread waits for the first result (it cannot wait in a blocking transport itself,
+or it could not return the hedge's response first). The workers are reused, and
+only started when all of them are busy, so there are as many of them as there
+were attempts in flight at most.
+
+Only GET calls are hedged, since they are idempotent. The duplicates go through
+the throttler of the API, as all other requests, and are signed anew. Each of them
+is sent on a connection of its own (the transports open a new one per request).
+
+Usage example:
+    api = API(hedger=QuantileHedger(quantile=0.95))
+    status = Status(credentials, id=123).load()
+"""
+
+import time
+import threading
+import collections
+from .instruments import operation_of
+try:
+    import queue # python-3
+except ImportError:
+    import Queue as queue # python-2
+
+
+class Hedger(object):
+    """
+    Base hedger. Should never be instantiated directly. Descendants must implement
+    __call__(fetch, request, duplicate) method, where fetch(request, cancelled)
+    performs the request and returns (opened time, body), and duplicate() returns
+    the request to be sent as a hedge (throttled and signed anew).
+    """
+
+    def __call__(self, fetch, request, duplicate):
+        raise NotImplemented()
+
+
+class QuantileHedger(Hedger):
+    """
+    Hedges the calls which are slower than the quantile of the recent latencies
+    (the last "window" ones of each operation), clipped to min_delay..max_delay.
+    """
+
+    def __init__(self, quantile=0.95, window=1000, min_samples=20, default_delay=1.0, min_delay=0.05, max_delay=5.0):
+        super(QuantileHedger, self).__init__()
+        self.quantile = quantile
+        self.window = window
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.latencies = {} # {operation: deque of the recent latencies}
+        self.tasks = queue.Queue()
+        self.idle = 0 # workers waiting for the tasks.
+        self.hedged = 0
+        self.won = 0 # how many times the duplicate was faster.
+
+    def record(self, operation, elapsed):
+        with self.lock:
+            latencies = self.latencies.get(operation)
+            if latencies is None:
+                latencies = self.latencies[operation] = collections.deque(maxlen=self.window)
+            latencies.append(elapsed)
+
+    def delay(self, operation):
+        """ Returns the time to wait for the call before hedging it. """
+        with self.lock:
+            latencies = list(self.latencies.get(operation) or [])
+        if len(latencies) < self.min_samples:
+            return self.default_delay
+        latencies.sort()
+        value = latencies[min(len(latencies) - 1, int(self.quantile * len(latencies)))]
+        return min(self.max_delay, max(self.min_delay, value))
+
+    def submit(self, results, fn, *args):
+        """
+        Runs fn(*args) in an idle worker, or in a new one if all the workers are busy;
+        puts its result to the results queue once the worker is idle again.
+        """
+        with self.lock:
+            if self.idle:
+                self.idle -= 1
+            else:
+                thread = threading.Thread(target=self.work)
+                thread.daemon = True
+                thread.start()
+        self.tasks.put((results, fn, args))
+
+    def work(self):
+        while True:
+            results, fn, args = self.tasks.get()
+            result = fn(*args)
+            with self.lock:
+                self.idle += 1
+            results.put(result)
+
+    def __call__(self, fetch, request, duplicate):
+        operation = operation_of(request)
+        results = queue.Queue()
+        cancelled = threading.Event()
+
+        def attempt(index, request, started):
+            try:
+                if request is None:
+                    request = duplicate()
+                opened, body = fetch(request, cancelled)
+                if not cancelled.is_set():
+                    self.record(operation, time.time() - started)
+                return index, None, (opened, body)
+            except Exception, e:
+                return index, e, None
+
+        self.submit(results, attempt, 0, request, time.time())
+        try:
+            pending, (index, error, result) = 1, results.get(timeout=self.delay(operation))
+        except queue.Empty:
+            with self.lock:
+                self.hedged += 1
+            self.submit(results, attempt, 1, None, time.time())
+            pending, (index, error, result) = 2, results.get()
+
+        # If the first finished attempt failed, the other one (if any) still has a chance.
+        while error is not None and pending > 1:
+            pending -= 1
+            first_error = error
+            index, error, result = results.get()
+            if error is not None:
+                error = first_error
+        cancelled.set() # the loser does not read its response.
+        if error is not None:
+            raise error
+        if index == 1:
+            with self.lock:
+                self.won += 1
+        return result
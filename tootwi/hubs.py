@@ -0,0 +1,228 @@
+# coding: utf-8
+"""
+Hubs share one upstream stream between many in-process subscribers. Twitter
+allows only one connection per account to most of the streams, so when few
+components of an application need the same stream, they should subscribe to
+a hub instead of iterating over their own streams.
+
+The hub reads the upstream stream in its own thread. Each message is received,
+decoded and made an item by the stream's factory exactly once, and then the very
+same item is dispatched to all the subscribers whose predicates accept it.
+Thus, subscribers must not modify the items in place.
+
+Each subscription has its own bounded queue, so slow subscribers do not affect
+fast ones, unless they are explicitly asked to (BLOCK policy). When the queue
+is full, the policy of the subscription decides what to do with a new item
+(and with the end marker, which is never dropped, when the stream is over):
+* BLOCK -- wait till the subscriber takes an item (slows down the whole hub);
+* DROP_NEWEST -- discard the new item, keeping the queue as is;
+* DROP_OLDEST -- discard the oldest item in the queue to free a slot.
+
+Usage example:
+    hub = StreamHub(SampleStream(credentials, MessageFactory()))
+    statuses = hub.subscribe(lambda item: isinstance(item, Status))
+    everything = hub.subscribe(maxsize=10000, policy=Subscription.DROP_OLDEST)
+    with hub:
+        for status in statuses:
+            print(status)
+"""
+
+import threading
+from .errors import StreamHubRunningError
+try:
+    import queue # python-3
+except ImportError:
+    import Queue as queue # python-2
+
+
+class Subscription(object):
+    """
+    Subscriber's end of the hub. Iterate over it to get the items accepted
+    by the predicate. Iteration ends when the subscription is closed or
+    when the hub is stopped; if the upstream stream has failed, the error
+    is re-raised in the subscriber's thread.
+    """
+
+    BLOCK = 'block'
+    DROP_NEWEST = 'drop-newest'
+    DROP_OLDEST = 'drop-oldest'
+
+    END = object() # a marker put into the queue to stop the iteration.
+
+    def __init__(self, hub, predicate=None, maxsize=1000, policy=BLOCK):
+        super(Subscription, self).__init__()
+        if policy not in (self.BLOCK, self.DROP_NEWEST, self.DROP_OLDEST):
+            raise ValueError("Unknown subscription policy: %r." % (policy,))
+        self.hub = hub
+        self.predicate = predicate
+        self.policy = policy
+        self.maxsize = maxsize
+        # Dropping queues keep one extra slot for the end marker, and limit the items
+        # themselves in offer(); so the hub's thread never blocks on them, even at the end.
+        self.queue = queue.Queue(maxsize if policy == self.BLOCK or maxsize <= 0 else maxsize + 1)
+        self.dropped = 0
+        self.error = None
+        self.closed = False
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is self.END:
+                if self.error is not None:
+                    raise self.error
+                return
+            yield item
+
+    @property
+    def backlog(self):
+        return self.queue.qsize()
+
+    def offer(self, item):
+        """
+        Called by the hub for each item; puts the item into the queue according
+        to the predicate and the policy. Runs in the hub's thread, so must be fast.
+        Since the hub's thread is the only producer, the size checks are safe.
+        """
+        if self.closed:
+            return
+        if self.predicate is not None and not self.predicate(item):
+            return
+        if self.policy == self.BLOCK or self.maxsize <= 0:
+            self.queue.put(item)
+        elif self.policy == self.DROP_NEWEST:
+            if self.queue.qsize() >= self.maxsize:
+                self.dropped += 1
+            else:
+                self.queue.put_nowait(item)
+        else:
+            while self.queue.qsize() >= self.maxsize:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    break
+            self.queue.put_nowait(item)
+
+    def finish(self, error=None, force=False):
+        """
+        Called by the hub when there will be no more items. Unlike offer(),
+        the end marker is never dropped. Dropping subscriptions always have
+        a slot reserved for it; blocking subscriptions wait for a free slot,
+        unless forced (when the hub is stopped) -- then the oldest items are
+        discarded to free the slot, so that the stopping thread never blocks.
+        """
+        self.error = error
+        if self.policy == self.BLOCK and not force:
+            self.queue.put(self.END)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(self.END)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def close(self):
+        """
+        Unsubscribes from the hub. Items already in the queue are discarded.
+        """
+        if not self.closed:
+            self.closed = True
+            self.hub.unsubscribe(self)
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.finish(force=True)
+
+
+class StreamHub(object):
+    """
+    Holds one upstream stream and dispatches its items to many subscriptions.
+    The hub can be used as a context manager, which starts and stops it.
+
+    The hub can be restarted after it is stopped, but only when the thread
+    of the previous run is over (so there is never more than one connection).
+    """
+
+    SUBSCRIPTION_CLASS = Subscription
+
+    def __init__(self, stream):
+        super(StreamHub, self).__init__()
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.subscriptions = []
+        self.stopping = None
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def subscribe(self, predicate=None, maxsize=1000, policy=Subscription.BLOCK):
+        subscription = self.SUBSCRIPTION_CLASS(self, predicate=predicate, maxsize=maxsize, policy=policy)
+        with self.lock:
+            self.subscriptions = self.subscriptions + [subscription] # copy-on-write for the hub's thread.
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions = [s for s in self.subscriptions if s is not subscription]
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            if not self.stopping.is_set():
+                return # already running
+            raise StreamHubRunningError("The previous run of the hub is not over yet.")
+        self.stopping = threading.Event() # each run has its own event, never reset.
+        self.thread = threading.Thread(target=self.run, args=(self.stopping,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, wait=False, timeout=None):
+        """
+        Asks the hub's thread to stop. Since the thread can be blocked while
+        reading the upstream stream, it actually stops and closes the stream
+        on the next item, but the subscriptions are finished immediately.
+        If asked to wait, joins the thread (up to the timeout, if specified).
+        """
+        if self.stopping is not None:
+            self.stopping.set()
+        self.finish(force=True)
+        if wait and self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+
+    def run(self, stopping=None):
+        """
+        Reads the stream and dispatches its items till the stream is over or
+        the run is stopped. Usually runs in the hub's thread (see start()).
+        """
+        stopping = stopping if stopping is not None else threading.Event()
+        error = None
+        iterator = iter(self.stream)
+        try:
+            for item in iterator:
+                if stopping.is_set():
+                    return
+                for subscription in self.subscriptions:
+                    subscription.offer(item)
+        except Exception, e:
+            error = e
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close() # generators close their connections (see API.flow()).
+            if not stopping.is_set():
+                self.finish(error)
+
+    def finish(self, error=None, force=False):
+        with self.lock:
+            subscriptions, self.subscriptions = self.subscriptions, []
+        for subscription in subscriptions:
+            subscription.finish(error, force=force)
@@ -0,0 +1,194 @@
+# coding: utf-8
+"""
+Instruments observe where the time goes inside API calls and streams.
+They are optionally passed to the constructor of the API instances.
+
+Each call or stream connection is split into phases, which are timed separately:
+* SIGN -- signing the request by the credentials;
+* THROTTLE -- waiting for the throttler;
+* CONNECT -- opening the transport (connecting, sending, receiving the headers);
+* TTFB -- from the opened transport to the first line (or body) of the response;
+* READ -- reading the lines or the body (for streams, includes waiting for messages);
+* DECODE -- decoding the lines or the body by the format;
+* FACTORY -- making the items of the stream messages by the stream's factory.
+Besides the timing, events are counted: calls, stream connections, messages,
+keep-alives, messages skipped by the prefilters, decode and transport errors, retries and hedges.
+Gauges report the current values of something, e.g. the backlog of a journal.
+
+All the measurements are grouped by the operation, which is the URL template of the
+request without the query string (so the calls with different parameters, in the
+query or in the path, are the same operation, and the operations are few).
+
+Instruments must be cheap, since they are called for every message of the streams.
+MemoryCollector keeps the counters and fixed-bucket histograms in preallocated
+lists; recording a measurement creates no objects (except for the first one of
+a new operation), so the collector can be left on in production. Its snapshot()
+returns the plain data to be logged or exported to the monitoring systems.
+
+Usage example:
+    collector = MemoryCollector()
+    api = API(instrument=collector)
+    ...
+    print collector.snapshot()
+"""
+
+import time
+import bisect
+import threading
+
+
+# Phases, as indexes in the per-operation lists of histograms.
+SIGN, THROTTLE, CONNECT, TTFB, READ, DECODE, FACTORY = range(7)
+PHASES = ('sign', 'throttle', 'connect', 'ttfb', 'read', 'decode', 'factory')
+
+# Events, as indexes in the per-operation lists of counters.
+CALLS, FLOWS, MESSAGES, KEEPALIVES, FILTERED, DECODE_ERRORS, TRANSPORT_ERRORS, BYTES, RETRIES, HEDGES = range(10)
+EVENTS = ('calls', 'flows', 'messages', 'keepalives', 'filtered', 'decode_errors', 'transport_errors', 'bytes', 'retries', 'hedges')
+
+# Gauges, as indexes in the per-operation lists of values.
+BACKLOG, = range(1)
+GAUGES = ('backlog',)
+
+# Upper bounds of the histogram buckets, in seconds: from 50us to 60s, roughly x2.5 each.
+DEFAULT_BOUNDS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                  0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def operation_of(request):
+    """
+    Returns the operation of the request (or of the invocation): its URL template
+    without the query string, so that e.g. all the statuses/show/%(id)s calls are
+    measured as one operation rather than per status id. Requests with no template
+    (e.g., made by custom credentials) are measured by their URLs.
+    """
+    return (getattr(request, 'template', None) or request.url).split('?', 1)[0]
+
+
+class Instrument(object):
+    """
+    Base instrument, which ignores everything (the same as no instrument at all).
+    Descendants override the methods for the measurements they are interested in.
+    """
+
+    def observe(self, phase, operation, elapsed):
+        pass
+
+    def count(self, event, operation, n=1):
+        pass
+
+    def gauge(self, gauge, operation, value):
+        pass
+
+
+class Histogram(object):
+    """
+    Fixed-bucket histogram of durations. The last bucket is for everything
+    longer than the last bound. Not thread-safe; the collector locks it.
+    """
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        super(Histogram, self).__init__()
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q):
+        """
+        Returns the upper bound of the bucket where the q-th quantile is
+        (or None if there are no values, or if it is beyond the last bound).
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.buckets):
+            seen += n
+            if seen >= rank:
+                return bound
+        return None
+
+    def snapshot(self):
+        return dict(count=self.count, total=self.total,
+                    mean=self.total / self.count if self.count else None,
+                    p50=self.quantile(0.5), p90=self.quantile(0.9), p99=self.quantile(0.99),
+                    buckets=zip(self.bounds + (None,), self.buckets))
+
+
+class OperationStats(object):
+    """
+    All the measurements of one operation.
+    """
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        super(OperationStats, self).__init__()
+        self.lock = threading.Lock()
+        self.histograms = [Histogram(bounds) for phase in PHASES]
+        self.counters = [0] * len(EVENTS)
+        self.gauges = [None] * len(GAUGES)
+        self.first_message = None
+        self.last_message = None
+
+    def snapshot(self):
+        with self.lock:
+            result = dict(zip(EVENTS, self.counters))
+            result.update(dict([(name, value) for name, value in zip(GAUGES, self.gauges) if value is not None]))
+            result['phases'] = dict([(name, h.snapshot()) for name, h in zip(PHASES, self.histograms) if h.count])
+            duration = (self.last_message or 0) - (self.first_message or 0)
+            result['messages_per_second'] = self.counters[MESSAGES] / duration if duration > 0 else None
+            return result
+
+
+class MemoryCollector(Instrument):
+    """
+    Instrument, which keeps all the measurements in memory, per operation.
+    """
+
+    STATS_CLASS = OperationStats
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        super(MemoryCollector, self).__init__()
+        self.bounds = tuple(bounds)
+        self.lock = threading.Lock()
+        self.operations = {}
+
+    def stats(self, operation):
+        try:
+            return self.operations[operation]
+        except KeyError:
+            with self.lock:
+                return self.operations.setdefault(operation, self.STATS_CLASS(self.bounds))
+
+    def observe(self, phase, operation, elapsed):
+        stats = self.stats(operation)
+        with stats.lock:
+            stats.histograms[phase].add(elapsed)
+
+    def count(self, event, operation, n=1):
+        stats = self.stats(operation)
+        with stats.lock:
+            stats.counters[event] += n
+            if event == MESSAGES:
+                stats.last_message = time.time()
+                if stats.first_message is None:
+                    stats.first_message = stats.last_message
+
+    def gauge(self, gauge, operation, value):
+        stats = self.stats(operation)
+        with stats.lock:
+            stats.gauges[gauge] = value
+
+    def snapshot(self):
+        """ Returns the measurements as {operation: {name: value}} with plain values only. """
+        with self.lock:
+            operations = self.operations.items()
+        return dict([(operation, stats.snapshot()) for operation, stats in operations])
+
+    def reset(self):
+        with self.lock:
+            self.operations = {}
@@ -0,0 +1,338 @@
+# coding: utf-8
+"""
+Journals make stream consumption durable: the messages received from a stream
+are appended to a local log on disk before they are given to the consumer, and
+the consumer's position in the log is checkpointed periodically. If the consumer
+crashes, it resumes from the last checkpoint after the restart, and processes the
+messages received but not processed before the crash; meanwhile, a new connection
+appends new messages to the end of the log, so the consumer catches up with them.
+The delivery is at-least-once: messages after the last checkpoint can be repeated.
+
+The log consists of segments: fixed-size memory-mapped files, named by the index
+of their first message. Messages are numbered sequentially through all segments;
+the index is what is checkpointed. When the current segment is full, a new one is
+started. To bound the disk usage, only max_segments segments are kept: the oldest
+ones are deleted, even if they are not consumed yet (the consumer then skips to
+the oldest message available; such losses are counted in the log's "dropped").
+
+Each record in a segment is a payload length (unsigned int, network byte order)
+followed by the payload. Segments are preallocated with zeros, so zero length
+marks the end of the data. Payloads are written before their lengths, so a crash
+in the middle of a write never leaves a half-written record visible.
+
+Usage example:
+    stream = DurableStream(SampleStream(credentials, MessageFactory()), '/var/lib/sample')
+    for item in stream:
+        process(item) # the item is committed when the next one is requested.
+"""
+
+import os
+import json
+import mmap
+import time
+import struct
+import threading
+from .instruments import operation_of, BACKLOG
+
+
+class Segment(object):
+    """
+    One memory-mapped segment file of the log. Not thread-safe on its own.
+    """
+
+    HEADER = struct.Struct('!I')
+
+    def __init__(self, path, base, size):
+        super(Segment, self).__init__()
+        self.path = path
+        self.base = base
+        exists = os.path.exists(path)
+        self.file = open(path, 'r+b' if exists else 'w+b')
+        if not exists:
+            self.file.truncate(size) # sparse on most file systems.
+        self.size = os.path.getsize(path)
+        self.mmap = mmap.mmap(self.file.fileno(), self.size)
+        self.count, self.position = self.scan()
+
+    def scan(self):
+        """ Finds the number of records and the end of the data. """
+        count, position = 0, 0
+        while True:
+            record = self.read(position)
+            if record is None:
+                return count, position
+            count, position = count + 1, record[1]
+
+    def read(self, position):
+        """ Returns (payload, next position) of the record, or None if there is none. """
+        if position + self.HEADER.size > self.size:
+            return None
+        length, = self.HEADER.unpack_from(self.mmap, position)
+        if length == 0 or position + self.HEADER.size + length > self.size:
+            return None
+        start = position + self.HEADER.size
+        return self.mmap[start:start + length], start + length
+
+    def append(self, payload):
+        """ Appends the record if it fits into the segment; returns whether it did. """
+        start = self.position + self.HEADER.size
+        if start + len(payload) > self.size:
+            return False
+        self.mmap[start:start + len(payload)] = payload
+        self.HEADER.pack_into(self.mmap, self.position, len(payload))
+        self.position = start + len(payload)
+        self.count += 1
+        return True
+
+    def flush(self):
+        self.mmap.flush()
+
+    def close(self):
+        self.mmap.close()
+        self.file.close()
+
+    def delete(self):
+        self.close()
+        os.remove(self.path)
+
+
+class SegmentLog(object):
+    """
+    Append-only log of segments with a checkpointed consumer offset.
+    Thread-safe: one thread can append while another one reads.
+    """
+
+    SEGMENT_CLASS = Segment
+    SEGMENT_SUFFIX = '.seg'
+    OFFSET_FILE = 'offset'
+
+    def __init__(self, directory, segment_size=64*1024*1024, max_segments=16):
+        super(SegmentLog, self).__init__()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max(2, max_segments) # the tail and at least one being read.
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+        self.finished = False # no more messages will be appended; the readers stop at the tail.
+
+        bases = sorted([int(name[:-len(self.SEGMENT_SUFFIX)]) for name in os.listdir(directory)
+                        if name.endswith(self.SEGMENT_SUFFIX)])
+        self.segments = [self.open_segment(base) for base in bases or [0]]
+
+    def open_segment(self, base):
+        path = os.path.join(self.directory, '%020d%s' % (base, self.SEGMENT_SUFFIX))
+        return self.SEGMENT_CLASS(path, base, self.segment_size)
+
+    @property
+    def head(self):
+        """ Index of the oldest message available. """
+        return self.segments[0].base
+
+    @property
+    def tail(self):
+        """ Index of the next message to be appended. """
+        return self.segments[-1].base + self.segments[-1].count
+
+    def append(self, payload):
+        """
+        Appends the payload as a new message; returns the index of the message.
+        Starts a new segment when the current one is full, and deletes the oldest
+        segments if there are too many of them.
+        """
+        if len(payload) + Segment.HEADER.size > self.segment_size:
+            raise ValueError("Message of %d bytes does not fit into a segment." % len(payload))
+        with self.condition:
+            if self.closed:
+                raise ValueError("The log is closed.")
+            index = self.tail
+            if not self.segments[-1].append(payload):
+                self.segments[-1].flush()
+                self.segments.append(self.open_segment(index))
+                self.segments[-1].append(payload)
+                while len(self.segments) > self.max_segments:
+                    self.segments.pop(0).delete()
+            self.condition.notify_all()
+            return index
+
+    def read(self, index, timeout=None):
+        """
+        Returns (index, payload) of the message at the index, or of the oldest message
+        available if that one is already deleted. Waits for the message to be appended
+        if it is not there yet; returns None if it is still not there after the timeout,
+        or if the log is finished and there are no more messages.
+        """
+        with self.condition:
+            deadline = time.time() + timeout if timeout is not None else None
+            while index >= self.tail and not self.closed:
+                if self.finished:
+                    return None
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+            if self.closed:
+                return None
+            if index < self.head:
+                self.dropped += self.head - index
+                index = self.head
+            for segment in reversed(self.segments):
+                if segment.base <= index:
+                    break
+            position = 0
+            for i in range(index - segment.base + 1):
+                payload, position = segment.read(position)
+            return index, payload
+
+    def iterate(self, index, timeout=None):
+        """
+        Yields (index, payload) of the messages starting from the index, waiting
+        for the new ones. Sequential reading, unlike read(), does not rescan the
+        segment for each message. Stops if nothing appears during the timeout,
+        or when everything is read from the finished log.
+        """
+        segment, position = None, 0
+        while True:
+            with self.condition:
+                if segment is None or segment not in self.segments or index >= segment.base + segment.count:
+                    segment = None
+                    if index >= self.tail or index < self.head:
+                        pass # wait or skip via read() below.
+                    else:
+                        for segment in reversed(self.segments):
+                            if segment.base <= index:
+                                break
+                        position = 0
+                        for i in range(index - segment.base):
+                            payload, position = segment.read(position)
+                if segment is not None:
+                    payload, position = segment.read(position)
+                    record = index, payload
+            if segment is None:
+                record = self.read(index, timeout)
+                if record is None:
+                    return
+            yield record
+            index = record[0] + 1
+
+    def load_offset(self):
+        """ Returns the checkpointed index of the next message to consume. """
+        try:
+            with open(os.path.join(self.directory, self.OFFSET_FILE), 'rb') as f:
+                return int(f.read().strip() or 0)
+        except IOError:
+            return self.head
+
+    def save_offset(self, index):
+        """ Flushes the data and atomically checkpoints the index of the next message to consume. """
+        with self.condition:
+            for segment in self.segments:
+                segment.flush()
+        path = os.path.join(self.directory, self.OFFSET_FILE)
+        with open(path + '.tmp', 'wb') as f:
+            f.write('%d\n' % index)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(path + '.tmp', path)
+
+    def finish(self):
+        """ Marks that nothing will be appended anymore: the readers stop once they read everything. """
+        with self.condition:
+            self.finished = True
+            self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            if not self.closed:
+                self.closed = True
+                for segment in self.segments:
+                    segment.flush()
+                    segment.close()
+                self.condition.notify_all()
+
+
+class DurableStream(object):
+    """
+    Stream wrapper, which puts the log between the connection and the consumer.
+    The messages are stored as decoded data (JSON-encoded again), and are made
+    items by the stream's factory only when they are consumed. An item is
+    considered processed when the next one is requested; the offset of processed
+    items is checkpointed every checkpoint_interval seconds and at the end.
+    If the API is instrumented, the backlog (messages received but not yet
+    consumed) is reported as a gauge at every checkpoint.
+
+    If the connection ends or fails, the consumer gets the messages received
+    before that, and then the iteration ends, or the error of the connection is
+    raised; the offset is checkpointed either way. Reconnecting is up to the caller
+    (e.g., iterating again after a delay); the log resumes where it was left.
+    """
+
+    LOG_CLASS = SegmentLog
+
+    def __init__(self, stream, directory, segment_size=64*1024*1024, max_segments=16, checkpoint_interval=1.0):
+        super(DurableStream, self).__init__()
+        self.stream = stream
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.checkpoint_interval = checkpoint_interval
+        self.log = None
+        self.error = None # of the receiver, to be raised to the consumer.
+        self.stopping = threading.Event()
+
+    def receive(self, log):
+        """ Reads the stream and appends its messages to the log (in its own thread). """
+        flow = self.stream.api.flow(self.stream.get_operation(), self.stream.params)
+        try:
+            for data in flow:
+                if self.stopping.is_set():
+                    return
+                if data is not None: # keep-alives are not worth storing.
+                    log.append(json.dumps(data, separators=(',', ':')))
+        except Exception, e:
+            if not log.closed: # otherwise, closed by the consumer while we were receiving.
+                self.error = e
+        finally:
+            flow.close()
+            log.finish()
+
+    def __iter__(self):
+        log = self.log = self.LOG_CLASS(self.directory, self.segment_size, self.max_segments)
+        self.error = None
+        self.stopping.clear()
+        receiver = threading.Thread(target=self.receive, args=(log,))
+        receiver.daemon = True
+        receiver.start()
+
+        offset = log.load_offset()
+        checkpointed_at = time.time()
+        instrument = self.stream.api.api.instrument
+        if instrument is not None:
+            operation = operation_of(self.stream.api.api.invoke(self.stream.get_operation(), self.stream.params))
+        try:
+            for index, payload in log.iterate(offset):
+                item = json.loads(payload)
+                if self.stream.factory is not None:
+                    item = self.stream.factory(self.stream.api, item)
+                if item is not None:
+                    yield item
+                offset = index + 1 # the consumer asked for the next one, so this one is processed.
+                if time.time() - checkpointed_at >= self.checkpoint_interval:
+                    log.save_offset(offset)
+                    checkpointed_at = time.time()
+                    if instrument is not None:
+                        instrument.gauge(BACKLOG, operation, log.tail - offset)
+            if self.error is not None:
+                raise self.error
+        finally:
+            self.stopping.set()
+            if not log.closed:
+                log.save_offset(offset)
+
+    def close(self):
+        """ Stops receiving and closes the log. Call it when done with iterating. """
+        self.stopping.set()
+        if self.log is not None:
+            self.log.close()
@@ -0,0 +1,340 @@
+# coding: utf-8
+"""
+Stream managers keep one or more live stream connections under control, and
+present them to the application as one single iterator over their items.
+
+Regular streams are fixed once they are created: to change the parameters,
+the application has to stop iterating over a stream and to create a new one.
+Managed streams accept the changes at runtime instead, and reconnect on their
+own, no more often than once per interval (Twitter penalizes clients which
+reconnect too often). The changes made in between are accumulated and applied
+with one reconnect. To avoid gaps, a new connection is opened before an old one
+is closed, and for a short overlap both of them are read; the messages received
+twice are recognized by their ids and yielded only once.
+
+During the overlap, the old connection can still yield messages matching its
+old parameters (e.g., statuses of a user who is already removed from follows).
+
+When the follows do not fit into one connection, sharded streams partition them
+across few managed streams, each under its own credentials (Twitter limits both
+the number of follows per connection and the number of connections per account).
+All the shards are read concurrently, and merged into one iterator of unique items.
+
+Usage example:
+    stream = ManagedFilterStream(credentials, MessageFactory(), follow=[123])
+    for item in stream:
+        stream.add_follow(item['user']['id'])
+
+    stream = ShardedFilterStream([credentials1, credentials2], MessageFactory(), follow=many_ids)
+    for item in stream:
+        print(item)
+"""
+
+import time
+import threading
+import collections
+try:
+    import queue # python-3
+except ImportError:
+    import Queue as queue # python-2
+from .streams import FilterStream
+from .errors import StreamShardsExhaustedError
+
+
+class StreamReader(object):
+    """
+    Reads a stream in its own thread and puts its items into a shared queue
+    as (reader, item, error) tuples, so that the items from few readers can be
+    merged and distinguished. When the stream is over, puts END as an item;
+    when the stream fails, puts the error. Stopped readers put nothing more.
+
+    Since the thread can be blocked while reading the stream, it actually stops
+    and closes the stream on the next item after it has been asked to stop.
+    Streams which can watch for the stop on their own (i.e., have iterate(stopping)
+    method, as managed streams do) stop even if they have no items.
+    """
+
+    END = object()
+
+    def __init__(self, stream, items):
+        super(StreamReader, self).__init__()
+        self.stream = stream
+        self.queue = items
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+
+    def run(self):
+        error = None
+        iterator = self.stream.iterate(self.stopping) if hasattr(self.stream, 'iterate') else iter(self.stream)
+        try:
+            for item in iterator:
+                if self.stopping.is_set():
+                    return
+                self.queue.put((self, item, None))
+        except Exception, e:
+            error = e
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close() # generators close their connections (see API.flow()).
+        if not self.stopping.is_set():
+            self.queue.put((self, self.END, error))
+
+
+class Deduplicator(object):
+    """
+    Remembers the last few keys seen (bounded by size), and tells whether
+    a key has been seen already. Used to recognize duplicate messages
+    received from overlapping connections.
+    """
+
+    def __init__(self, size=10000):
+        super(Deduplicator, self).__init__()
+        self.size = size
+        self.keys = collections.OrderedDict()
+
+    def seen(self, key):
+        if key in self.keys:
+            return True
+        self.keys[key] = None
+        if len(self.keys) > self.size:
+            self.keys.popitem(last=False)
+        return False
+
+
+def identify(item):
+    """
+    Returns the id of a message (either a model or raw data), or None if
+    the message has no id (such messages are never treated as duplicates).
+    """
+    try:
+        return item['id']
+    except (KeyError, TypeError, IndexError):
+        return None
+
+
+class ManagedFilterStream(object):
+    """
+    Filter stream with follows and tracks which can be changed at runtime.
+    Changes are applied with a reconnect, but no more often than once per
+    interval; the old connection is closed after the overlap time since
+    the new one has been opened. Until there is anything to follow or
+    to track, there is no connection at all.
+    """
+
+    STREAM_CLASS = FilterStream
+    TICK = 0.5 # how often to check for changes when there are no messages.
+
+    def __init__(self, api, factory=None, follow=None, track=None, interval=60.0, overlap=5.0, dedup_size=10000, prefilter=None):
+        super(ManagedFilterStream, self).__init__()
+        self.api = api
+        self.factory = factory
+        self.prefilter = prefilter
+        self.follow = set([unicode(v) for v in follow or []])
+        self.track = set([unicode(v) for v in track or []])
+        self.interval = interval
+        self.overlap = overlap
+        self.dedup_size = dedup_size
+        self.lock = threading.Lock()
+        self.version = 0
+
+    def add_follow(self, *ids):
+        self.change(self.follow, set.update, ids)
+
+    def remove_follow(self, *ids):
+        self.change(self.follow, set.difference_update, ids)
+
+    def add_track(self, *terms):
+        self.change(self.track, set.update, terms)
+
+    def remove_track(self, *terms):
+        self.change(self.track, set.difference_update, terms)
+
+    def change(self, values, operation, changes):
+        with self.lock:
+            before = len(values)
+            operation(values, [unicode(v) for v in changes])
+            if len(values) != before:
+                self.version += 1
+
+    def connect(self, items):
+        """
+        Opens a new connection with current follows and tracks (if there are any).
+        Returns a tuple of the applied version and the reader (or None).
+        """
+        with self.lock:
+            version = self.version
+            follow = sorted(self.follow)
+            track = sorted(self.track)
+        if not follow and not track:
+            return version, None
+        stream = self.STREAM_CLASS(self.api, self.factory, follow=follow, track=track, prefilter=self.prefilter)
+        return version, StreamReader(stream, items).start()
+
+    def __iter__(self):
+        return self.iterate()
+
+    def iterate(self, stopping=None):
+        """
+        Same as iteration over the stream, but ends (and closes the connections)
+        within a tick after the stopping event is set, even if there are no items.
+        """
+        items = queue.Queue()
+        deduplicator = Deduplicator(self.dedup_size)
+        version, current = self.connect(items)
+        connected_at = time.time() if current is not None else None # of the last connection actually opened.
+        retiring = {} # reader -> time when it should be stopped.
+        try:
+            while stopping is None or not stopping.is_set():
+                now = time.time()
+                if version != self.version and (connected_at is None or now - connected_at >= self.interval):
+                    if current is not None:
+                        retiring[current] = now + self.overlap
+                    version, current = self.connect(items)
+                    if current is not None:
+                        connected_at = now
+                for reader, deadline in list(retiring.items()):
+                    if now >= deadline:
+                        reader.stop()
+                        del retiring[reader]
+
+                try:
+                    reader, item, error = items.get(timeout=self.TICK)
+                except queue.Empty:
+                    continue
+
+                if reader is not current and reader not in retiring:
+                    continue # left in the queue by already stopped readers.
+                if item is StreamReader.END:
+                    if reader is not current:
+                        del retiring[reader]
+                        continue
+                    if error is not None:
+                        raise error
+                    return
+
+                key = identify(item)
+                if key is not None and deduplicator.seen(key):
+                    continue
+                yield item
+        finally:
+            for reader in list(retiring.keys()) + ([current] if current is not None else []):
+                reader.stop()
+
+
+class ShardedFilterStream(object):
+    """
+    Filter stream with follows partitioned across few managed filter streams
+    (shards), each with its own credentials and no more than shard_size follows.
+    New follows are added to the least loaded shards; when all the open shards are
+    full, a new shard is opened with the next unused credentials. If there are no more
+    credentials, the follows are rejected. The follows already added are never moved
+    between the shards (that would reconnect them both), so the removals can leave
+    the shards unbalanced until the new follows fill them up.
+    Each shard reconnects on its own when its follows are changed (see above).
+    """
+
+    SHARD_CLASS = ManagedFilterStream
+    TICK = 0.5
+
+    def __init__(self, credentials, factory=None, follow=None, shard_size=5000, interval=60.0, overlap=5.0, dedup_size=10000, prefilter=None):
+        super(ShardedFilterStream, self).__init__()
+        self.credentials = list(credentials)
+        self.factory = factory
+        self.prefilter = prefilter
+        self.shard_size = shard_size
+        self.interval = interval
+        self.overlap = overlap
+        self.dedup_size = dedup_size
+        self.lock = threading.Lock()
+        self.shards = [] # in the same order as credentials.
+        self.items = None # the queue of the current iteration, if any.
+        self.readers = {} # shard -> reader of the current iteration.
+        if follow:
+            self.add_follow(*follow)
+
+    def shard_of(self, value):
+        for shard in self.shards:
+            if value in shard.follow:
+                return shard
+        return None
+
+    def add_follow(self, *ids):
+        """
+        Distributes new follows to the least loaded shards. All the follows
+        are checked to fit before any of them is added, so that they are added
+        either all or none of them. Fails if there is not enough credentials.
+        """
+        with self.lock:
+            ids = [unicode(v) for v in ids]
+            ids = sorted(set([v for v in ids if self.shard_of(v) is None]))
+            free = sum([self.shard_size - len(shard.follow) for shard in self.shards])
+            spare = len(self.credentials) - len(self.shards)
+            if len(ids) > free + spare * self.shard_size:
+                raise StreamShardsExhaustedError("Not enough credentials for %d more follows." % len(ids))
+
+            opened = []
+            while len(ids) > free:
+                opened.append(self.open_shard())
+                free += self.shard_size
+
+            additions = dict([(shard, []) for shard in self.shards])
+            loads = dict([(shard, len(shard.follow)) for shard in self.shards])
+            for value in ids:
+                shard = min([shard for shard in self.shards if loads[shard] < self.shard_size], key=loads.get)
+                additions[shard].append(value)
+                loads[shard] += 1
+            for shard, values in additions.items():
+                if values:
+                    shard.add_follow(*values)
+            if self.items is not None:
+                # Started only with their follows, so that they connect at once (see ManagedFilterStream).
+                for shard in opened:
+                    self.readers[shard] = StreamReader(shard, self.items).start()
+
+    def remove_follow(self, *ids):
+        with self.lock:
+            for value in [unicode(v) for v in ids]:
+                shard = self.shard_of(value)
+                if shard is not None:
+                    shard.remove_follow(value)
+
+    def open_shard(self):
+        shard = self.SHARD_CLASS(self.credentials[len(self.shards)], self.factory,
+            interval=self.interval, overlap=self.overlap, dedup_size=self.dedup_size, prefilter=self.prefilter)
+        self.shards.append(shard)
+        return shard
+
+    def __iter__(self):
+        items = queue.Queue()
+        deduplicator = Deduplicator(self.dedup_size)
+        with self.lock:
+            self.items = items
+            self.readers = dict([(shard, StreamReader(shard, items).start()) for shard in self.shards])
+        try:
+            while True:
+                try:
+                    reader, item, error = items.get(timeout=self.TICK)
+                except queue.Empty:
+                    continue
+                if item is StreamReader.END:
+                    if error is not None:
+                        raise error
+                    continue # shards do not end on their own; only if their stream is over.
+                key = identify(item)
+                if key is not None and deduplicator.seen(key):
+                    continue
+                yield item
+        finally:
+            with self.lock:
+                for reader in self.readers.values():
+                    reader.stop() # the shards close their connections within a tick (see StreamReader).
+                self.items = None
+                self.readers = {}
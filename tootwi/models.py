@@ -83,6 +83,99 @@ TODO: auto-loading of models (items! and list) when accessing data for the first
 
 """
 
+from .formats import CompactFormat
+from .errors import ModelClassError
+
+
+def project(data, fields):
+    """
+    Returns the copy of the data with only the specified fields. Fields can be
+    dotted paths to the fields of the embedded objects (e.g., "user.id"); naming
+    an embedded object without a path keeps it whole. Lists are projected item
+    by item, so the same fields apply to the data of list models.
+    """
+    tree = {}
+    for field in fields:
+        node = tree
+        names = field.split('.')
+        for name in names[:-1]:
+            node = node.setdefault(name, {})
+            if node is None: # the whole object is already kept.
+                break
+        else:
+            node[names[-1]] = None
+    return _project(data, tree)
+
+
+def _project(data, tree):
+    if isinstance(data, list):
+        return [_project(item, tree) for item in data]
+    elif isinstance(data, dict):
+        return dict([(name, data[name] if subtree is None else _project(data[name], subtree))
+                     for name, subtree in tree.items() if name in data])
+    else:
+        return data
+
+
+class SlottedData(object):
+    """
+    Storage of the projected item fields in fixed slots instead of a dict (see
+    Item.project()), which takes several times less memory for the long-lived
+    items. Provides dict-like access to the fields, as the items expect; fields
+    not in the slots can not be set. Descendants are made per item class, with
+    __slots__ set to the item's FIELDS.
+    """
+    __slots__ = ()
+    
+    def __getitem__(self, name):
+        if name not in self.__slots__:
+            raise KeyError(name)
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+    
+    def __setitem__(self, name, value):
+        if name not in self.__slots__:
+            raise KeyError(name)
+        setattr(self, name, value)
+    
+    def __delitem__(self, name):
+        if name not in self.__slots__:
+            raise KeyError(name)
+        try:
+            delattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+    
+    def __contains__(self, name):
+        return name in self.__slots__ and hasattr(self, name)
+    
+    def __iter__(self):
+        return iter(self.keys())
+    
+    def __len__(self):
+        return len(self.keys())
+    
+    def get(self, name, default=None):
+        return getattr(self, name, default) if name in self.__slots__ else default
+    
+    def keys(self):
+        return [name for name in self.__slots__ if hasattr(self, name)]
+    
+    def items(self):
+        return [(name, getattr(self, name)) for name in self.keys()]
+    
+    def copy(self):
+        result = self.__class__()
+        for name, value in self.items():
+            setattr(result, name, value)
+        return result
+    
+    def to_dict(self):
+        """ Converts to plain dicts, including the embedded slotted objects. """
+        return dict([(name, value.to_dict() if isinstance(value, SlottedData) else value) for name, value in self.items()])
+
 
 class Model(object):
     """
@@ -105,6 +198,9 @@ class Model(object):
     """
 
     LOAD_OPERATION = None # See Model.load() for explanation.
+    LOAD_BATCHER = None # See Model.load() and tootwi.batchers for explanation.
+    LOAD_STORE = None # See Model.load() and tootwi.stores for explanation.
+    CODEC = CompactFormat # See Model.serialize() for explanation.
 
     #
     # Common model protocol.
@@ -135,6 +231,46 @@ class Model(object):
             repr(self.params),
         )
 
+    #
+    # Serialization for passing the models between processes and for storing them.
+    #
+
+    def serialize(self, fields=None):
+        """
+        Encodes the model (its class, parameters and data) with CODEC, which is
+        compact binary by default. If the fields are specified, only they are kept
+        in the data (see project() for the syntax). The API instance is not encoded;
+        it is given to deserialize() instead, since it usually contains secrets.
+        """
+        data = self.data.to_dict() if isinstance(self.data, SlottedData) else self.data
+        data = data if fields is None else project(data, fields)
+        model_class = '%s.%s' % (self.__class__.__module__, self.__class__.__name__)
+        return self.CODEC().encode([model_class, self.params, data, self.loaded])
+
+    @classmethod
+    def deserialize(cls, api, encoded):
+        """
+        Decodes the model encoded by serialize(), and binds it to the API instance.
+        The model is of its original class, which must be this class or its descendant.
+        The class is looked up among the descendants defined so far; nothing is imported
+        by the names from the encoded data (they can come from untrusted sources).
+        """
+        model_class, params, data, loaded = cls.CODEC().decode(encoded)
+        candidates, found = [cls], None
+        while candidates and found is None:
+            candidate = candidates.pop()
+            if '%s.%s' % (candidate.__module__, candidate.__name__) == model_class:
+                found = candidate
+            candidates.extend(candidate.__subclasses__())
+        if found is None:
+            raise ModelClassError("Encoded model is not of %s class." % cls.__name__)
+        model_class = found
+        #NB: Constructors can transform their arguments (e.g., join the lists); these are already transformed.
+        model = model_class.__new__(model_class)
+        Model.__init__(model, api, data, **params)
+        model.loaded = loaded
+        return model
+
     #
     # Dict-like syntax to access the model's parameters.
     #
@@ -167,13 +303,28 @@ class Model(object):
         If this method is overridden, it MUST return self for proper loading
         of models when derived from other models. Otherwise chained single-line
         expressions (usually derived models) will break.
+
+        If the class has LOAD_BATCHER set, the model is first offered to that batcher,
+        which can load it together with other pending models in one bulk request.
+        If the batcher declines the model, it is loaded with LOAD_OPERATION as usually.
+        Batching trades latency for the number of requests: the call blocks for
+        the batcher's window even if no other models are loaded at the same time.
+        
+        If the class has LOAD_STORE set, the model is first looked up in that store,
+        and is not requested at all if it is there and fresh; otherwise, it is saved
+        to the store once loaded (see tootwi.stores).
         """
         if self.LOAD_OPERATION is None:
             raise NotImplemented()
         #!!! exceptions
         if not self.loaded:
-            self.data = self.api.call(self.LOAD_OPERATION, self.params)
-            self.loaded = True #NB: After the data are loaded, for the case of API error.
+            if self.LOAD_STORE is not None and self.LOAD_STORE.load(self):
+                return self
+            if self.LOAD_BATCHER is None or not self.LOAD_BATCHER.load(self):
+                self.data = self.api.call(self.LOAD_OPERATION, self.params)
+                self.loaded = True #NB: After the data are loaded, for the case of API error.
+            if self.LOAD_STORE is not None:
+                self.LOAD_STORE.save(self)
         return self
 
 
@@ -183,13 +334,48 @@ class Item(Model):
     by base model class, as dict. Thus, merges paramaters and data values,
     with data values having priority over the parameters.
 
+    Items can declare the fields they use in FIELDS, so that the rest of the
+    data are dropped when projected (see project()); embedded objects, which are
+    items on their own, are listed in EMBEDDED with the names of their classes.
+
     TODO: solve the mess with params+data, and probably make params unmutable, or whatever else.
     """
+
+    FIELDS = None # See Item.project() for explanation; None means all the fields.
+    EMBEDDED = {} # Field name to item class name, for embedded objects.
     
     def __init__(self, api, data=None, **kwargs):
-        data = dict(data) if data is not None else {}
+        data = data.copy() if isinstance(data, SlottedData) else dict(data) if data is not None else {}
         super(Item, self).__init__(api=api, data=data, **kwargs)
     
+    @classmethod
+    def project(cls, data, slots=False):
+        """
+        Returns the data with only the item's FIELDS kept, recursively for embedded
+        items; or the data as is if FIELDS are not declared. If slots is true, the
+        result is a SlottedData instance rather than a dict (see SlottedData).
+        Used by MessageFactory and List.make_item() when they are in projection mode.
+        """
+        if cls.FIELDS is None or not isinstance(data, dict):
+            return data
+        result = cls.slotted_class()() if slots else {}
+        for name in cls.FIELDS:
+            if name in data:
+                value = data[name]
+                embedded = cls.EMBEDDED.get(name)
+                if embedded is not None and value is not None:
+                    value = globals()[embedded].project(value, slots)
+                result[name] = value
+        return result
+    
+    @classmethod
+    def slotted_class(cls):
+        try:
+            return _SLOTTED_CLASSES[cls]
+        except KeyError:
+            slotted = type('%sData' % cls.__name__, (SlottedData,), dict(__slots__=tuple(cls.FIELDS)))
+            return _SLOTTED_CLASSES.setdefault(cls, slotted)
+    
     #
     # Dict-like syntax for item data values. Falls back to parameters when no value is found.
     #
@@ -212,6 +398,9 @@ class Item(Model):
         return name in self.__data or super(Item, self).__contains__(name)
 
 
+_SLOTTED_CLASSES = {} # item class to its SlottedData descendant; see Item.slotted_class().
+
+
 class List(Model):
     """
     Base class for all multi-item data models. Treats data storage, provided
@@ -230,6 +419,8 @@ class List(Model):
     """
 
     ITEM_CLASS = None # See List.make_item() for details.
+    PROJECT = False # Whether to project the items to their FIELDS; see Item.project().
+    SLOTS = False # Whether to store the projected fields in slots; see SlottedData.
 
     def __iter__(self):
         self.load()#??? autoloading is under question
@@ -250,10 +441,13 @@ class List(Model):
         over the list. By default, it depends on ITEM_CLASS field, which is usually
         defined in descendant classes. If this class points to a model, the API
         instance will be passed to it; otherwise, the instance is created normally.
+        If PROJECT is set, only the item's FIELDS are kept in the item's data.
         """
         if self.ITEM_CLASS is None:
             raise NotImplemented()
         elif issubclass(self.ITEM_CLASS, Model):
+            if self.PROJECT and issubclass(self.ITEM_CLASS, Item):
+                data = self.ITEM_CLASS.project(data, self.SLOTS)
             return self.ITEM_CLASS(self.api, data)
         else:
             return self.ITEM_CLASS(data)
@@ -310,9 +504,15 @@ class User(Item):
     """
     User is regular user entity. It represents currently euthenticated user and all other
     users in Twitter.
+
+    Set LOAD_BATCHER to tootwi.batchers.UsersLookupBatcher to load users in bulk via
+    users/lookup; note that each load() then waits for the batcher's window first.
     """
 
     LOAD_OPERATION = ('GET', 'users/show')
+    FIELDS = ('id', 'id_str', 'screen_name', 'name', 'lang', 'location', 'description', 'url',
+              'followers_count', 'friends_count', 'statuses_count', 'created_at',
+              'protected', 'verified', 'profile_image_url')
     PROFILE_IMAGE_OPERATION = ('GET', 'users/profile_image/%(screen_name)s')
 
     # Pass-through constructor for IDE auto hinting.
@@ -353,7 +553,6 @@ class AccountUser(User):
 
 #!!! move to special classes and methods
 #class Users(List):
-#   LOOKUP_OPERATION = ('GET', 'users/lookup')
 #   SEARCH_OPERATION = ('GET', 'users/search')
 #   SUGGESTIONS_OPERATION = ('GET', 'users/suggestions')
 #   SUGGESTIONS_TWITTER_OPERATION = ('GET', 'users/suggestions/%(slug)s')
@@ -364,18 +563,31 @@ class Status(Item):
     UPDATE_OPERATION  = ('POST', 'statuses/update')
     RETWEET_OPERATION = ('POST', 'statuses/retweet/%(id)s')
     DESTROY_OPERATION = ('POST', 'statuses/destroy/%(id)s')
+    FIELDS = ('id', 'id_str', 'created_at', 'text', 'source', 'truncated', 'lang', 'user', 'entities',
+              'in_reply_to_status_id', 'in_reply_to_user_id', 'in_reply_to_screen_name',
+              'retweeted_status', 'retweet_count', 'favorited', 'retweeted', 'coordinates')
+    EMBEDDED = {'user': 'User', 'retweeted_status': 'Status'}
+    WRITER = None # See tootwi.writers; if set, the writes are queued, and futures are returned.
 
 #   # Pass-through constructor for IDE auto hinting.
 #   def __init__(self, api, params=None, id=None, text=None):#!!! add more of them
 #       super(Status, self).__init__(api, params, id=id, text=text)
 
-    def update(self):
+    # The key identifies the write for the WRITER's deduplication; it is not used without a writer.
+
+    def update(self, key=None):
+        if self.WRITER is not None:
+            return self.WRITER.update(self, key)
         self.data = self.api.call(self.UPDATE_OPERATION, dict(status=self['text']))#!!! more args
 
-    def retweet(self):
+    def retweet(self, key=None):
+        if self.WRITER is not None:
+            return self.WRITER.retweet(self, key)
         return Status(self.api, self.api.call(self.RETWEET_OPERATION, dict(id=self['id'])))
 
-    def destroy(self):
+    def destroy(self, key=None):
+        if self.WRITER is not None:
+            return self.WRITER.destroy(self, key)
         self.api.call(self.DESTROY_OPERATION, dict(id=self['id']))
         del self.data
 
@@ -396,6 +608,23 @@ class Status(Item):
 class Users(List):
     ITEM_CLASS = User
 
+class UsersLookup(Users):
+    """
+    Bulk retrieval of up to 100 users per request, by their ids and/or screen names.
+    Both can be passed either as lists or as already comma-separated strings.
+    Users which do not exist or are suspended are silently omitted by Twitter.
+    """
+
+    LOAD_OPERATION = ('GET', 'users/lookup')
+
+    # Pass-through constructor for IDE auto hinting.
+    def __init__(self, api, data=None, user_id=None, screen_name=None, include_entities=None):
+        if user_id is not None and not isinstance(user_id, basestring):
+            user_id = ','.join([unicode(v) for v in user_id]) or None
+        if screen_name is not None and not isinstance(screen_name, basestring):
+            screen_name = ','.join([unicode(v) for v in screen_name]) or None
+        super(UsersLookup, self).__init__(api, data, user_id=user_id, screen_name=screen_name, include_entities=include_entities)
+
 class Contributors(Users):
     LOAD_OPERATION = ('GET', 'users/contributors')
 
@@ -418,3 +647,24 @@ class Retweets(Statuses):
 class PublicTimeline(Statuses):
     LOAD_OPERATION = ('GET', 'statuses/public_timeline')
 
+class HomeTimeline(Statuses):
+    LOAD_OPERATION = ('GET', 'statuses/home_timeline')
+
+    # Pass-through constructor for IDE auto hinting.
+    def __init__(self, api, data=None, since_id=None, max_id=None, count=None, include_entities=None, trim_user=None):
+        super(HomeTimeline, self).__init__(api, data, since_id=since_id, max_id=max_id, count=count, include_entities=include_entities, trim_user=trim_user)
+
+class UserTimeline(Statuses):
+    LOAD_OPERATION = ('GET', 'statuses/user_timeline')
+
+    # Pass-through constructor for IDE auto hinting.
+    def __init__(self, api, data=None, user_id=None, screen_name=None, since_id=None, max_id=None, count=None, include_rts=None, include_entities=None, trim_user=None):
+        super(UserTimeline, self).__init__(api, data, user_id=user_id, screen_name=screen_name, since_id=since_id, max_id=max_id, count=count, include_rts=include_rts, include_entities=include_entities, trim_user=trim_user)
+
+class Mentions(Statuses):
+    LOAD_OPERATION = ('GET', 'statuses/mentions')
+
+    # Pass-through constructor for IDE auto hinting.
+    def __init__(self, api, data=None, since_id=None, max_id=None, count=None, include_rts=None, include_entities=None, trim_user=None):
+        super(Mentions, self).__init__(api, data, since_id=since_id, max_id=max_id, count=count, include_rts=include_rts, include_entities=include_entities, trim_user=trim_user)
+
@@ -0,0 +1,240 @@
+# coding: utf-8
+"""
+Pollers poll many sources (timelines and other list models) periodically, and
+adapt the interval of each source to how often it gets new items: inactive
+sources are polled rarely, and hot ones often, so that every request brings as
+many new items as possible, and nothing is lost between the polls.
+
+Each source is wrapped into a poll job. A job's interval is recalculated after
+every poll from the observed rate of new items (smoothed exponentially): it is
+the time in which the job is expected to collect "target" new items, but not less
+than min_interval and not more than max_interval. Polls with no new items back
+the interval off. Target should be well below the page size of the source, so
+that the hot sources do not overflow their pages between the polls.
+
+The scheduler keeps the jobs in a priority queue by their due time. When the jobs
+are due faster than the workers can poll them (e.g., because of the throttler of
+the API, which all the requests go through), the due jobs are dispatched in the
+order of their expected yield (the rate multiplied by the time since their last
+poll), so the limited requests are spent on the sources with most new items.
+The depth of the queue and the lag of the due jobs are exposed in metrics().
+
+Sources are either syncers (see tootwi.syncers; they fetch only the new items
+themselves), or list models (they are reloaded, and the items are compared with
+the previous poll by their ids).
+
+Usage example:
+    scheduler = PollScheduler(workers=4)
+    for name in names:
+        source = TimelineSync(UserTimeline(credentials, screen_name=name), watermarks)
+        scheduler.add(PollJob(source, callback=process))
+    scheduler.start()
+"""
+
+import time
+import heapq
+import itertools
+import threading
+from .models import Item
+try:
+    import queue # python-3
+except ImportError:
+    import Queue as queue # python-2
+
+
+class PollJob(object):
+    """
+    One source to be polled, with its adaptive interval and statistics.
+    The callback is called with the job and the list of new items after each poll.
+    """
+
+    BACKOFF = 1.5 # Interval multiplier after the polls with no new items.
+
+    def __init__(self, source, callback=None, interval=60.0, min_interval=15.0, max_interval=900.0, target=20, smoothing=0.3):
+        super(PollJob, self).__init__()
+        self.source = source
+        self.callback = callback
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target = target
+        self.smoothing = smoothing
+        self.rate = None # new items per second, smoothed.
+        self.polled_at = None
+        self.due = 0
+        self.generation = 0 # of the job's only valid entry in the scheduler's queues; see PollScheduler.add().
+        self.seen = None # ids of the items of the last poll, for list models.
+        self.polls = 0
+        self.items = 0
+        self.errors = 0
+
+    def poll(self):
+        """ Polls the source; returns the list of new items. """
+        if hasattr(self.source, 'sync'):
+            return self.source.sync()
+        model = self.source.__class__(self.source.api, **self.source.params).load()
+        items = list(model)
+        ids = [item['id'] if isinstance(item, Item) else item for item in items]
+        new = [item for item, id in zip(items, ids) if self.seen is None or id not in self.seen]
+        self.seen = set(ids)
+        return new
+
+    def expected(self, now):
+        """ Number of new items expected if polled now; never polled jobs go first. """
+        if self.polled_at is None:
+            return float('inf')
+        return (self.rate or 0.0) * (now - self.polled_at)
+
+    def adapt(self, count, now):
+        """
+        Updates the rate and the interval after the poll, which got count new items.
+        The first poll has no previous one to measure the time from, so its items
+        are taken as collected during the initial interval.
+        """
+        elapsed = now - self.polled_at if self.polled_at is not None else self.interval
+        observed = count / max(elapsed, 0.001)
+        self.rate = observed if self.rate is None else self.smoothing * observed + (1 - self.smoothing) * self.rate
+        self.polled_at = now
+        if count and self.rate:
+            interval = self.target / self.rate
+        else:
+            interval = self.interval * self.BACKOFF
+        self.interval = min(self.max_interval, max(self.min_interval, interval))
+
+
+class PollScheduler(object):
+    """
+    Dispatches the due jobs to the pool of worker threads, the most productive ones first.
+    Every job has one valid entry in the queues at most: adding or removing a job
+    increments its generation, and the entries of the older generations are skipped.
+    """
+
+    def __init__(self, workers=4):
+        super(PollScheduler, self).__init__()
+        self.workers = workers
+        self.condition = threading.Condition()
+        self.scheduled = [] # heap of (due, seq, generation, job)
+        self.ready = [] # heap of (-expected yield, seq, generation, job) of the due jobs.
+        self.sequence = itertools.count()
+        self.slots = threading.Semaphore(workers)
+        self.tasks = queue.Queue()
+        self.stopping = threading.Event()
+        self.threads = []
+        self.polls = 0
+        self.items = 0
+        self.errors = 0
+
+    def add(self, job, due=None):
+        """ Schedules the job (again, if it is scheduled already: the previous entry is dropped). """
+        with self.condition:
+            job.generation += 1
+            job.due = due if due is not None else time.time()
+            heapq.heappush(self.scheduled, (job.due, next(self.sequence), job.generation, job))
+            self.condition.notify()
+
+    def remove(self, job):
+        """ Cancels the job; its entry is dropped from the queue when it is due. """
+        with self.condition:
+            job.generation += 1
+
+    def start(self):
+        self.stopping.clear()
+        self.threads = [threading.Thread(target=self.dispatch)]
+        self.threads += [threading.Thread(target=self.work) for i in range(self.workers)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def stop(self, wait=True):
+        self.stopping.set()
+        with self.condition:
+            self.condition.notify_all()
+        for i in range(self.workers):
+            self.tasks.put(None)
+        if wait:
+            for thread in self.threads:
+                thread.join()
+
+    def promote(self, now):
+        """ Moves the due jobs to the ready queue; returns the time till the next due job. """
+        while self.scheduled and self.scheduled[0][0] <= now:
+            due, seq, generation, job = heapq.heappop(self.scheduled)
+            if generation == job.generation:
+                heapq.heappush(self.ready, (-job.expected(now), seq, generation, job))
+        return self.scheduled[0][0] - now if self.scheduled else None
+
+    def dispatch(self):
+        while not self.stopping.is_set():
+            self.slots.acquire() # wait for a free worker first, so the choice is made as late as possible.
+            with self.condition:
+                while not self.stopping.is_set():
+                    now = time.time()
+                    timeout = self.promote(now)
+                    if self.ready:
+                        # Yields change with time, so re-rank the ready jobs before choosing.
+                        self.ready = [(-job.expected(now), seq, generation, job) for _, seq, generation, job in self.ready
+                                      if generation == job.generation]
+                        heapq.heapify(self.ready)
+                    if self.ready:
+                        break
+                    self.condition.wait(timeout)
+                if self.stopping.is_set():
+                    return
+                priority, seq, generation, job = heapq.heappop(self.ready)
+            self.tasks.put((job, generation))
+
+    def work(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+            try:
+                self.run(*task)
+            finally:
+                self.slots.release()
+
+    def run(self, job, generation=None):
+        """
+        Polls the job and reschedules it. Failed polls are rescheduled with a backoff.
+        The job is not rescheduled if it was removed or added again during the poll.
+        """
+        generation = generation if generation is not None else job.generation
+        errors = 0
+        try:
+            items = job.poll()
+        except Exception:
+            errors, items = 1, None
+        now = time.time()
+        if items is None:
+            job.interval = min(job.max_interval, job.interval * job.BACKOFF)
+        else:
+            job.adapt(len(items), now)
+            job.polls += 1
+            job.items += len(items)
+            if job.callback is not None and items:
+                try:
+                    job.callback(job, items)
+                except Exception:
+                    errors += 1
+        job.errors += errors
+        with self.condition:
+            self.polls += 1 if items is not None else 0
+            self.items += len(items or [])
+            self.errors += errors
+            if generation == job.generation:
+                self.add(job, now + job.interval)
+
+    def metrics(self):
+        """
+        Returns the current state: the number of scheduled and ready (due, waiting
+        for a worker) jobs, the lag of the oldest ready job in seconds, and totals.
+        """
+        with self.condition:
+            now = time.time()
+            self.promote(now)
+            scheduled = len([job for due, seq, generation, job in self.scheduled if generation == job.generation])
+            ready = [job for priority, seq, generation, job in self.ready if generation == job.generation]
+            lag = max([now - job.due for job in ready] or [0.0])
+            return dict(scheduled=scheduled, ready=len(ready), lag=lag,
+                        polls=self.polls, items=self.items, errors=self.errors,
+                        items_per_poll=float(self.items) / self.polls if self.polls else None)
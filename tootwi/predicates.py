@@ -0,0 +1,203 @@
+# coding: utf-8
+"""
+Predicates select stream messages by their raw lines, before the lines are
+decoded. Decoding and instantiation of the items is the most expensive part
+of stream processing, so selective predicates save most of the CPU time.
+
+Each predicate has two stages:
+* match(line) is a fast test of the raw line, which can give false positives
+  but never gives false negatives (it is also what the predicate call does);
+* verify(line, data) is an exact test of the decoded data; it is called only
+  for the lines which passed the first stage, and only if the predicate is not
+  exact already (i.e., if its raw test can give false positives at all).
+
+Predicates can be combined with "&", "|" and "~" operators, the same way as
+throttlers are (see tootwi.throttlers):
+    Substring('#python') & FieldEquals('lang', 'en')
+    Regex(r'#(python|django)\b') | ~FieldEquals('user.lang', 'ru')
+
+Predicates are passed to the stream constructors (see tootwi.streams.Stream),
+and are applied by PrefilteredFormat (see tootwi.formats).
+"""
+
+import re
+import json
+
+
+class Predicate(object):
+    """
+    Base predicate. Should never be instantiated directly.
+    Descendants must implement match(), and verify() if they are not exact.
+    """
+
+    exact = True
+
+    def __call__(self, line):
+        return self.match(line)
+
+    def __and__(self, other):
+        return All([self, other])
+
+    def __or__(self, other):
+        return Any([self, other])
+
+    def __invert__(self):
+        return Not(self)
+
+    def match(self, line):
+        raise NotImplemented()
+
+    def verify(self, line, data):
+        return self.match(line)
+
+
+class Custom(Predicate):
+    """
+    Any callable on raw lines, considered exact (e.g., a factory's prefilter).
+    """
+
+    def __init__(self, fn):
+        super(Custom, self).__init__()
+        self.fn = fn
+
+    def match(self, line):
+        return self.fn(line)
+
+
+class Substring(Predicate):
+    """
+    Raw line contains the substring (note: non-ASCII characters are usually
+    escaped in Twitter's JSON, so the substring should be escaped the same way).
+    """
+
+    def __init__(self, substring):
+        super(Substring, self).__init__()
+        self.substring = substring
+
+    def match(self, line):
+        return self.substring in line
+
+
+class Regex(Predicate):
+    """
+    Raw line matches the regular expression anywhere (re.search semantics).
+    """
+
+    def __init__(self, pattern, flags=0):
+        super(Regex, self).__init__()
+        self.regex = re.compile(pattern, flags) if isinstance(pattern, basestring) else pattern
+
+    def match(self, line):
+        return self.regex.search(line) is not None
+
+
+class FieldEquals(Predicate):
+    """
+    Decoded message has the field equal to the value. The field can be a dotted
+    path to nested objects (e.g., "user.lang"). The raw test looks for the field's
+    name followed by the JSON-encoded value anywhere in the line (so it matches the
+    same name in other objects too); that is why the decoded data are verified.
+    Values which can be encoded in more than one way (with non-ASCII characters,
+    which can be raw UTF-8 or escaped, or with "/", which Twitter escapes as "\/")
+    are not looked for in the raw test: only the name is.
+    """
+
+    exact = False
+    AMBIGUOUS = re.compile(r'[^\x20-\x7e]|[/\\<>&]') # characters which JSON encoders may escape or not.
+
+    def __init__(self, field, value):
+        super(FieldEquals, self).__init__()
+        self.path = field.split('.')
+        self.value = value
+        name = re.escape('"%s"' % self.path[-1])
+        encoded = json.dumps(value, ensure_ascii=False)
+        if isinstance(value, (int, long, float)) and not isinstance(value, bool):
+            self.regex = re.compile(r'%s\s*:\s*%s(?![\d.eE])' % (name, re.escape(encoded)))
+        elif self.AMBIGUOUS.search(encoded) is None:
+            self.regex = re.compile(r'%s\s*:\s*%s' % (name, re.escape(encoded)))
+        else:
+            self.regex = re.compile(r'%s\s*:' % name) # the value can be escaped or not; only the name is certain.
+
+    def match(self, line):
+        return self.regex.search(line) is not None
+
+    def verify(self, line, data):
+        for key in self.path:
+            if not isinstance(data, dict) or key not in data:
+                return False
+            data = data[key]
+        return data == self.value
+
+
+class All(Predicate):
+    """
+    All of the predicates are true (the "&" operator).
+    """
+
+    def __init__(self, predicates):
+        super(All, self).__init__()
+        self.predicates = list(predicates)
+        self.exact = all([p.exact for p in self.predicates])
+
+    def __and__(self, other):
+        if isinstance(other, All):
+            return All(self.predicates + other.predicates)
+        return All(self.predicates + [other])
+
+    def match(self, line):
+        for p in self.predicates:
+            if not p.match(line):
+                return False
+        return True
+
+    def verify(self, line, data):
+        for p in self.predicates:
+            if not p.exact and not p.verify(line, data):
+                return False
+        return True
+
+
+class Any(Predicate):
+    """
+    At least one of the predicates is true (the "|" operator).
+    """
+
+    def __init__(self, predicates):
+        super(Any, self).__init__()
+        self.predicates = list(predicates)
+        self.exact = all([p.exact for p in self.predicates])
+
+    def __or__(self, other):
+        if isinstance(other, Any):
+            return Any(self.predicates + other.predicates)
+        return Any(self.predicates + [other])
+
+    def match(self, line):
+        for p in self.predicates:
+            if p.match(line):
+                return True
+        return False
+
+    def verify(self, line, data):
+        for p in self.predicates:
+            if p.match(line) and (p.exact or p.verify(line, data)):
+                return True
+        return False
+
+
+class Not(Predicate):
+    """
+    The predicate is false (the "~" operator). If the predicate is not exact,
+    its raw test can not be negated, so all the lines are decoded and verified.
+    """
+
+    def __init__(self, predicate):
+        super(Not, self).__init__()
+        self.predicate = predicate
+        self.exact = predicate.exact
+
+    def match(self, line):
+        return not self.predicate.match(line) if self.exact else True
+
+    def verify(self, line, data):
+        return not (self.predicate.match(line) and self.predicate.verify(line, data))
@@ -0,0 +1,201 @@
+# coding: utf-8
+"""
+Recordings capture raw responses and streams as they are received from the network,
+and replay them later with no network at all: for reproducible tests, benchmarks and
+load-testing of the consumers (the whole read-decode-factory pipeline is involved).
+
+Recording is done by a transport wrapper, which passes all requests to the real
+transport, and appends every line read from the response to the recording file,
+with the time of its arrival. Replaying is done by a transport, which ignores the
+requests and reads the lines from the recording file instead, either with their
+original timing, or faster (N times), or as fast as possible (no timing at all).
+Both are used as regular transports of the API instances:
+
+    api = API(transport=RecordingTransport(DEFAULT_TRANSPORT, 'sample.rec.gz'))
+    for item in SampleStream(TokenCredentials(..., api=api)): ...
+
+    api = API(transport=ReplayTransport('sample.rec.gz', speed=10))
+    for item in SampleStream(TokenCredentials(..., api=api)): ...
+
+The file is a sequence of records, each is a header (arrival time as a double,
+and the length of the line as an unsigned int; both in network byte order)
+followed by the line itself, as is. Files are append-only, so few recordings
+can be written to the same file one after another; they are replayed as one.
+Files with ".gz" extension are compressed (gzip supports appended members).
+"""
+
+import time
+import gzip
+import struct
+import threading
+from .transports import Transport, File
+
+
+RECORD_HEADER = struct.Struct('!dI')
+
+
+def open_recording(path, mode, compress=None):
+    """
+    Opens the recording file in binary mode. Compression is used if explicitly
+    requested, or if not specified but the file has ".gz" extension.
+    """
+    if compress is None:
+        compress = path.endswith('.gz')
+    return gzip.open(path, mode + 'b') if compress else open(path, mode + 'b')
+
+
+class RecordingWriter(object):
+    """
+    Appends the records to the file. Thread-safe, so one writer can be shared
+    by all the connections of a recording transport.
+    """
+
+    def __init__(self, path, compress=None):
+        super(RecordingWriter, self).__init__()
+        self.file = open_recording(path, 'a', compress)
+        self.lock = threading.Lock()
+
+    def write(self, line, timestamp=None):
+        timestamp = timestamp if timestamp is not None else time.time()
+        with self.lock:
+            self.file.write(RECORD_HEADER.pack(timestamp, len(line)))
+            self.file.write(line)
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class RecordingReader(object):
+    """
+    Iterates over the records of the file as (timestamp, line) tuples.
+    """
+
+    def __init__(self, path, compress=None):
+        super(RecordingReader, self).__init__()
+        self.file = open_recording(path, 'r', compress)
+
+    def __iter__(self):
+        while True:
+            header = self.file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return # incomplete record at the end is a crash during recording; ignore it.
+            timestamp, length = RECORD_HEADER.unpack(header)
+            line = self.file.read(length)
+            if len(line) < length:
+                return
+            yield timestamp, line
+
+    def close(self):
+        self.file.close()
+
+
+class RecordingFile(File):
+    """
+    File-like object, which reads from the real one and records what is read.
+    """
+
+    def __init__(self, handle, writer):
+        super(RecordingFile, self).__init__()
+        self.handle = handle
+        self.writer = writer
+
+    def readline(self):
+        line = self.handle.readline()
+        if line:
+            self.writer.write(line)
+        return line
+
+    def read(self, length=None):
+        data = self.handle.read() if length is None else self.handle.read(length)
+        if data:
+            self.writer.write(data)
+        return data
+
+    def close(self):
+        try:
+            self.handle.close()
+        finally:
+            self.writer.flush()
+
+
+class RecordingTransport(Transport):
+    """
+    Transport wrapper, which performs the requests via another transport,
+    and records all the responses to the file.
+    """
+
+    def __init__(self, transport, path, compress=None):
+        super(RecordingTransport, self).__init__()
+        self.transport = transport
+        self.writer = RecordingWriter(path, compress)
+
+    def __call__(self, request, timeout=None):
+        handle = self.transport(request, timeout) if timeout is not None else self.transport(request)
+        return RecordingFile(handle, self.writer)
+
+    def close(self):
+        self.writer.close()
+
+    @classmethod
+    def check(cls):
+        pass
+
+
+class ReplayFile(File):
+    """
+    File-like object, which reads the lines from the recording. If the speed
+    is specified, the lines are returned no sooner than they were received
+    originally (relative to the first line), divided by the speed.
+    """
+
+    def __init__(self, reader, speed=None):
+        super(ReplayFile, self).__init__()
+        self.reader = reader
+        self.records = iter(reader)
+        self.speed = speed
+        self.origin = None # (original time, replay time) of the first record.
+
+    def readline(self):
+        for timestamp, line in self.records:
+            if self.speed:
+                if self.origin is None:
+                    self.origin = (timestamp, time.time())
+                delay = (timestamp - self.origin[0]) / self.speed - (time.time() - self.origin[1])
+                if delay > 0:
+                    time.sleep(delay)
+            return line
+        return '' # end of file, same as in sockets.
+
+    def read(self, length=None):
+        #NB: recorded responses are read as a whole; the length is ignored.
+        return ''.join(iter(self.readline, ''))
+
+    def close(self):
+        self.reader.close()
+
+
+class ReplayTransport(Transport):
+    """
+    Transport, which replays the recording for every request (each request
+    gets the recording from its beginning). Speed is a multiplier of the
+    original timing (1 is real time); None or 0 means as fast as possible.
+    """
+
+    def __init__(self, path, speed=None, compress=None):
+        super(ReplayTransport, self).__init__()
+        self.path = path
+        self.speed = speed
+        self.compress = compress
+
+    def __call__(self, request, timeout=None):
+        #NB: the recording is local and is not waited for; the timeout is ignored.
+        return ReplayFile(RecordingReader(self.path, self.compress), self.speed)
+
+    @classmethod
+    def check(cls):
+        pass
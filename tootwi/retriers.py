@@ -0,0 +1,99 @@
+# coding: utf-8
+"""
+Retriers decide whether a failed API call should be retried, and when.
+They are optionally passed to the constructor of the API instances.
+
+A call is retried if it failed with a retriable HTTP status (e.g., 500, 502, 503,
+504; or 420 and 429 for rate limiting) or with a network error (connection refused
+or reset, timeouts, broken HTTP responses, etc), and if there are attempts left.
+Between the attempts, the call waits with exponential backoff and full jitter
+(a random time between zero and the exponential delay), so that many workers failed
+at the same time do not retry at the same time too. If the server tells when to
+retry (Retry-After header; or, for the rate limiting statuses only, the rate limit
+reset time), that time is used instead; if it is longer than max_wait, the call is
+not retried at all. The rate limit reset time is ignored for the server errors,
+since Twitter sends it with all the responses, and it has nothing to do with them.
+
+Every attempt is signed anew (OAuth nonces and timestamps must be fresh), and goes
+through the throttler of the API, so the retries do not violate the limits.
+
+Only idempotent calls (GET) are retried on server errors and network errors, since
+a failed POST can be already performed by the server. All calls are retried on
+rate limiting statuses, since the server refused to perform them at all.
+
+Usage example:
+    api = API(retrier=BackoffRetrier(attempts=5, base=1.0))
+"""
+
+import time
+import random
+import email.utils
+
+
+class Retrier(object):
+    """
+    Base retrier. Should never be instantiated directly.
+    Descendants must implement delay(attempt, method, error) method, which
+    returns the number of seconds to wait before the next attempt, or None
+    if the call should not be retried (then the error is raised).
+    """
+
+    def delay(self, attempt, method, error):
+        raise NotImplemented()
+
+
+class BackoffRetrier(Retrier):
+    """
+    Retrier with exponential backoff and full jitter, as described above.
+    Attempts are the total number of attempts, including the first one.
+    """
+
+    RETRY_STATUSES = (500, 502, 503, 504)
+    LIMIT_STATUSES = (420, 429)
+    IDEMPOTENT_METHODS = ('GET',)
+
+    def __init__(self, attempts=3, base=0.5, cap=30.0, max_wait=60.0, statuses=None, limit_statuses=None):
+        super(BackoffRetrier, self).__init__()
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.max_wait = max_wait
+        self.statuses = tuple(statuses if statuses is not None else self.RETRY_STATUSES)
+        self.limit_statuses = tuple(limit_statuses if limit_statuses is not None else self.LIMIT_STATUSES)
+
+    def delay(self, attempt, method, error):
+        if attempt >= self.attempts:
+            return None
+        code = getattr(error, 'code', None)
+        if code in self.limit_statuses:
+            pass # retriable for any method.
+        elif method not in self.IDEMPOTENT_METHODS:
+            return None
+        elif code is not None and code not in self.statuses:
+            return None
+
+        suggested = self.suggested(getattr(error, 'headers', None) or {}, code in self.limit_statuses)
+        if suggested is not None:
+            return suggested if suggested <= self.max_wait else None
+        return random.uniform(0, min(self.cap, self.base * 2 ** (attempt - 1)))
+
+    def suggested(self, headers, limited=False):
+        """
+        Returns the delay suggested by the server in the response headers (with
+        lowercased names), or None. Retry-After is either seconds or HTTP date;
+        X-RateLimit-Reset (or X-Rate-Limit-Reset) is the epoch time of the reset,
+        and is used only if the call is rate limited.
+        """
+        now = time.time()
+        value = headers.get('retry-after')
+        if value is not None:
+            value = value.strip()
+            if value.isdigit():
+                return float(value)
+            parsed = email.utils.parsedate_tz(value)
+            if parsed is not None:
+                return max(0.0, email.utils.mktime_tz(parsed) - now)
+        value = (headers.get('x-ratelimit-reset') or headers.get('x-rate-limit-reset')) if limited else None
+        if value is not None and value.strip().isdigit():
+            return max(0.0, int(value) - now)
+        return None
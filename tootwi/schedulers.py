@@ -0,0 +1,227 @@
+# coding: utf-8
+"""
+Schedulers decide which of the waiting calls gets the next slot of the throttler.
+They are optionally passed to the constructor of the API instances.
+
+With a plain throttler, all the calls compete for its slots equally, in the order
+of whoever wakes up first, so a background crawl with many threads can starve the
+user-facing calls. With a scheduler, the calls are queued, and only one call at
+a time waits for the throttler; the next one is chosen when the slot is granted:
+* the calls of higher priority classes go first (INTERACTIVE, NORMAL, BACKGROUND);
+* within a class, the tenants (credentials' identities) share the slots fairly
+  according to their weights (start-time fair queueing: a tenant with weight 2
+  gets twice as many slots as a tenant with weight 1, if both are waiting);
+* within a tenant, the calls go in the order they came.
+
+The class and the weight of the tenant are configured in the scheduler, or by
+overriding its classify() method (e.g., to classify the calls by their operation).
+The time the calls spend in the queue is collected per class, see metrics().
+
+Only the single calls are scheduled (with retries and hedges); stream connections
+are throttled directly, since they are few and long-living.
+
+ThreadScheduler is for the threaded applications, and is passed to the API: the
+calling threads block until their slots are granted. AsyncScheduler is for asyncio
+event loops, and is used directly: it returns futures, which are resolved when the
+slots are granted (no threads are blocked); the calls themselves are then performed
+in an executor, with no throttler and no scheduler on the API.
+
+Usage example:
+    scheduler = ThreadScheduler(priorities={crawler: BACKGROUND}, weights={vip: 3})
+    api = API(throttler=TimedThrottler(2), scheduler=scheduler)
+    ...
+    print scheduler.metrics()
+
+Usage example for asyncio (in a coroutine):
+    scheduler = AsyncScheduler(priorities={crawler: BACKGROUND})
+    yield From(scheduler.wait(scheduler.classify(credentials), throttler))
+    status = yield From(loop.run_in_executor(None, Status(credentials, id=123).load))
+"""
+
+import time
+import heapq
+import itertools
+import threading
+from .instruments import Histogram
+from .errors import DeadlineExceededError
+
+
+# Priority classes, as ranks: the lower, the sooner.
+INTERACTIVE, NORMAL, BACKGROUND = range(3)
+CLASSES = ('interactive', 'normal', 'background')
+
+
+class Ticket(object):
+    """
+    The class, the tenant and the weight of a call, as classified by the scheduler.
+    """
+
+    def __init__(self, priority, tenant, weight=1):
+        super(Ticket, self).__init__()
+        self.priority = priority
+        self.tenant = tenant
+        self.weight = weight
+
+
+class Scheduler(object):
+    """
+    Base scheduler with the queue and the fair sharing logic. Not thread-safe itself;
+    descendants protect it, grant the slots, and implement wait(ticket, throttler, deadline).
+    """
+
+    def __init__(self, priorities=None, weights=None, default_priority=NORMAL):
+        super(Scheduler, self).__init__()
+        self.priorities = dict(priorities or {})
+        self.weights = dict(weights or {})
+        self.default_priority = default_priority
+        self.queue = [] # heap of (priority, virtual start, seq, waiter)
+        self.sequence = itertools.count()
+        self.finishes = {} # {(priority, tenant): virtual finish time of its last queued call}
+        self.clocks = [0.0] * len(CLASSES) # virtual time of each class: start of the last granted call.
+        self.queued = [0] * len(CLASSES)
+        self.granted = [0] * len(CLASSES)
+        self.histograms = [Histogram() for name in CLASSES]
+
+    def classify(self, credentials, invocation=None):
+        """ Returns the ticket for the call on behalf of the credentials. """
+        tenant = credentials.identity
+        return Ticket(self.priorities.get(tenant, self.default_priority), tenant, self.weights.get(tenant, 1))
+
+    def push(self, ticket, waiter):
+        key = (ticket.priority, ticket.tenant)
+        start = max(self.finishes.get(key, 0.0), self.clocks[ticket.priority])
+        self.finishes[key] = start + 1.0 / ticket.weight
+        heapq.heappush(self.queue, (ticket.priority, start, next(self.sequence), waiter))
+        self.queued[ticket.priority] += 1
+
+    def pop(self):
+        """ Returns the next waiter to be granted a slot, or None. """
+        while self.queue:
+            priority, start, seq, waiter = heapq.heappop(self.queue)
+            self.queued[priority] -= 1
+            if waiter.cancelled:
+                continue
+            self.clocks[priority] = start
+            if not self.queued[priority]:
+                # The class is idle: forget the tenants, so the finish times do not grow forever.
+                self.finishes = dict([(key, value) for key, value in self.finishes.items() if key[0] != priority])
+            self.granted[priority] += 1
+            self.histograms[priority].add(time.time() - waiter.queued_at)
+            return waiter
+        return None
+
+    def metrics(self):
+        """ Returns the number of waiting and granted calls, and the queue times, per class. """
+        return dict([(name, dict(waiting=self.queued[index], granted=self.granted[index],
+                                 queue_time=self.histograms[index].snapshot()))
+                     for index, name in enumerate(CLASSES)])
+
+
+class ThreadScheduler(Scheduler):
+    """
+    Scheduler for the threaded applications; wait() blocks the calling thread.
+    """
+
+    class Waiter(object):
+        def __init__(self):
+            super(ThreadScheduler.Waiter, self).__init__()
+            self.queued_at = time.time()
+            self.event = threading.Event()
+            self.cancelled = False
+
+    def __init__(self, *args, **kwargs):
+        super(ThreadScheduler, self).__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.busy = False # whether some call is waiting for the throttler now.
+
+    def wait(self, ticket, throttler=None, deadline=None):
+        """
+        Blocks until the call gets its turn, and then until the throttler allows it.
+        Raises DeadlineExceededError if it does not get them before the deadline.
+        """
+        waiter = self.Waiter()
+        with self.lock:
+            self.push(ticket, waiter)
+            self.advance()
+        if not waiter.event.wait(deadline - time.time() if deadline is not None else None):
+            with self.lock:
+                if not waiter.event.is_set():
+                    waiter.cancelled = True
+                    raise DeadlineExceededError('The call did not get its turn before its deadline.')
+        try:
+            if throttler is not None:
+                throttler.wait(deadline) if deadline is not None else throttler.wait()
+        finally:
+            with self.lock:
+                self.busy = False
+                self.advance()
+
+    def advance(self):
+        # Must be called with the lock held.
+        if not self.busy:
+            waiter = self.pop()
+            if waiter is not None:
+                self.busy = True
+                waiter.event.set()
+
+    def metrics(self):
+        with self.lock:
+            return super(ThreadScheduler, self).metrics()
+
+
+class AsyncScheduler(Scheduler):
+    """
+    Scheduler for asyncio event loops (or trollius on Python 2); wait() returns
+    a future, which is resolved when the call is allowed by the throttler.
+    Cancel the future (e.g., by asyncio.wait_for) to leave the queue.
+    Must be used from the thread of the loop only.
+    """
+
+    class Waiter(object):
+        def __init__(self, future):
+            super(AsyncScheduler.Waiter, self).__init__()
+            self.queued_at = time.time()
+            self.future = future
+        @property
+        def cancelled(self):
+            return self.future.done()
+
+    def __init__(self, priorities=None, weights=None, default_priority=NORMAL, loop=None):
+        super(AsyncScheduler, self).__init__(priorities, weights, default_priority)
+        try:
+            import asyncio
+        except ImportError:
+            import trollius as asyncio
+        self.asyncio = asyncio
+        self.loop = loop if loop is not None else asyncio.get_event_loop()
+        self.busy = False
+
+    def wait(self, ticket, throttler=None, deadline=None):
+        future = self.asyncio.Future(loop=self.loop)
+        self.push(ticket, self.Waiter(future))
+        if deadline is not None:
+            self.loop.call_later(max(0, deadline - time.time()), self.expire, future)
+        self.advance(throttler)
+        return future
+
+    def expire(self, future):
+        if not future.done():
+            future.set_exception(DeadlineExceededError('The call did not get its turn before its deadline.'))
+
+    def advance(self, throttler):
+        if not self.busy:
+            waiter = self.pop()
+            if waiter is not None:
+                self.busy = True
+                self.loop.call_later(throttler.check() if throttler is not None else 0, self.grant, waiter, throttler)
+
+    def grant(self, waiter, throttler):
+        if not waiter.cancelled:
+            if throttler is not None and throttler.check() > 0: # someone else has used the throttler meanwhile.
+                self.loop.call_later(throttler.check(), self.grant, waiter, throttler)
+                return
+            if throttler is not None:
+                throttler.touch()
+            waiter.future.set_result(None)
+        self.busy = False
+        self.advance(throttler)
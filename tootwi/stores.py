@@ -0,0 +1,272 @@
+# coding: utf-8
+"""
+Stores keep the loaded models on local disk, so they survive the restarts of
+the application, and are not requested from Twitter again while they are fresh.
+A store is assigned to a model class via its LOAD_STORE class field, and is
+consulted by load() before the API is called (and before the batcher, if any);
+the models loaded from the API are saved to the store afterwards.
+
+The models are keyed by their class and their identifying parameter: "id" or
+"user_id" (the same thing), or "screen_name" (case-insensitive). A loaded model
+is saved under all the identities found in its data, so a user loaded by its
+screen name is found by its id later, and vice versa. Models with none of these
+parameters are not stored; other parameters (e.g., include_entities) are ignored.
+
+Each model is stored with the time it was stored at, and is considered fresh for
+"ttl" seconds (or per class, in "ttls"); stale models are loaded from the API again.
+
+Writes are batched: they are kept in memory (and are visible to the reads at once),
+and are written to disk in one transaction when there are batch_size of them, or
+when flush_interval seconds passed since the last flush, or when flush() or close()
+is called. SqliteStore uses sqlite with the write-ahead log; DbmStore uses whatever
+dbm module is available (anydbm), and is for the systems with no sqlite.
+
+For the lists, there are bulk methods: save_all() stores all the items of the lists
+(e.g., of a timeline, or of users/lookup), and load_all() loads the fresh models
+from the store, and returns the rest, which are to be loaded otherwise (e.g., with
+UsersLookupBatcher.load_all(), and then saved with save_all()).
+
+Usage example:
+    store = SqliteStore('/var/lib/models.sqlite', ttl=24*3600)
+    User.LOAD_STORE = Status.LOAD_STORE = store
+    user = User(credentials, screen_name='twitter').load() # from the disk, if fresh.
+    ...
+    missing = store.load_all([User(credentials, user_id=i) for i in ids])
+    store.save_all([UsersLookupBatcher().load_all(missing)])
+    store.close()
+"""
+
+import time
+import struct
+import threading
+from .formats import CompactFormat
+from .models import SlottedData, List
+
+
+class Store(object):
+    """
+    Base store with the keying, freshness and batching logic.
+    Descendants must implement read(keys), write(records) and close().
+    """
+
+    CODEC = CompactFormat
+    ID_PARAMS = {'id': 'id', 'user_id': 'id', 'screen_name': 'screen_name'}
+
+    def __init__(self, ttl=3600.0, ttls=None, batch_size=100, flush_interval=1.0):
+        super(Store, self).__init__()
+        self.ttl = ttl
+        self.ttls = dict(ttls or {})
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.codec = self.CODEC()
+        self.lock = threading.RLock()
+        self.pending = {} # {key: (stored_at, encoded data)}, not written yet.
+        self.flushed_at = time.time()
+        self.hits = 0
+        self.misses = 0
+
+    #
+    # Keys.
+    #
+
+    def key(self, model_class, name, value):
+        if name == 'screen_name':
+            value = unicode(value).lower()
+        return '%s/%s/%s' % (model_class.__name__, name, value)
+
+    def identify(self, model):
+        """ Returns the key to look the model up by, or None if it cannot be stored. """
+        for param, name in self.ID_PARAMS.items():
+            value = model.params.get(param)
+            if value is not None:
+                return self.key(model.__class__, name, value)
+        return None
+
+    def keys(self, model_class, data):
+        """ Returns the keys to store the data under: all the identities in the data. """
+        return [self.key(model_class, name, data[name]) for name in ('id', 'screen_name') if data.get(name) is not None]
+
+    #
+    # Reads and writes of the raw data.
+    #
+
+    def get(self, model_class, keys):
+        """ Returns {key: data} of the fresh data of the model class by the keys. """
+        ttl = self.ttls.get(model_class.__name__, self.ttl)
+        now = time.time()
+        with self.lock:
+            found = dict([(key, self.pending[key]) for key in keys if key in self.pending])
+            missing = [key for key in keys if key not in found]
+            if missing:
+                found.update(self.read(missing))
+        return dict([(key, self.codec.decode(encoded)) for key, (stored_at, encoded) in found.items()
+                     if ttl is None or now - stored_at < ttl])
+
+    def put(self, model_class, data):
+        """ Stores the data of the model class under all its identities. """
+        data = data.to_dict() if isinstance(data, SlottedData) else data
+        record = (time.time(), self.codec.encode(data))
+        with self.lock:
+            for key in self.keys(model_class, data):
+                self.pending[key] = record
+            if len(self.pending) >= self.batch_size or time.time() - self.flushed_at >= self.flush_interval:
+                self.flush()
+
+    def flush(self):
+        """ Writes all the pending data to disk at once. """
+        with self.lock:
+            if self.pending:
+                self.write(self.pending.items())
+                self.pending = {}
+            self.flushed_at = time.time()
+
+    #
+    # Models.
+    #
+
+    def load(self, model):
+        """ Loads the model's data from the store. Returns True if loaded, False if not found or stale. """
+        key = self.identify(model)
+        if key is None:
+            return False
+        data = self.get(model.__class__, [key]).get(key)
+        if data is None:
+            self.misses += 1
+            return False
+        self.hits += 1
+        model.data = data
+        model.loaded = True
+        return True
+
+    def save(self, model):
+        """ Stores the model's data, if they are of an item (lists are stored by save_all()). """
+        if isinstance(model.data, (dict, SlottedData)) and model.data:
+            self.put(model.__class__, model.data)
+
+    def load_all(self, models):
+        """
+        Loads the models from the store, with as few reads as possible.
+        Returns the list of the models which are not loaded (not found, stale, not storable).
+        """
+        missing, wanted = [], {}
+        for model in models:
+            if model.loaded:
+                continue
+            key = self.identify(model)
+            if key is None:
+                missing.append(model)
+            else:
+                wanted.setdefault((model.__class__, key), []).append(model)
+        by_class = {}
+        for model_class, key in wanted:
+            by_class.setdefault(model_class, []).append(key)
+        for model_class, keys in by_class.items():
+            found = self.get(model_class, keys)
+            for key in keys:
+                for model in wanted[(model_class, key)]:
+                    if key in found:
+                        model.data = found[key]
+                        model.loaded = True
+                        self.hits += 1
+                    else:
+                        missing.append(model)
+                        self.misses += 1
+        return missing
+
+    def save_all(self, lists):
+        """
+        Stores all the items of the lists (e.g., timelines) or of the sequences of items.
+        The list models are not loaded by this; only their data already loaded are stored.
+        """
+        with self.lock:
+            for items in lists:
+                if isinstance(items, List):
+                    items = [items.make_item(data) for data in items.data or []]
+                for item in items:
+                    if item.data:
+                        self.put(item.__class__, item.data)
+
+    #
+    # Backend.
+    #
+
+    def read(self, keys):
+        """ Returns {key: (stored_at, encoded data)} for the keys found on disk. """
+        raise NotImplemented()
+
+    def write(self, records):
+        """ Writes [(key, (stored_at, encoded data))] in one transaction. """
+        raise NotImplemented()
+
+    def close(self):
+        raise NotImplemented()
+
+
+class SqliteStore(Store):
+    """
+    Store in a sqlite database file, in write-ahead log mode. Safe for threads.
+    """
+
+    def __init__(self, path, **kwargs):
+        super(SqliteStore, self).__init__(**kwargs)
+        import sqlite3
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS models (key TEXT PRIMARY KEY, stored_at REAL, data BLOB)')
+
+    def read(self, keys):
+        result = {}
+        for i in range(0, len(keys), 500): # sqlite limits the number of the query parameters.
+            chunk = keys[i:i+500]
+            rows = self.connection.execute('SELECT key, stored_at, data FROM models WHERE key IN (%s)' % ','.join('?' * len(chunk)), chunk)
+            result.update([(key, (stored_at, str(data))) for key, stored_at, data in rows])
+        return result
+
+    def write(self, records):
+        import sqlite3
+        self.connection.execute('BEGIN')
+        try:
+            self.connection.executemany('INSERT OR REPLACE INTO models (key, stored_at, data) VALUES (?, ?, ?)',
+                                        [(key, stored_at, sqlite3.Binary(data)) for key, (stored_at, data) in records])
+        except:
+            self.connection.execute('ROLLBACK')
+            raise
+        self.connection.execute('COMMIT')
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+
+class DbmStore(Store):
+    """
+    Store in a dbm file (of whatever dbm module is available). Safe for threads.
+    """
+
+    HEADER = struct.Struct('!d') # stored_at before the encoded data.
+
+    def __init__(self, path, **kwargs):
+        super(DbmStore, self).__init__(**kwargs)
+        import anydbm
+        self.db = anydbm.open(path, 'c')
+
+    def read(self, keys):
+        result = {}
+        for key in keys:
+            try:
+                value = self.db[key.encode('utf-8')]
+            except KeyError:
+                continue
+            result[key] = (self.HEADER.unpack_from(value)[0], value[self.HEADER.size:])
+        return result
+
+    def write(self, records):
+        for key, (stored_at, data) in records:
+            self.db[key.encode('utf-8')] = self.HEADER.pack(stored_at) + data
+        if hasattr(self.db, 'sync'):
+            self.db.sync()
+
+    def close(self):
+        self.flush()
+        self.db.close()
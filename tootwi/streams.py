@@ -1,19 +1,66 @@
 # coding: utf-8
 
+import time
+from .formats import PrefilteredFormat
+from .predicates import Custom, All
+from .instruments import operation_of, FACTORY
+
 class Stream(object):
+    """
+    Base class for all streams. Iterating over a stream connects to it, and
+    yields the items made by the factory from each message (or the decoded data
+    as is, if there is no factory). Keep-alives and the messages for which the
+    factory returns None are skipped.
+
+    If a prefilter is given (see tootwi.predicates), only the messages which
+    match it are decoded and made items; all others are skipped as early as
+    possible, i.e. by their raw lines.
+    """
+
     OPEN_OPERATION = None
     
-    def __init__(self, api, factory=None, **kwargs):
+    def __init__(self, api, factory=None, prefilter=None, **kwargs):
         super(Stream, self).__init__()
         self.api = api
         self.factory = factory
+        self.prefilter = prefilter
         self.params = kwargs
 
+    def get_operation(self):
+        """
+        Returns the operation to open the stream with. If the stream has a prefilter,
+        or the factory can tell unwanted messages by their raw lines (i.e., has
+        prefilter() method), the format of the operation is wrapped so that such
+        lines are skipped before they are decoded, as if they were keep-alives.
+        """
+        predicates = []
+        if getattr(self.factory, 'prefilter', None) is not None:
+            predicates.append(Custom(self.factory.prefilter))
+        if self.prefilter is not None:
+            predicates.append(self.prefilter)
+
+        operation = self.OPEN_OPERATION
+        if predicates:
+            format = operation[2] if len(operation) > 2 else None
+            predicate = predicates[0] if len(predicates) == 1 else All(predicates)
+            operation = tuple(operation[:2]) + (PrefilteredFormat(predicate, format),)
+        return operation
+
     def __iter__(self):
-        for data in self.api.flow(self.OPEN_OPERATION, self.params):
-            item = self.factory(self.api, data) if self.factory is not None else data
-            if item is not None:
-                yield item
+        instrument = self.api.api.instrument
+        if instrument is None or self.factory is None:
+            for data in self.api.flow(self.get_operation(), self.params):
+                item = self.factory(self.api, data) if self.factory is not None else data
+                if item is not None:
+                    yield item
+        else:
+            operation = operation_of(self.api.api.invoke(self.get_operation(), self.params))
+            for data in self.api.flow(self.get_operation(), self.params):
+                started = time.time()
+                item = self.factory(self.api, data)
+                instrument.observe(FACTORY, operation, time.time() - started)
+                if item is not None:
+                    yield item
 
     def make_item(self, data):
         """
@@ -27,36 +74,40 @@ class Stream(object):
 
 class SampleStream(Stream):
     OPEN_OPERATION = ('GET' , 'http://stream.twitter.com/1/statuses/sample')
-    def __init__(self, api, factory=None):
-        super(SampleStream, self).__init__(api, factory)
+    def __init__(self, api, factory=None, prefilter=None):
+        super(SampleStream, self).__init__(api, factory, prefilter)
 
 class FilterStream(Stream):
     OPEN_OPERATION = ('POST', 'http://stream.twitter.com/1/statuses/filter')
-    def __init__(self, api, factory=None, follow=None):
+    def __init__(self, api, factory=None, follow=None, track=None, prefilter=None):
         if not isinstance(follow, basestring):
             follow = list(follow) if follow is not None else []
             follow = ','.join([unicode(v) for v in follow])
-        super(FilterStream, self).__init__(api, factory, follow=follow)
+        if track is not None and not isinstance(track, basestring):
+            track = ','.join([unicode(v) for v in track]) or None
+        if not follow and track:
+            follow = None # do not send an empty follow list when tracking terms only.
+        super(FilterStream, self).__init__(api, factory, prefilter, follow=follow, track=track)
 
 class FirehoseStream(Stream):
     OPEN_OPERATION = ('GET' , 'http://stream.twitter.com/1/statuses/firehose')
-    def __init__(self, api, factory=None):
-        super(FirehoseStream, self).__init__(api, factory)
+    def __init__(self, api, factory=None, prefilter=None):
+        super(FirehoseStream, self).__init__(api, factory, prefilter)
 
 class LinksStream(Stream):
     OPEN_OPERATION = ('GET' , 'http://stream.twitter.com/1/statuses/links')
-    def __init__(self, api, factory=None):
-        super(LinksStream, self).__init__(api, factory)
+    def __init__(self, api, factory=None, prefilter=None):
+        super(LinksStream, self).__init__(api, factory, prefilter)
 
 class RetweetStream(Stream):
     OPEN_OPERATION = ('GET' , 'http://stream.twitter.com/1/statuses/retweet')
-    def __init__(self, api, factory=None):
-        super(RetweetStream, self).__init__(api, factory)
+    def __init__(self, api, factory=None, prefilter=None):
+        super(RetweetStream, self).__init__(api, factory, prefilter)
 
 class UserStream(Stream):
     OPEN_OPERATION = ('POST', 'https://userstream.twitter.com/2/user')
-    def __init__(self, api, factory=None):
-        super(UserStream, self).__init__(api, factory)
+    def __init__(self, api, factory=None, prefilter=None):
+        super(UserStream, self).__init__(api, factory, prefilter)
 
 
 
@@ -64,6 +115,19 @@ class UserStream(Stream):
 #!!! but we are lazy to import each message class in separate module :-)
 from .models import Item, Status
 class MessageFactory(object):
+    """
+    Makes items of the stream messages. In projection mode, only the fields
+    declared in the items' FIELDS are kept (optionally in slots); see Item.project().
+    """
+
+    def __init__(self, project=False, slots=False):
+        super(MessageFactory, self).__init__()
+        self.project = project
+        self.slots = slots
+
+    def make(self, cls, api, data):
+        return cls(api, cls.project(data, self.slots) if self.project else data)
+
     def __call__(self, api, data):
         """
         Attempts to recognize the message by its data and instantiate it as of appropriate class.
@@ -79,11 +143,121 @@ class MessageFactory(object):
         #elif 'friends' in data: # guess if this is a friend list
         #   return Friends(data)
         elif 'text' in data: # guess if this is a new status update
-            return Status(api, data)
+            return self.make(Status, api, data)
         else:
-            return Unknown(api, data)
+            return self.make(Unknown, api, data)
+
+class TypedMessageFactory(MessageFactory):
+    """
+    Recognizes all kinds of stream messages by the presence of their top-level keys,
+    checked in the order of DISPATCH table (the first matching key wins), and makes
+    them instances of the corresponding classes. Messages with no known keys are Unknown.
+
+    If a list of accepted classes is given, all other messages are dropped; and most
+    of them are dropped even before they are decoded, since the factory can recognize
+    them by a cheap scan of their raw lines (see classify()), and streams use it.
+    """
+
+    DISPATCH = [
+        ('delete', 'Delete'),
+        ('scrub_geo', 'ScrubGeo'),
+        ('limit', 'Limit'),
+        ('friends', 'Friends'),
+        ('event', 'Event'),
+        ('direct_message', 'DirectMessage'),
+        ('warning', 'StallWarning'),
+        ('text', 'Status'),
+    ]
+
+    # Wrapper messages have their key at the very beginning of the line;
+    # events have it somewhere in the middle; statuses can not be told fast.
+    PREFIX_KEYS = ['delete', 'scrub_geo', 'limit', 'friends', 'direct_message', 'warning']
+    INFIX_KEYS = ['event']
+
+    def __init__(self, accept=None, project=False, slots=False):
+        super(TypedMessageFactory, self).__init__(project, slots)
+        self.accept = tuple(accept) if accept is not None else None
+        namespace = globals()
+        self.dispatch = [(key, namespace[name]) for key, name in self.DISPATCH]
+        self.classes = dict(self.dispatch)
+        self.prefixes = [('{"%s":' % key, self.classes[key]) for key in self.PREFIX_KEYS]
+        self.infixes = [('"%s":' % key, self.classes[key]) for key in self.INFIX_KEYS]
+
+    def __call__(self, api, data):
+        if data is None:
+            return None # will be ignored by API.flow()
+        cls = Unknown
+        if isinstance(data, dict):
+            for key, candidate in self.dispatch:
+                if key in data:
+                    cls = candidate
+                    break
+        if self.accept is not None and not issubclass(cls, self.accept):
+            return None
+        return self.make(cls, api, data)
+
+    def classify(self, line):
+        """
+        Guesses the class of a message by its raw (not decoded) line, with no
+        decoding. Returns None if the class can not be guessed this way (then
+        the line must be decoded and recognized by its keys as usually).
+        """
+        line = line.lstrip()
+        for prefix, cls in self.prefixes:
+            if line.startswith(prefix):
+                return cls
+        for infix, cls in self.infixes:
+            if infix in line: # quotes inside the texts are escaped, so they never match.
+                return cls
+        return None
+
+    def prefilter(self, line):
+        """
+        Tells whether the raw line is worth decoding, i.e. whether it can be
+        a message of one of the accepted classes. Unknown lines are decoded.
+        """
+        if self.accept is None:
+            return True
+        cls = self.classify(line)
+        return cls is None or issubclass(cls, self.accept)
+
+
+class Message(Item):
+    """
+    Base class for stream messages, which are not models on their own
+    (unlike statuses). Provides dict-like access to the message data.
+    """
+    pass
+
+class Delete(Message):
+    """ Status deletion notice: {"delete": {"status": {"id": ..., "user_id": ...}}} """
+    pass
+
+class ScrubGeo(Message):
+    """ Location deletion notice: {"scrub_geo": {"user_id": ..., "up_to_status_id": ...}} """
+    pass
+
+class Limit(Message):
+    """ Limit notice, i.e. how many statuses were not delivered: {"limit": {"track": ...}} """
+    pass
+
+class Friends(Message):
+    """ List of friends' ids sent at the beginning of user streams: {"friends": [...]} """
+    pass
+
+class Event(Message):
+    """ User stream event: {"event": "favorite", "source": {...}, "target": {...}, ...} """
+    pass
+
+class DirectMessage(Message):
+    """ Direct message sent or received in user streams: {"direct_message": {...}} """
+    pass
+
+class StallWarning(Message):
+    """ Warning on a slow consumer, which can be disconnected soon: {"warning": {...}} """
+    pass
 
-class Unknown(Item):
+class Unknown(Message):
     """
     Used in factory for messages, which can not be recognized to their specific classes.
     Developers can still access all data and fields as usually with no additionla features.
@@ -0,0 +1,167 @@
+# coding: utf-8
+"""
+Syncers keep local copies of the timelines up to date with as few requests as
+possible. Instead of loading the whole timeline again and again, a syncer keeps
+watermarks of what is already fetched, and asks only for newer statuses with
+since_id. If there are more new statuses than fit into one page, it pages back
+with max_id; if it runs out of its per-sync page budget before it reaches the
+watermark, the unfetched range is remembered as a gap, and is filled by the next
+syncs (newest gaps first) after they fetch the newest statuses.
+
+The fetched statuses are merged into a bounded buffer, newest first, with no
+duplicates; each sync returns only the statuses not seen before.
+
+Watermarks (the newest id and the gaps) are kept in a watermarks store, which is
+in memory by default; FileWatermarks persists them to a file, so the syncs are
+resumed after restarts with no re-downloading. One store can be shared by many
+syncers; each timeline is stored under its own key (its class and parameters).
+
+Usage example:
+    watermarks = FileWatermarks('/var/lib/timelines.json')
+    sync = TimelineSync(UserTimeline(credentials, screen_name='twitter'), watermarks)
+    while True:
+        for status in sync.sync():
+            process(status)
+        time.sleep(60)
+"""
+
+import os
+import json
+import time
+import threading
+
+
+class Watermarks(object):
+    """
+    In-memory store of the watermarks, by the timeline keys.
+    """
+
+    def __init__(self):
+        super(Watermarks, self).__init__()
+        self.lock = threading.Lock()
+        self.marks = {}
+
+    def get(self, key):
+        with self.lock:
+            return self.marks.get(key)
+
+    def set(self, key, marks):
+        with self.lock:
+            self.marks[key] = marks
+
+
+class FileWatermarks(Watermarks):
+    """
+    Store of the watermarks persisted to a JSON file. The file is rewritten
+    atomically no more often than once per save_interval seconds (zero for
+    every change); save() forces it, and should be called before the exit.
+    """
+
+    def __init__(self, path, save_interval=5.0):
+        super(FileWatermarks, self).__init__()
+        self.path = path
+        self.save_interval = save_interval
+        self.saved_at = 0
+        self.dirty = False
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                self.marks = json.load(f)
+
+    def set(self, key, marks):
+        super(FileWatermarks, self).set(key, marks)
+        self.dirty = True
+        if time.time() - self.saved_at >= self.save_interval:
+            self.save()
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            with open(self.path + '.tmp', 'wb') as f:
+                json.dump(self.marks, f)
+            os.rename(self.path + '.tmp', self.path)
+            self.dirty = False
+            self.saved_at = time.time()
+
+
+class TimelineSync(object):
+    """
+    Syncs one timeline. The timeline is a Statuses list model, which is used as
+    a template: its class and parameters are used for the fetches, its data are not.
+    The timeline class must accept since_id, max_id and count parameters.
+
+    Count is the page size; pages is the budget of requests per sync; size is the
+    number of statuses kept in the buffer; max_gaps is the number of gaps remembered
+    (the oldest ones are given up if there are more).
+    """
+
+    def __init__(self, timeline, watermarks=None, size=1000, count=200, pages=5, max_gaps=10):
+        super(TimelineSync, self).__init__()
+        self.timeline = timeline
+        self.watermarks = watermarks if watermarks is not None else Watermarks()
+        self.size = size
+        self.count = count
+        self.pages = pages
+        self.max_gaps = max_gaps
+        self.params = dict([(k, v) for k, v in timeline.params.items()
+                            if v is not None and k not in ('since_id', 'max_id', 'count')])
+        self.key = '%s?%s' % (timeline.__class__.__name__, '&'.join(['%s=%s' % kv for kv in sorted(self.params.items())]))
+        marks = self.watermarks.get(self.key) or {}
+        self.since_id = marks.get('since_id')
+        self.gaps = [tuple(gap) for gap in marks.get('gaps', [])] # (since_id, max_id) ranges, newest first.
+        self.buffer = [] # data of the statuses, newest first.
+        self.requests = 0
+
+    def fetch(self, since_id=None, max_id=None):
+        """ Fetches one page of the statuses with since_id < id <= max_id. """
+        params = dict(self.params, count=self.count, since_id=since_id, max_id=max_id)
+        self.requests += 1
+        return self.timeline.__class__(self.timeline.api, **params).load().data or []
+
+    def fetch_range(self, since_id, max_id, budget):
+        """
+        Pages back through the range while the pages are full and the budget allows.
+        Returns (statuses, pages used, the unfetched remainder of the range or None).
+        """
+        statuses, used = [], 0
+        while used < budget:
+            page = self.fetch(since_id, max_id)
+            used += 1
+            statuses.extend(page)
+            if len(page) < self.count or since_id is None: # the range is exhausted; or, the very first sync.
+                return statuses, used, None
+            max_id = min([status['id'] for status in page]) - 1
+        return statuses, used, (since_id, max_id)
+
+    def sync(self):
+        """
+        Fetches the new statuses and fills the gaps within the page budget.
+        Returns the items of the statuses not seen before, newest first.
+        """
+        budget = self.pages
+        fetched, used, gap = self.fetch_range(self.since_id, None, budget)
+        budget -= used
+        gaps = ([gap] if gap is not None else []) + self.gaps
+
+        while budget > 0 and gaps:
+            statuses, used, remainder = self.fetch_range(gaps[0][0], gaps[0][1], budget)
+            budget -= used
+            fetched.extend(statuses)
+            gaps[:1] = [remainder] if remainder is not None else []
+        self.gaps = gaps[:self.max_gaps]
+
+        if fetched:
+            self.since_id = max([self.since_id] + [status['id'] for status in fetched])
+        self.watermarks.set(self.key, dict(since_id=self.since_id, gaps=self.gaps))
+        return [self.timeline.make_item(status) for status in self.merge(fetched)]
+
+    def merge(self, statuses):
+        """ Adds the statuses to the buffer; returns the ones not seen before, newest first. """
+        seen = set([status['id'] for status in self.buffer])
+        fresh = {}
+        for status in statuses:
+            if status['id'] not in seen:
+                fresh[status['id']] = status
+        fresh = sorted(fresh.values(), key=lambda status: status['id'], reverse=True)
+        self.buffer = sorted(self.buffer + fresh, key=lambda status: status['id'], reverse=True)[:self.size]
+        return fresh
@@ -20,10 +20,15 @@ can be used in "&" and "|" bitwise operators to build the groups:
     throttler1 | throttler2 | throttler2 -- gives us "soonest" group.
 More complex formulas can be used if needed. Original throttlers are not modified
 and still can be used on their own, while being in one or more groups.
+
+Waits can be limited with a deadline (absolute time, as in time.time()): if the
+request cannot be performed before it, DeadlineExceededError is raised at once,
+with no sleeping, and the throttler is not touched (the request is not counted).
 """
 
 import time
 import datetime
+from .errors import DeadlineExceededError
 
 class Throttler(object):
     """
@@ -38,8 +43,10 @@ class Throttler(object):
     def __or__(self, other):
         return SoonestGroupThrottler([self, other])
 
-    def wait(self):
+    def wait(self, deadline=None):
         to_wait = self.check()
+        if deadline is not None and time.time() + to_wait > deadline:
+            raise DeadlineExceededError('Throttler would wait for %.3fs, which is past the deadline.' % to_wait)
         time.sleep(to_wait) # assuming that it is never negative and that zero time has no impact
         self.touch()
 
@@ -11,6 +11,13 @@ All derived connections must either inherit from Transport class, or at least
 implement its protocol. Protocol consists of the open(request) method on the main
 transport class, and read(), readline(), close() methods of returned file-like object.
 
+Transports should support the timeouts: connect_timeout for connecting and getting
+the response headers, and read_timeout for every read of the response (for streams,
+it is an idle timeout: the stream fails if nothing, not even keep-alives, is received
+for that long). The API can also pass the timeout for this very request as the second
+argument, open(request, timeout), when the call has a deadline; it limits both the
+connecting and the reading. Timeouts are raised as network errors (EnvironmentError).
+
 Request is a signed request object as created by credentials; it has read-only
 properties to use: method, url, headers, postdata. These properties must be passed
 to the remote side as is, with no modifications and extensions, since they are signed.
@@ -35,11 +42,13 @@ class TransportServerError(TransportError):
     """
     Transport works fine. Network works fine too.
     But server had failed, and gave us its HTTP status.
+    Headers (with lowercased names) are kept for the retriers (Retry-After, etc).
     """
-    def __init__(self, msg, code, text):
+    def __init__(self, msg, code, text, headers=None):
         super(TransportServerError, self).__init__(msg)
         self.code =     int(code if code else 0 )
         self.text = unicode(text if text else '').strip()
+        self.headers = dict([(k.lower(), v) for k, v in (headers or {}).items()])
 
 
 class File(object):
@@ -58,14 +67,14 @@ class File(object):
 class Transport(object):
     """
     Base transport class. Should never be instantiated directly.
-    Descendants must implement open(request) method and return
+    Descendants must implement open(request, timeout=None) method and return
     file-like object with the same protocol as in File class above.
     """
     def __init__(self):
         super(Transport, self).__init__()
         self.check() # raise if required libraries are not installed.
     
-    def __call__(self, request):
+    def __call__(self, request, timeout=None):
         raise NotImplemented()
     
     @classmethod
@@ -103,17 +112,22 @@ class urllibTransport(Transport):
                 import socket;
                 socket._fileobject.default_bufsize = self.old_default_bufsize
     
-    def __init__(self, bufsize=None):
+    def __init__(self, bufsize=None, connect_timeout=None, read_timeout=None):
         super(urllibTransport, self).__init__()
         self.bufsize = bufsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
     
-    def __call__(self, request):
+    def __call__(self, request, timeout=None):
         # On-demand import to avoid errors when this connection is not used.
         try:
             from urllib.request import Request, HTTPError, urlopen # python-3
         except ImportError:
             from urllib2 import Request, HTTPError, urlopen # python-2
         
+        connect_timeout = min([t for t in [self.connect_timeout, timeout] if t is not None] or [None])
+        read_timeout = min([t for t in [self.read_timeout, timeout] if t is not None] or [None])
+        
         with self.SocketBufSizeHack(self.bufsize):
             # HTTP method will be automatically choosen based on presence or absence of the postdata.
             # Errors are re-raised almost straightforwardly (urllib2 uses exceptions for HTTP codes).
@@ -121,20 +135,57 @@ class urllibTransport(Transport):
                 req = Request(request.url,
                     request.postdata if request.method=='POST' else None,
                     headers=request.headers)
-                handle = urlopen(req)
+                if connect_timeout is not None or read_timeout is not None:
+                    handle = self.opener(read_timeout).open(req, timeout=connect_timeout)
+                else:
+                    handle = urlopen(req)
             except HTTPError, e:
                 code = e.getcode()
                 text = e.read()
-                raise TransportServerError(unicode(e), code, text)
+                headers = dict(e.info().items()) if e.info() is not None else {}
+                raise TransportServerError(unicode(e), code, text, headers)
             ## It is not clear what to do with "external" errors. Now, we pass them by as-is.
             #except URLError, e:#??? Use just an EnvironmentError?
             #    raise TransportConnectionError(unicode(e))
             #except ValueError, e:
             #    # Happens when url is not an url (urllib2:244 in get_type()).
             #    raise TransportConnectionError(unicode(e))
-        
         return handle
     
+    def opener(self, read_timeout):
+        """
+        Returns the opener, whose connections switch their sockets from the connect
+        timeout (which urllib uses for all the operations) to the read timeout once
+        the response headers are received. The socket is given to the response
+        object when it is created, and the headers are read by its begin().
+        """
+        try:
+            from urllib.request import build_opener, HTTPHandler, HTTPSHandler # python-3
+        except ImportError:
+            from urllib2 import build_opener, HTTPHandler, HTTPSHandler # python-2
+        
+        def timed(connection_class):
+            class Response(connection_class.response_class):
+                def __init__(self, sock, *args, **kwargs):
+                    connection_class.response_class.__init__(self, sock, *args, **kwargs)
+                    self.timed_sock = sock
+                def begin(self):
+                    connection_class.response_class.begin(self)
+                    self.timed_sock.settimeout(read_timeout)
+            class Connection(connection_class):
+                response_class = Response
+            return Connection
+        
+        class TimedHTTPHandler(HTTPHandler):
+            def do_open(self, http_class, req, **kwargs):
+                return HTTPHandler.do_open(self, timed(http_class), req, **kwargs)
+        
+        class TimedHTTPSHandler(HTTPSHandler):
+            def do_open(self, http_class, req, **kwargs):
+                return HTTPSHandler.do_open(self, timed(http_class), req, **kwargs)
+        
+        return build_opener(TimedHTTPHandler(), TimedHTTPSHandler())
+    
     @classmethod
     def check(cls):
         try:
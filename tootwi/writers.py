@@ -0,0 +1,377 @@
+# coding: utf-8
+"""
+Writers decouple the callers from the latency of the writes to Twitter.
+A writer is assigned to the Status model class via its WRITER class field;
+then Status.update(), retweet() and destroy() do not call the API themselves,
+but submit write intents to the writer's queue, and return futures at once.
+
+The intents are applied by the background worker threads (one by default, so
+the writes are applied in the order they were submitted), with throttling and
+retries with exponential backoff. The result of the write (the decoded response)
+or its error is set to the future when the intent is applied or given up.
+
+If the writer has a journal file, the intents are appended to it (and synced to
+disk) before they are queued, and are marked done when applied. After a restart,
+the intents not applied before it are loaded from the journal, and can be replayed
+with replay(credentials); the credentials are not stored, since they are secrets.
+
+Writes must not be duplicated by the retries (or by the replays): a failed write
+could be performed by Twitter anyway (e.g., the connection was lost after the
+request was sent). Every intent has a key (random, or given by the caller), and:
+* the intents with the keys already applied or queued are not submitted again;
+* when a retry is refused by Twitter because the write is already performed
+  (duplicate status, already retweeted, already destroyed), this is a success.
+
+The applied keys are remembered within the dedup window only: no more than
+dedup_size last keys, and (if dedup_ttl is set) no older than dedup_ttl seconds.
+The journal is compacted to the pending intents and the remembered keys
+on recovery, and whenever it grows twice as large as that.
+
+Usage example:
+    writer = WriteBehindQueue('/var/lib/writes.jsonl', throttler=TimedThrottler(1))
+    writer.start()
+    writer.replay(credentials) # the intents left from the previous run, if any.
+    Status.WRITER = writer
+    future = Status(credentials, text='hello').update() # returns immediately.
+    ...
+    status = future.result(timeout=30)
+
+    future = Status(credentials, text='hello').update(key='greeting-1') # not repeated by the callers' retries.
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import threading
+import collections
+try:
+    import queue # python-3
+except ImportError:
+    import Queue as queue # python-2
+from .transports import TransportError
+from .errors import OperationNotFoundError, WriteTimeoutError, WriteQueueStoppedError
+
+
+# Kinds of the write intents.
+UPDATE, RETWEET, DESTROY = 'update', 'retweet', 'destroy'
+
+
+class WriteFuture(object):
+    """
+    The result of a write which is not applied yet. Callbacks are called
+    with the future when it is done (in the worker thread, or at once if done).
+    """
+
+    def __init__(self, key):
+        super(WriteFuture, self).__init__()
+        self.key = key
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.callbacks = []
+        self.value = None
+        self.error = None
+
+    def done(self):
+        return self.event.is_set()
+
+    def result(self, timeout=None):
+        """ Returns the result of the write, or raises its error. Blocks until it is done. """
+        if not self.event.wait(timeout):
+            raise WriteTimeoutError('Write %s is not applied in %s seconds.' % (self.key, timeout))
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    def exception(self, timeout=None):
+        if not self.event.wait(timeout):
+            raise WriteTimeoutError('Write %s is not applied in %s seconds.' % (self.key, timeout))
+        return self.error
+
+    def add_done_callback(self, fn):
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(fn)
+                return
+        fn(self)
+
+    def set_result(self, value):
+        self.finish(value, None)
+
+    def set_exception(self, error):
+        self.finish(None, error)
+
+    def finish(self, value, error):
+        with self.lock:
+            self.value, self.error = value, error
+            self.event.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for fn in callbacks:
+            fn(self)
+
+
+class WriteIntent(object):
+    """
+    One write to be applied: the operation with its parameters, and its key.
+    """
+
+    def __init__(self, key, kind, operation, params):
+        super(WriteIntent, self).__init__()
+        self.key = key
+        self.kind = kind
+        self.operation = tuple(operation)
+        self.params = dict(params)
+        self.credentials = None # not stored in the journal.
+        self.wrap = None # makes the result of the decoded response; not stored either.
+        self.future = WriteFuture(key)
+        self.attempts = 0
+
+    def to_dict(self):
+        return dict(key=self.key, kind=self.kind, operation=list(self.operation), params=self.params)
+
+
+class WriteBehindQueue(object):
+    """
+    Queue of the write intents with the background workers, as described above.
+    Attempts are the total number of attempts per intent; base and cap are
+    the backoff parameters (full jitter, as in tootwi.retriers); dedup_size and
+    dedup_ttl bound the window of the applied keys.
+    """
+
+    RETRY_STATUSES = (420, 429, 500, 502, 503, 504)
+
+    def __init__(self, path=None, workers=1, throttler=None, attempts=5, base=1.0, cap=60.0, dedup_size=10000, dedup_ttl=None):
+        super(WriteBehindQueue, self).__init__()
+        self.path = path
+        self.workers = workers
+        self.throttler = throttler
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.dedup_size = dedup_size
+        self.dedup_ttl = dedup_ttl
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.threads = []
+        self.running = False
+        self.queued = collections.OrderedDict() # {key: intent}, submitted but not applied yet.
+        self.applied = collections.OrderedDict() # {key: time applied} of the applied intents, oldest first.
+        self.recovered = [] # intents from the journal, not applied before the restart.
+        self.journal = None
+        self.records = 0 # in the journal.
+        if path is not None:
+            self.recover()
+
+    #
+    # Journal.
+    #
+
+    def recover(self):
+        """ Loads the journal, keeps only the unapplied intents and the dedup window, and compacts it. """
+        pending = collections.OrderedDict() # in the order of submission.
+        now = time.time()
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue # a torn last line after a crash.
+                    if record.get('done'):
+                        pending.pop(record['key'], None)
+                        if not record.get('failed'):
+                            self.remember(record['key'], record.get('at', now))
+                    else:
+                        pending[record['key']] = record
+        self.recovered = [WriteIntent(r['key'], r['kind'], r['operation'], r['params']) for r in pending.values()]
+        with self.lock:
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrites the journal with the remembered applied keys and the pending intents
+        (queued or recovered) only. Must be called with the lock held.
+        """
+        self.expire(time.time())
+        pending = collections.OrderedDict([(intent.key, intent) for intent in self.recovered + list(self.queued.values())])
+        with open(self.path + '.tmp', 'wb') as f:
+            for key, at in self.applied.items():
+                f.write(json.dumps(dict(key=key, done=True, at=at)) + '\n')
+            for intent in pending.values():
+                f.write(json.dumps(intent.to_dict()) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        if self.journal is not None:
+            self.journal.close()
+        os.rename(self.path + '.tmp', self.path)
+        self.journal = open(self.path, 'ab')
+        self.records = len(self.applied) + len(pending)
+
+    def record(self, record):
+        if self.journal is not None:
+            with self.lock:
+                self.journal.write(json.dumps(record) + '\n')
+                self.journal.flush()
+                os.fsync(self.journal.fileno())
+                self.records += 1
+                if self.records > 2 * max(self.dedup_size, len(self.applied) + len(self.queued) + len(self.recovered)):
+                    self.compact()
+
+    #
+    # Dedup window of the applied keys.
+    #
+
+    def remember(self, key, at):
+        self.applied.pop(key, None)
+        self.applied[key] = at
+        self.expire(time.time())
+
+    def expire(self, now):
+        """ Forgets the oldest applied keys beyond the dedup window. """
+        while self.applied and (len(self.applied) > self.dedup_size or
+                                self.dedup_ttl is not None and self.applied[next(iter(self.applied))] < now - self.dedup_ttl):
+            self.applied.popitem(last=False)
+
+    #
+    # Submission.
+    #
+
+    def submit(self, credentials, kind, operation, params, key=None, wrap=None):
+        """
+        Queues the write intent; returns its future. If an intent with the same key
+        is queued already, its future is returned; if it is applied already, the
+        returned future is done with None as the result (the write is not repeated).
+        Wrap, if specified, makes the result of the future from the decoded response.
+        """
+        if key is None:
+            key = uuid.uuid4().hex
+        with self.lock:
+            if key in self.queued:
+                return self.queued[key].future
+            self.expire(time.time())
+            if key in self.applied:
+                future = WriteFuture(key)
+                future.set_result(None)
+                return future
+            intent = self.queued[key] = WriteIntent(key, kind, operation, params)
+            intent.credentials = credentials
+            intent.wrap = wrap
+        self.record(intent.to_dict())
+        self.queue.put(intent)
+        return intent.future
+
+    def replay(self, credentials):
+        """ Queues the intents recovered from the journal on behalf of the credentials; returns their futures. """
+        futures = [self.submit(credentials, intent.kind, intent.operation, intent.params, intent.key) for intent in self.recovered]
+        self.recovered = [] # only now: the journal can be compacted in between, and they must stay in it.
+        return futures
+
+    # The same writes as in Status methods, but behind the queue.
+    # The status is changed the same way once the write is applied.
+
+    def update(self, status, key=None):
+        def wrap(data):
+            status.data = data
+            return status
+        return self.submit(status.api, UPDATE, status.UPDATE_OPERATION, dict(status=status['text']), key, wrap)
+
+    def retweet(self, status, key=None):
+        wrap = lambda data: status.__class__(status.api, data)
+        return self.submit(status.api, RETWEET, status.RETWEET_OPERATION, dict(id=status['id']), key, wrap)
+
+    def destroy(self, status, key=None):
+        def wrap(data):
+            status.data = None
+            return status
+        return self.submit(status.api, DESTROY, status.DESTROY_OPERATION, dict(id=status['id']), key, wrap)
+
+    #
+    # Execution.
+    #
+
+    def start(self):
+        self.running = True
+        self.threads = [threading.Thread(target=self.work) for i in range(self.workers)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def stop(self, wait=True):
+        """
+        Stops the workers after the intents queued so far are applied (if wait is true),
+        or at once; then the unapplied intents fail, and stay in the journal for replay.
+        """
+        if not wait:
+            self.running = False
+        for thread in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.running = False
+        while True:
+            try:
+                intent = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if intent is not None:
+                intent.future.set_exception(WriteQueueStoppedError('Write queue is stopped.'))
+
+    def work(self):
+        while True:
+            intent = self.queue.get()
+            if intent is None or not self.running:
+                if intent is not None:
+                    self.queue.put(intent) # leave it to stop().
+                return
+            self.apply(intent)
+
+    def apply(self, intent):
+        """ Performs the write with retries; sets the result or the error to its future. """
+        while True:
+            intent.attempts += 1
+            if self.throttler is not None:
+                self.throttler.wait()
+            try:
+                value = intent.credentials.call(intent.operation, intent.params)
+                break
+            except Exception, e:
+                if intent.attempts > 1 and self.already_done(intent, e):
+                    value = None
+                    break
+                if intent.attempts >= self.attempts or not self.retriable(e):
+                    with self.lock:
+                        del self.queued[intent.key]
+                    self.record(dict(key=intent.key, done=True, failed=True)) # given up; it must not be replayed.
+                    intent.future.set_exception(e)
+                    return
+                time.sleep(random.uniform(0, min(self.cap, self.base * 2 ** (intent.attempts - 1))))
+        at = time.time()
+        with self.lock:
+            del self.queued[intent.key]
+            self.remember(intent.key, at)
+        self.record(dict(key=intent.key, done=True, at=at))
+        if intent.wrap is not None and value is not None:
+            value = intent.wrap(value)
+        intent.future.set_result(value)
+
+    def retriable(self, error):
+        if isinstance(error, TransportError):
+            return getattr(error, 'code', None) in self.RETRY_STATUSES
+        return isinstance(error, EnvironmentError)
+
+    def already_done(self, intent, error):
+        """
+        Whether the retry is refused because the previous attempt has been performed.
+        Twitter refuses duplicate statuses and repeated retweets with 403, and
+        the destroyed statuses are not found anymore.
+        """
+        text = (getattr(error, 'text', None) or unicode(error)).lower()
+        code = getattr(error, 'code', None)
+        if intent.kind == UPDATE:
+            return code == 403 and 'duplicate' in text
+        elif intent.kind == RETWEET:
+            return code == 403 and 'already' in text
+        elif intent.kind == DESTROY:
+            return code == 404 or isinstance(error, OperationNotFoundError)
+        return False